@@ -1,2 +1,601 @@
 # UUID: b1feb2b6-6be7-46c6-afba-a7e87e6cd023
+# api/blockchain_operations.py
 
+"""
+Peer-to-peer networking for blockchain nodes.
+
+Nodes exchange length-prefixed frames over TCP and gossip transactions and
+blocks in two steps: an item is first announced by hash in an inventory
+message, and a peer that does not have it yet asks for the data. Each peer
+remembers which items the other side already knows, so data is only sent to
+peers that asked for it and announcements are not repeated.
+
+Every peer has its own bounded outbox and writer task. A peer that reads
+slowly therefore only stalls its own connection: data responses wait for
+room in its outbox, which in turn stops reading its requests, and pending
+announcements to it are coalesced and capped instead of queuing up without
+bound.
+"""
+
+import asyncio
+import random
+import struct
+import threading
+from collections import OrderedDict
+from time import monotonic, time
+from blockchain.chain import HEADER_NONCE, HEADER_PREFIX, Block, Blockchain, Transaction
+from blockchain.encoding import BLOCK_HEADER, EncodingError, decode_transaction, encode_transaction
+from blockchain.mempool import transaction_id
+from blockchain.quantum_security import QuantumSecurity
+from blockchain.storage import MemoryBlockStore
+from blockchain.validation import validate_blocks, verify_signed_transaction
+
+# Frame header: payload length, message type
+FRAME_HEADER = struct.Struct(">IB")
+# Inventory entry: item kind, item hash
+INVENTORY_ITEM = struct.Struct(">B32s")
+MAX_FRAME_BYTES = 8 * 1024 * 1024
+MAX_INVENTORY_PER_MESSAGE = 1000
+
+MSG_INV = 1
+MSG_GETDATA = 2
+MSG_TX = 3
+MSG_BLOCK = 4
+MSG_GETHEADERS = 5
+MSG_HEADERS = 6
+
+# Header request: first height, maximum number of headers
+HEADERS_REQUEST = struct.Struct(">QI")
+# Header response: height of the first header, followed by 80-byte headers
+HEADERS_START = struct.Struct(">Q")
+HEADER_SIZE = HEADER_PREFIX.size + HEADER_NONCE.size
+MAX_HEADERS_PER_MESSAGE = 2000
+
+INV_TX = 1
+INV_BLOCK = 2
+
+class ProtocolError(Exception):
+    """Raised when a peer sends a malformed or oversized message."""
+    pass
+
+def encode_inventory(items):
+    return b"".join(INVENTORY_ITEM.pack(kind, item_hash) for kind, item_hash in items)
+
+def decode_inventory(payload):
+    if len(payload) % INVENTORY_ITEM.size:
+        raise ProtocolError("Inventory payload has a partial entry.")
+    return list(INVENTORY_ITEM.iter_unpack(payload))
+
+class RecentSet:
+    """
+    Set that forgets its oldest members beyond maxsize.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        self._items[item] = None
+        self._items.move_to_end(item)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+class Peer:
+    """
+    One connection to a remote node.
+
+    Data frames go through a bounded outbox; send() waits while it is full.
+    Announcements are kept apart, deduplicated against what the peer already
+    knows, and batched into inventory messages by the writer; beyond
+    max_inventory pending announcements the oldest ones are dropped.
+    """
+
+    def __init__(self, node, reader, writer, max_outbox=256, max_inventory=50000, max_known=100000):
+        self.node = node
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info("peername")
+        self.known = RecentSet(max_known)
+        self.max_inventory = max_inventory
+        self.dropped_announcements = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._outbox = asyncio.Queue(max_outbox)
+        self._inventory = OrderedDict()
+        self._wakeup = asyncio.Event()
+
+    def announce(self, item):
+        """
+        Schedules an inventory announcement unless the peer already knows the item.
+        """
+        if item in self.known or item in self._inventory:
+            return
+        if len(self._inventory) >= self.max_inventory:
+            self._inventory.popitem(last=False)
+            self.dropped_announcements += 1
+        self._inventory[item] = None
+        self._wakeup.set()
+
+    async def send(self, message_type, payload):
+        """
+        Queues a frame for the peer, waiting while its outbox is full.
+        """
+        if len(payload) > MAX_FRAME_BYTES:
+            raise ProtocolError("Message exceeds the frame size limit.")
+        await self._outbox.put(FRAME_HEADER.pack(len(payload), message_type) + payload)
+        self._wakeup.set()
+
+    async def _write_frame(self, frame):
+        self.writer.write(frame)
+        self.bytes_sent += len(frame)
+        await self.writer.drain()
+
+    async def _write_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while not self._outbox.empty():
+                await self._write_frame(self._outbox.get_nowait())
+            if self._inventory:
+                items = []
+                while self._inventory and len(items) < MAX_INVENTORY_PER_MESSAGE:
+                    item, _ = self._inventory.popitem(last=False)
+                    if item not in self.known:
+                        self.known.add(item)
+                        items.append(item)
+                if items:
+                    payload = encode_inventory(items)
+                    await self._write_frame(FRAME_HEADER.pack(len(payload), MSG_INV) + payload)
+                if self._inventory:
+                    self._wakeup.set()
+
+    async def _read_loop(self):
+        while True:
+            length, message_type = FRAME_HEADER.unpack(await self.reader.readexactly(FRAME_HEADER.size))
+            if length > MAX_FRAME_BYTES:
+                raise ProtocolError("Message exceeds the frame size limit.")
+            payload = await self.reader.readexactly(length)
+            self.bytes_received += FRAME_HEADER.size + length
+            await self.node.handle_message(self, message_type, payload)
+
+    async def run(self):
+        writer_task = asyncio.create_task(self._write_loop())
+        try:
+            await self._read_loop()
+        except (asyncio.IncompleteReadError, ConnectionError, ProtocolError, EncodingError):
+            pass
+        finally:
+            writer_task.cancel()
+            self.writer.close()
+
+class Node:
+    """
+    asyncio service that connects a Blockchain to its peers.
+
+    Received transactions are admitted to the mempool only with a valid
+    signature. Received blocks have their seal and transaction signatures
+    checked on the default executor, off the event loop, and then go to the
+    Blockchain, which extends its tip or keeps them as a side branch and
+    reorganises to the heavier branch; blocks whose parent is not known yet
+    are kept as orphans until it arrives, at most max_orphans of them, the
+    oldest being dropped first. Accepted items are announced to every other
+    peer.
+    publish_transaction() and publish_block() may be called from any thread.
+
+    The node changes the blockchain under self.lock; a MiningManager started
+    by a QuantumMiner for this node shares that lock.
+    """
+
+    request_timeout = 5.0  # seconds before an unanswered request can go to another peer
+
+    def __init__(self, blockchain, host="127.0.0.1", port=0, max_peers=128, max_outbox=256,
+                 max_inventory=50000, max_orphans=1024, max_received=200000):
+        self.blockchain = blockchain
+        self.host = host
+        self.port = port
+        self.max_peers = max_peers
+        self.max_outbox = max_outbox
+        self.max_inventory = max_inventory
+        self.max_orphans = max_orphans
+        self.max_received = max_received
+        self.lock = threading.RLock()
+        self.peers = set()
+        self.received_at = OrderedDict()  # item -> monotonic time it was accepted, the newest max_received
+        self.messages_received = {MSG_INV: 0, MSG_GETDATA: 0, MSG_TX: 0, MSG_BLOCK: 0,
+                                  MSG_GETHEADERS: 0, MSG_HEADERS: 0}
+        self.sync_session = None  # ChainSync in progress, which claims the blocks it requested
+        self._header_requests = {}  # peer -> future for its next headers response
+        self._seen = RecentSet(200000)
+        self._requested = {}  # item -> (peer, time requested)
+        self._orphans = OrderedDict()  # block hash -> orphan block, oldest first
+        self._orphans_by_parent = {}  # previous hash -> [orphan block hashes]
+        self._server = None
+        self._loop = None
+        self._tasks = set()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._accept, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def connect(self, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return self._add_peer(reader, writer)
+
+    async def _accept(self, reader, writer):
+        if len(self.peers) >= self.max_peers:
+            writer.close()
+            return
+        self._add_peer(reader, writer)
+
+    def _add_peer(self, reader, writer):
+        peer = Peer(self, reader, writer, self.max_outbox, self.max_inventory)
+        self.peers.add(peer)
+        task = asyncio.create_task(peer.run())
+        self._tasks.add(task)
+
+        def finished(task):
+            self._tasks.discard(task)
+            self.peers.discard(peer)
+            for item in [item for item, (owner, _) in self._requested.items() if owner is peer]:
+                del self._requested[item]
+            request = self._header_requests.pop(peer, None)
+            if request is not None and not request.done():
+                request.set_exception(ConnectionError("Peer disconnected."))
+            if self.sync_session is not None:
+                self.sync_session.peer_lost(peer)
+
+        task.add_done_callback(finished)
+        return peer
+
+    def has_item(self, item):
+        kind, item_hash = item
+        if item in self._seen:
+            return True
+        if kind == INV_BLOCK:
+            return item_hash.hex() in self.blockchain.block_tree
+        return item_hash.hex() in self.blockchain.mempool
+
+    def record_item(self, item):
+        """
+        Marks an inventory item as known, e.g. a block connected by a sync,
+        so it is neither requested nor relayed again.
+        """
+        self._seen.add(item)
+        if item not in self.received_at:
+            self.received_at[item] = monotonic()
+            if len(self.received_at) > self.max_received:
+                self.received_at.popitem(last=False)
+
+    def _relay(self, item, source=None):
+        for peer in self.peers:
+            if peer is not source:
+                peer.announce(item)
+
+    def _in_loop(self, callback, *args):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    def publish_transaction(self, transaction):
+        """
+        Announces a transaction that is already in the local mempool.
+        """
+        if not isinstance(transaction, dict):
+            transaction = transaction.to_dict()
+        item = (INV_TX, bytes.fromhex(transaction_id(transaction)))
+        self._in_loop(self._publish, item)
+
+    def publish_block(self, block):
+        """
+        Announces a block that is already in the local chain.
+        """
+        self._in_loop(self._publish, (INV_BLOCK, bytes.fromhex(block.hash)))
+
+    def _publish(self, item):
+        self.record_item(item)
+        self._relay(item)
+
+    async def handle_message(self, peer, message_type, payload):
+        handler = {MSG_INV: self._on_inventory, MSG_GETDATA: self._on_getdata,
+                   MSG_TX: self._on_transaction, MSG_BLOCK: self._on_block,
+                   MSG_GETHEADERS: self._on_getheaders, MSG_HEADERS: self._on_headers}.get(message_type)
+        if handler is None:
+            raise ProtocolError(f"Unknown message type {message_type}.")
+        self.messages_received[message_type] += 1
+        await handler(peer, payload)
+
+    async def _on_inventory(self, peer, payload):
+        now = monotonic()
+        wanted = []
+        for item in decode_inventory(payload):
+            peer.known.add(item)
+            if self.has_item(item):
+                continue
+            requested = self._requested.get(item)
+            if requested is not None and now - requested[1] < self.request_timeout:
+                continue
+            self._requested[item] = (peer, now)
+            wanted.append(item)
+        if wanted:
+            await peer.send(MSG_GETDATA, encode_inventory(wanted))
+
+    async def _on_getdata(self, peer, payload):
+        for kind, item_hash in decode_inventory(payload):
+            if kind == INV_TX:
+                transaction = self.blockchain.mempool.get(item_hash.hex())
+                if transaction is not None:
+                    await peer.send(MSG_TX, encode_transaction(transaction))
+            elif kind == INV_BLOCK:
+                block = self.blockchain.get_block_by_hash(item_hash.hex())
+                if block is not None:
+                    await peer.send(MSG_BLOCK, block.to_bytes())
+
+    async def _on_transaction(self, peer, payload):
+        transaction, end = decode_transaction(payload)
+        if end != len(payload):
+            raise ProtocolError("Trailing bytes after transaction.")
+        item = (INV_TX, bytes.fromhex(transaction_id(transaction)))
+        peer.known.add(item)
+        self._requested.pop(item, None)
+        if self.has_item(item):
+            return
+        self._seen.add(item)
+        if not verify_signed_transaction(transaction):
+            return
+        with self.lock:
+            admitted = self.blockchain.mempool.add(transaction)
+        if admitted:
+            self.record_item(item)
+            self._relay(item, peer)
+
+    async def request_headers(self, peer, start, count=MAX_HEADERS_PER_MESSAGE):
+        """
+        Asks a peer for up to count headers from height start and returns
+        them as a list of 80-byte headers.
+        """
+        request = self._loop.create_future()
+        self._header_requests[peer] = request
+        await peer.send(MSG_GETHEADERS, HEADERS_REQUEST.pack(start, count))
+        payload = await request
+        if len(payload) < HEADERS_START.size or (len(payload) - HEADERS_START.size) % HEADER_SIZE:
+            raise ProtocolError("Malformed headers response.")
+        if HEADERS_START.unpack_from(payload)[0] != start:
+            raise ProtocolError("Headers response does not start at the requested height.")
+        return [payload[offset:offset + HEADER_SIZE]
+                for offset in range(HEADERS_START.size, len(payload), HEADER_SIZE)]
+
+    async def _on_getheaders(self, peer, payload):
+        try:
+            start, count = HEADERS_REQUEST.unpack(payload)
+        except struct.error:
+            raise ProtocolError("Malformed headers request.")
+        stop = min(start + min(count, MAX_HEADERS_PER_MESSAGE), len(self.blockchain.chain))
+        headers = [self.blockchain.chain[height].header() for height in range(start, stop)]
+        await peer.send(MSG_HEADERS, HEADERS_START.pack(start) + b"".join(headers))
+
+    async def _on_headers(self, peer, payload):
+        request = self._header_requests.pop(peer, None)
+        if request is not None and not request.done():
+            request.set_result(payload)
+
+    async def _on_block(self, peer, payload):
+        if self.sync_session is not None:
+            try:
+                block_hash = BLOCK_HEADER.unpack_from(payload)[2]
+            except struct.error:
+                raise ProtocolError("Truncated block.")
+            if self.sync_session.deliver(peer, block_hash, payload):
+                return
+        block = Block.from_bytes(payload)
+        item = (INV_BLOCK, bytes.fromhex(block.hash))
+        peer.known.add(item)
+        self._requested.pop(item, None)
+        if self.has_item(item):
+            return
+        self._seen.add(item)
+        results = await asyncio.get_running_loop().run_in_executor(
+            None, validate_blocks, [bytes(payload)], self.blockchain.consensus)
+        if results[0][3] is not None:
+            return
+        if block.previous_hash not in self.blockchain.block_tree:
+            self._add_orphan(block)
+            return
+        self._connect_block(block, peer)
+
+    def _add_orphan(self, block):
+        if block.hash in self._orphans:
+            return
+        if len(self._orphans) >= self.max_orphans:
+            _, oldest = self._orphans.popitem(last=False)
+            siblings = self._orphans_by_parent[oldest.previous_hash]
+            siblings.remove(oldest.hash)
+            if not siblings:
+                del self._orphans_by_parent[oldest.previous_hash]
+        self._orphans[block.hash] = block
+        self._orphans_by_parent.setdefault(block.previous_hash, []).append(block.hash)
+
+    def _connect_block(self, block, source=None):
+        """
+        Adds a block whose parent is known, then any orphans waiting on it.
+        """
+        pending = [(block, source)]
+        while pending:
+            block, source = pending.pop()
+            item = (INV_BLOCK, bytes.fromhex(block.hash))
+            self._seen.add(item)
+            with self.lock:
+                if not self.blockchain.add_block(block, block.hash):
+                    continue
+                if self.blockchain.block_tree.get(block.hash).active:
+                    self.blockchain.mempool.remove(block.transactions)
+            self.record_item(item)
+            self._relay(item, source)
+            pending.extend((self._orphans.pop(orphan_hash), None)
+                           for orphan_hash in self._orphans_by_parent.pop(block.hash, []))
+
+class PropagationReport:
+    def __init__(self, items, nodes, elapsed, latencies):
+        self.items = items
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.latencies = latencies  # seconds from publication to arrival, per item and node
+
+    @property
+    def mean_latency(self):
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    @property
+    def max_latency(self):
+        return max(self.latencies, default=0.0)
+
+    @property
+    def throughput(self):
+        """
+        Items delivered to a node per second, over all receiving nodes.
+        """
+        return len(self.latencies) / self.elapsed if self.elapsed else 0.0
+
+class LocalNetwork:
+    """
+    Harness that runs size nodes on localhost, each with its own Blockchain
+    sharing one genesis block. Nodes form a ring plus random extra links so
+    that every node has about degree peers.
+    """
+
+    def __init__(self, size, degree=3, seed=0, **node_options):
+        self.size = size
+        self.degree = degree
+        self.seed = seed
+        self.node_options = node_options
+        self.nodes = []
+
+    async def start(self):
+        genesis = Block(0, [], time(), "0")
+        for _ in range(self.size):
+            store = MemoryBlockStore()
+            store.append(genesis)
+            node = Node(Blockchain(mining_workers=1, store=store), **self.node_options)
+            self.nodes.append(await node.start())
+
+        links = {(i, (i + 1) % self.size) for i in range(self.size)} if self.size > 1 else set()
+        rng = random.Random(self.seed)
+        target = self.size * self.degree // 2
+        candidates = [(i, j) for i in range(self.size) for j in range(i + 1, self.size)]
+        rng.shuffle(candidates)
+        for i, j in candidates:
+            if len(links) >= target:
+                break
+            if (j, i) not in links:
+                links.add((i, j))
+        for i, j in links:
+            await self.nodes[i].connect(self.nodes[j].host, self.nodes[j].port)
+        await self.wait_for(lambda: all(node.peers for node in self.nodes))
+        return self
+
+    async def stop(self):
+        for node in self.nodes:
+            await node.stop()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def wait_for(self, condition, timeout=30.0, interval=0.005):
+        deadline = monotonic() + timeout
+        while not condition():
+            if monotonic() > deadline:
+                raise TimeoutError("Network did not converge in time.")
+            await asyncio.sleep(interval)
+
+    def _report(self, items, published_at, started):
+        receivers = self.nodes[1:]
+        latencies = [node.received_at[item] - published_at[item] for item in items for node in receivers]
+        finished = max((node.received_at[item] for item in items for node in receivers), default=started)
+        return PropagationReport(len(items), len(self.nodes), finished - started, latencies)
+
+    async def measure_transactions(self, transactions):
+        """
+        Publishes transactions at the first node and waits until every node
+        has them. Returns a PropagationReport.
+        """
+        origin = self.nodes[0]
+        items = []
+        published_at = {}
+        started = monotonic()
+        for transaction in transactions:
+            data = transaction if isinstance(transaction, dict) else transaction.to_dict()
+            if origin.blockchain.mempool.add(data):
+                item = (INV_TX, bytes.fromhex(transaction_id(data)))
+                published_at[item] = monotonic()
+                origin.publish_transaction(data)
+                items.append(item)
+            if len(items) % 100 == 0:
+                await asyncio.sleep(0)  # let the writers start while publishing
+        await self.wait_for(lambda: all(item in node.received_at for node in self.nodes for item in items))
+        return self._report(items, published_at, started)
+
+    async def measure_block(self):
+        """
+        Mines the first node's mempool into a block, publishes it and waits
+        until every node has appended it. Returns a PropagationReport.
+        """
+        origin = self.nodes[0]
+        if origin.blockchain.mine() is False:
+            raise RuntimeError("Nothing to mine.")
+        block = origin.blockchain.last_block
+        item = (INV_BLOCK, bytes.fromhex(block.hash))
+        started = monotonic()
+        origin.publish_block(block)
+        await self.wait_for(lambda: all(item in node.received_at for node in self.nodes[1:]))
+        return self._report([item], {item: started}, started)
+
+def benchmark_propagation(nodes=8, transactions=2000, degree=3, senders=20):
+    """
+    Runs a local network and measures transaction and block propagation.
+    Returns (transaction_report, block_report).
+    """
+    keys = [QuantumSecurity.generate_keypair() for _ in range(senders)]
+    signed = []
+    for i in range(transactions):
+        private_key, address = keys[i % senders]
+        transaction = Transaction(address, "recipient", 1, fee=1, nonce=i // senders)
+        transaction.sign(private_key)
+        signed.append(transaction)
+
+    async def run():
+        async with LocalNetwork(nodes, degree=degree) as network:
+            return await network.measure_transactions(signed), await network.measure_block()
+
+    return asyncio.run(run())
+
+if __name__ == "__main__":
+    transaction_report, block_report = benchmark_propagation()
+    print(f"transactions: {transaction_report.items} to {transaction_report.nodes} nodes in "
+          f"{transaction_report.elapsed:.2f}s, {transaction_report.throughput:.0f} deliveries/s, "
+          f"latency mean {transaction_report.mean_latency * 1000:.1f}ms max {transaction_report.max_latency * 1000:.1f}ms")
+    print(f"block: latency mean {block_report.mean_latency * 1000:.1f}ms max {block_report.max_latency * 1000:.1f}ms")
@@ -0,0 +1,319 @@
+# UUID: 92d7c4e8-3b1a-4f06-b5e9-7a04c6d1f28e
+# api/chain_sync.py
+
+"""
+Headers-first chain synchronisation for a node that is behind its peers.
+
+The node first downloads the 80-byte headers after its tip and checks their
+hash links and proof of work (for engines whose seal is in the header),
+which is cheap and fixes the exact chain to fetch before any body is
+downloaded. Block bodies are then requested from all peers at once within a
+sliding window ahead of the next block to connect. Each body is validated as
+soon as it arrives on a worker pool (header hash, Merkle root, consensus seal
+and signatures), while the event loop keeps receiving and connects validated
+blocks in height order.
+"""
+
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from hashlib import sha256
+from time import monotonic
+from blockchain.chain import HEADER_PREFIX, Block, Blockchain, Transaction, hash_to_bytes
+from blockchain.quantum_security import QuantumSecurity
+from blockchain.validation import validate_blocks
+from .blockchain_operations import INV_BLOCK, MAX_HEADERS_PER_MESSAGE, MSG_GETDATA, ProtocolError, encode_inventory
+
+class SyncError(Exception):
+    """Raised when the peers cannot provide a valid chain to sync to."""
+    pass
+
+def verify_headers(headers, previous_hash, consensus):
+    """
+    Checks that headers link to previous_hash (32 bytes) and to each other
+    and pass the consensus engine's header check, e.g. the proof-of-work
+    target. Returns the hashes of the valid prefix as 32-byte values.
+    """
+    hashes = []
+    for header in headers:
+        if HEADER_PREFIX.unpack_from(header)[0] != previous_hash:
+            break
+        digest = sha256(header).hexdigest()
+        if not consensus.verify_header(digest):
+            break
+        previous_hash = bytes.fromhex(digest)
+        hashes.append(previous_hash)
+    return hashes
+
+class SyncReport:
+    def __init__(self, blocks, headers_seconds, bodies_seconds, blocks_by_peer):
+        self.blocks = blocks
+        self.headers_seconds = headers_seconds
+        self.bodies_seconds = bodies_seconds
+        self.blocks_by_peer = blocks_by_peer  # peer address -> bodies delivered
+
+    @property
+    def elapsed(self):
+        return self.headers_seconds + self.bodies_seconds
+
+    @property
+    def blocks_per_second(self):
+        return self.blocks / self.elapsed if self.elapsed else 0.0
+
+class ChainSync:
+    """
+    One headers-first sync of node's chain from its connected peers.
+
+    At most window blocks beyond the next block to connect are requested or
+    buffered at a time, in GETDATA batches of batch blocks with at most
+    max_in_flight outstanding blocks per peer. Requests not answered within
+    timeout seconds, or owned by a peer that disconnects, go back to the
+    queue for another peer; a block re-queued more than max_requeues times
+    fails the sync. A peer that sends an invalid body is dropped from the
+    sync and the block is requested from another peer; the sync fails once
+    no peer is left.
+    """
+
+    def __init__(self, node, window=256, batch=16, max_in_flight=64, timeout=10.0, workers=None, max_requeues=5):
+        self.node = node
+        self.window = window
+        self.batch = batch
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.max_requeues = max_requeues
+        self.workers = workers or os.cpu_count() or 1
+        self._peers = []
+        self._hashes = []  # header chain being synced
+        self._expected = {}  # block hash -> position in the header chain
+        self._queue = deque()  # positions not requested yet
+        self._in_flight = {}  # position -> (peer, time requested)
+        self._requeues = {}  # position -> times put back in the queue
+        self._exhausted = None  # first position re-queued more than max_requeues times
+        self._load = {}  # peer -> outstanding blocks
+        self._arrived = {}  # position -> (sending peer, payload, validation future)
+        self._dropped = set()  # peers that sent an invalid body
+        self._next = 0  # position of the next block to connect
+        self._delivered = {}
+        self._progress = None
+        self._executor = None
+
+    async def run(self, peers=None):
+        """
+        Syncs to the longest valid header chain offered by the peers and
+        returns a SyncReport.
+        """
+        self._peers = list(peers if peers is not None else self.node.peers)
+        if not self._peers:
+            raise SyncError("No peers to sync from.")
+        self._progress = asyncio.Event()
+        started = monotonic()
+        hashes = await self._download_headers()
+        headers_seconds = monotonic() - started
+
+        started = monotonic()
+        self.node.sync_session = self
+        self._executor = (ProcessPoolExecutor(self.workers) if self.workers > 1
+                          else ThreadPoolExecutor(1))
+        try:
+            await self._download_bodies(hashes)
+        finally:
+            self.node.sync_session = None
+            self._executor.shutdown(cancel_futures=True)
+        return SyncReport(len(hashes), headers_seconds, monotonic() - started,
+                          {peer.address: count for peer, count in self._delivered.items()})
+
+    async def _download_headers(self):
+        chain = self.node.blockchain.chain
+        start = len(chain)
+        tip = hash_to_bytes(self.node.blockchain.last_block.hash)
+
+        # Ask every peer for the first batch and follow the longest valid answer
+        responses = await asyncio.gather(*(self.node.request_headers(peer, start) for peer in self._peers),
+                                         return_exceptions=True)
+        best_peer, best = None, []
+        for peer, headers in zip(self._peers, responses):
+            if isinstance(headers, Exception):
+                continue
+            hashes = verify_headers(headers, tip, self.node.blockchain.consensus)
+            if len(hashes) > len(best):
+                best_peer, best = peer, hashes
+        if best_peer is None:
+            return []
+
+        hashes = best
+        while len(best) == MAX_HEADERS_PER_MESSAGE:
+            headers = await self.node.request_headers(best_peer, start + len(hashes))
+            best = verify_headers(headers, hashes[-1], self.node.blockchain.consensus)
+            hashes.extend(best)
+        return hashes
+
+    async def _download_bodies(self, hashes):
+        self._hashes = hashes
+        self._expected = {block_hash: position for position, block_hash in enumerate(hashes)}
+        self._queue = deque(range(len(hashes)))
+        while True:
+            self._connect_ready()
+            if self._next == len(hashes):
+                break
+            await self._request_more()
+            try:
+                await asyncio.wait_for(self._progress.wait(), timeout=min(self.timeout, 1.0))
+            except asyncio.TimeoutError:
+                self._requeue_expired()
+            if self._exhausted is not None:
+                raise SyncError(f"No peer delivered block {self._exhausted} after "
+                                f"{self.max_requeues + 1} requests.")
+            # Anything that completes after this point sets the event again
+            self._progress.clear()
+
+    async def _request_more(self):
+        if not self._peers:
+            raise SyncError("All peers disconnected during sync.")
+        limit = self._next + self.window
+        # Hand out one batch per peer per round so the window spreads across peers
+        assigned = True
+        while assigned:
+            assigned = False
+            for peer in list(self._peers):
+                room = min(self.batch, self.max_in_flight - self._load.get(peer, 0))
+                positions = []
+                while self._queue and self._queue[0] < limit and len(positions) < room:
+                    positions.append(self._queue.popleft())
+                if not positions:
+                    continue
+                assigned = True
+                now = monotonic()
+                for position in positions:
+                    self._in_flight[position] = (peer, now)
+                self._load[peer] = self._load.get(peer, 0) + len(positions)
+                items = [(INV_BLOCK, self._hashes[position]) for position in positions]
+                try:
+                    await peer.send(MSG_GETDATA, encode_inventory(items))
+                except (ConnectionError, ProtocolError):
+                    self.peer_lost(peer)
+
+    def deliver(self, peer, block_hash, payload):
+        """
+        Takes a received block body if this sync requested it and starts
+        validating it. Returns False for blocks that are not part of the sync.
+        """
+        position = self._expected.get(block_hash)
+        if position is None:
+            return False
+        if position < self._next or position in self._arrived or peer in self._dropped:
+            return True
+        requested = self._in_flight.pop(position, None)
+        if requested is not None:
+            self._load[requested[0]] -= 1
+        elif position in self._queue:
+            self._queue.remove(position)
+        self._delivered[peer] = self._delivered.get(peer, 0) + 1
+        future = asyncio.get_running_loop().run_in_executor(self._executor, validate_blocks,
+                                                           [bytes(payload)], self.node.blockchain.consensus)
+        future.add_done_callback(lambda _: self._progress.set())
+        self._arrived[position] = (peer, payload, future)
+        self._progress.set()
+        return True
+
+    def peer_lost(self, peer):
+        """
+        Returns a disconnected peer's outstanding requests to the queue.
+        """
+        if peer in self._peers:
+            self._peers.remove(peer)
+        self._load.pop(peer, None)
+        self._requeue([position for position, (owner, _) in self._in_flight.items() if owner is peer])
+
+    def _requeue_expired(self):
+        now = monotonic()
+        expired = [position for position, (_, requested) in self._in_flight.items() if now - requested > self.timeout]
+        for position in expired:
+            peer = self._in_flight[position][0]
+            if peer in self._load:
+                self._load[peer] -= 1
+        self._requeue(expired)
+
+    def _requeue(self, positions):
+        for position in positions:
+            del self._in_flight[position]
+            self._requeues[position] = self._requeues.get(position, 0) + 1
+            if self._requeues[position] > self.max_requeues and self._exhausted is None:
+                self._exhausted = position
+        self._queue.extendleft(sorted(positions, reverse=True))
+
+    def _drop(self, peer, position, reason):
+        """
+        Stops syncing from a peer that sent an invalid body and puts the
+        block back at the front of the queue for another peer.
+        """
+        self._dropped.add(peer)
+        self.peer_lost(peer)
+        self._queue.appendleft(position)
+        if not self._peers:
+            raise SyncError(f"Block {position} from a peer is invalid: {reason}; no other peer is left to ask.")
+
+    def _connect_ready(self):
+        """
+        Appends validated blocks in height order.
+        """
+        blockchain = self.node.blockchain
+        while self._next in self._arrived and self._arrived[self._next][2].done():
+            peer, payload, future = self._arrived.pop(self._next)
+            _, _, block_hash, error, _, _ = future.result()[0]
+            if error is not None or bytes.fromhex(block_hash) != self._hashes[self._next]:
+                self._drop(peer, self._next, error or "unexpected hash")
+                break
+            block = Block.from_bytes(payload)
+            with self.node.lock:
+                accepted = blockchain.add_block(block, block.hash)
+            if not accepted:
+                raise SyncError(f"Block {block.index} does not connect to the local chain.")
+            self.node.record_item((INV_BLOCK, self._hashes[self._next]))
+            self._next += 1
+
+def benchmark_sync(blocks=200, peers=3, transactions_per_block=50, window=256, batch=16, workers=None):
+    """
+    Builds a chain, serves it from several localhost peers and syncs a fresh
+    node from them. Returns the SyncReport.
+    """
+    from .blockchain_operations import Node
+    from blockchain.storage import MemoryBlockStore
+
+    keys = [QuantumSecurity.generate_keypair() for _ in range(transactions_per_block)]
+    source = Blockchain(mining_workers=1)
+    for height in range(blocks):
+        for private_key, address in keys:
+            transaction = Transaction(address, "merchant", 1, nonce=height)
+            transaction.sign(private_key)
+            source.mempool.add(transaction.to_dict())
+        source.mine()
+
+    async def run():
+        servers = []
+        for _ in range(peers):
+            store = MemoryBlockStore()
+            for block in source.chain:
+                store.append(block)
+            servers.append(await Node(Blockchain(mining_workers=1, store=store)).start())
+        store = MemoryBlockStore()
+        store.append(source.chain[0])
+        node = await Node(Blockchain(mining_workers=1, store=store)).start()
+        try:
+            for server in servers:
+                await node.connect(server.host, server.port)
+            report = await ChainSync(node, window=window, batch=batch, workers=workers).run()
+            assert node.blockchain.last_block.hash == source.last_block.hash
+            return report
+        finally:
+            for running in servers + [node]:
+                await running.stop()
+
+    return asyncio.run(run())
+
+if __name__ == "__main__":
+    report = benchmark_sync()
+    print(f"synced {report.blocks} blocks in {report.elapsed:.2f}s ({report.blocks_per_second:.0f} blocks/s): "
+          f"headers {report.headers_seconds:.2f}s, bodies {report.bodies_seconds:.2f}s")
+    for address, count in report.blocks_by_peer.items():
+        print(f"  {count} bodies from {address}")
@@ -1,2 +1,237 @@
 # UUID: 184033d6-9d3e-46d4-874b-d35dffa343fa
+# api/quantum_computing_access.py
 
+"""
+Asynchronous job API for quantum workloads. Callers submit a circuit to
+simulate, or a QuantumInterface crypto operation, and get back a job id they
+can poll or await. Jobs wait in a priority queue and run on a bounded pool of
+worker threads, so a long simulation no longer blocks the event loop or any
+other caller. Identical circuit submissions share one run, and circuit
+results are cached by circuit hash and shot count.
+"""
+
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from quantum.quantum_interface import QuantumInterface
+from utils.quantum_simulation_tools import SimulatorBackend
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+CRYPTO_OPERATIONS = frozenset({"generate_keypair", "encrypt_message", "decrypt_message",
+                               "sign_message", "verify_signature"})
+
+class JobError(Exception):
+    """Raised for unknown jobs, jobs without a result yet, and failed jobs."""
+    pass
+
+class QuantumJob:
+    def __init__(self, job_id, kind, priority, call, key=None):
+        self.job_id = job_id
+        self.kind = kind  # "circuit" or "crypto"
+        self.priority = priority
+        self.call = call  # runs the job in a worker thread
+        self.key = key  # circuit hash and shots, for coalescing and caching
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted = monotonic()
+        self.started = None
+        self.finished = None
+        self.done = asyncio.get_running_loop().create_future()
+
+    def _finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished = monotonic()
+        self.call = None
+        self.done.set_result(self)
+
+class QuantumJobQueue:
+    """
+    Priority job scheduler running on the current event loop.
+
+    Higher priority jobs run first, equal priorities in submission order; at
+    most workers jobs run at once. Each worker thread has its own backend
+    from backend_factory, by default a noiseless SimulatorBackend. Up to
+    max_cache circuit results are kept, least recently used first out, and
+    up to max_finished finished jobs stay available for polling.
+    """
+
+    def __init__(self, workers=2, backend_factory=SimulatorBackend, max_cache=1024, max_finished=10000):
+        self.workers = workers
+        self.backend_factory = backend_factory
+        self.max_cache = max_cache
+        self.max_finished = max_finished
+        self.jobs = OrderedDict()  # job id -> QuantumJob
+        self.cache_hits = 0
+        self.coalesced = 0
+        self._cache = OrderedDict()  # circuit key -> counts
+        self._active = {}  # circuit key -> queued or running job
+        self._finished = deque()  # ids of finished jobs, oldest first
+        self._ids = itertools.count(1)
+        self._sequence = itertools.count()
+        self._queue = None
+        self._executor = None
+        self._tasks = []
+        self._local = threading.local()
+
+    async def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="quantum-job")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        return self
+
+    async def stop(self):
+        """
+        Stops the workers. Queued and running jobs fail, so nobody waits on
+        them forever.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        for job in [job for job in self.jobs.values() if job.status in (QUEUED, RUNNING)]:
+            job._finish(FAILED, error=JobError("The job queue was stopped."))
+            self._record_finished(job)
+        self._active.clear()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def _backend(self):
+        backend = getattr(self._local, "backend", None)
+        if backend is None:
+            backend = self._local.backend = self.backend_factory()
+        return backend
+
+    def _new_job(self, kind, priority, call, key=None):
+        job = QuantumJob(f"job-{next(self._ids)}", kind, priority, call, key)
+        self.jobs[job.job_id] = job
+        return job
+
+    def _enqueue(self, job):
+        self._queue.put_nowait((-job.priority, next(self._sequence), job))
+
+    def submit_circuit(self, circuit, shots=1024, priority=0):
+        """
+        Queues a circuit simulation and returns its job id. The result is
+        {bitstring: count}. A circuit already queued or running with the same
+        shots returns that job's id, raising its priority if needed; a
+        cached result gives a job that is already done.
+        """
+        key = (circuit.digest(), shots)
+        if key in self._cache:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+            job = self._new_job("circuit", priority, None, key)
+            job._finish(DONE, self._cache[key])
+            self._record_finished(job)
+            return job.job_id
+        job = self._active.get(key)
+        if job is not None:
+            self.coalesced += 1
+            if job.status == QUEUED and priority > job.priority:
+                # The old queue entry is skipped once the job has run
+                job.priority = priority
+                self._enqueue(job)
+            return job.job_id
+        job = self._new_job("circuit", priority, lambda: self._backend().run(circuit, shots), key)
+        self._active[key] = job
+        self._enqueue(job)
+        return job.job_id
+
+    def submit_crypto(self, operation, *args, priority=0):
+        """
+        Queues a QuantumInterface operation, e.g. "sign_message", with its
+        arguments and returns the job id. Crypto jobs are never coalesced or
+        cached.
+        """
+        if operation not in CRYPTO_OPERATIONS:
+            raise JobError(f"Unsupported crypto operation: {operation}")
+        function = getattr(QuantumInterface, operation)
+        job = self._new_job("crypto", priority, lambda: function(*args))
+        self._enqueue(job)
+        return job.job_id
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise JobError(f"Unknown job: {job_id}")
+        return job
+
+    def status(self, job_id):
+        return self.get(job_id).status
+
+    def result(self, job_id):
+        """
+        Returns the result of a finished job. Raises JobError if the job
+        failed or has not finished yet.
+        """
+        job = self.get(job_id)
+        if job.status == FAILED:
+            raise JobError(f"Job {job_id} failed: {job.error}")
+        if job.status != DONE:
+            raise JobError(f"Job {job_id} is {job.status}.")
+        return job.result
+
+    async def wait(self, job_id, timeout=None):
+        """
+        Waits for a job to finish and returns its result.
+        """
+        job = self.get(job_id)
+        await asyncio.wait_for(asyncio.shield(job.done), timeout)
+        return self.result(job_id)
+
+    def stats(self):
+        statuses = [job.status for job in self.jobs.values()]
+        return {
+            "queued": statuses.count(QUEUED),
+            "running": statuses.count(RUNNING),
+            "done": statuses.count(DONE),
+            "failed": statuses.count(FAILED),
+            "cache_size": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+        }
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job = await self._queue.get()
+            if job.status != QUEUED:
+                continue
+            job.status = RUNNING
+            job.started = monotonic()
+            try:
+                result = await loop.run_in_executor(self._executor, job.call)
+            except Exception as e:
+                job._finish(FAILED, error=e)
+            else:
+                job._finish(DONE, result)
+                if job.key is not None:
+                    self._cache[job.key] = result
+                    while len(self._cache) > self.max_cache:
+                        self._cache.popitem(last=False)
+            finally:
+                if job.key is not None:
+                    self._active.pop(job.key, None)
+            self._record_finished(job)
+
+    def _record_finished(self, job):
+        """
+        Remembers a finished job and forgets the oldest finished jobs beyond
+        max_finished.
+        """
+        self._finished.append(job.job_id)
+        while len(self._finished) > self.max_finished:
+            self.jobs.pop(self._finished.popleft(), None)
@@ -7,6 +7,8 @@ with emphasis on security and scalability.
 
 import time
 from hashlib import sha256
+from .chain import serialize_transaction
+from .merkle import MerkleTree
 
 class Block:
     def __init__(self, index, transactions, previous_hash):
@@ -15,12 +17,22 @@ class Block:
         self.transactions = transactions  # List of transactions included in the block
         self.previous_hash = previous_hash  # Hash of the previous block in the chain
         self.nonce = None  # Nonce used in proof-of-work
+        self.merkle_tree = MerkleTree(serialize_transaction(tx) for tx in transactions)
+
+    @property
+    def merkle_root(self):
+        """
+        Returns the Merkle root of the block's transactions as bytes, like
+        blockchain.chain.Block.merkle_root.
+        """
+        return self.merkle_tree.root
 
     def calculate_hash(self):
         """
-        Calculates the hash of the block using SHA-256.
+        Calculates the hash of the block using SHA-256. Transactions are
+        committed to through their Merkle root.
         """
-        block_string = f"{self.index}{self.timestamp}{self.transactions}{self.previous_hash}"
+        block_string = f"{self.index}{self.timestamp}{self.merkle_root.hex()}{self.previous_hash}"
         return sha256(block_string.encode()).hexdigest()
 
     def validate_block(self):
@@ -41,11 +53,16 @@ class Block:
 
     def add_transaction(self, transaction):
         """
-        Adds a new transaction to the block.
-        Placeholder for actual transaction addition logic.
+        Adds a new transaction to the block and extends its Merkle tree.
         """
-        # Placeholder implementation
-        pass
+        self.transactions.append(transaction)
+        self.merkle_tree.append(serialize_transaction(transaction))
+
+    def merkle_proof(self, tx_index):
+        """
+        Returns the inclusion proof for the transaction at tx_index.
+        """
+        return self.merkle_tree.proof(tx_index)
 
 # Placeholder for additional classes and functions related to block management
 
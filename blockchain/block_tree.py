@@ -0,0 +1,177 @@
+# UUID: d4a81f6c-2e97-4b3d-8c05-f1b6e93a7d20
+# blockchain/block_tree.py
+
+"""
+Block tree index for fork choice. Every known block gets an index entry with
+its parent and the cumulative weight of the branch ending in it: expected
+work for proof of work, or the forger's stake for proof of stake. The active
+chain is the branch with the most cumulative weight; blocks of other
+branches are kept in the tree so the chain can switch to them later by
+disconnecting and reconnecting only the blocks after the fork point.
+
+Blocks already in the block store when the tree is opened are indexed on
+first use, so start-up does not walk the whole chain; appending blocks to the
+tip never needs that index.
+"""
+
+class BlockIndexEntry:
+    __slots__ = ("hash", "previous_hash", "height", "parent", "chain_work", "block", "active", "invalid")
+
+    def __init__(self, block_hash, previous_hash, height, parent):
+        self.hash = block_hash
+        self.previous_hash = previous_hash
+        self.height = height
+        self.parent = parent
+        self.chain_work = 0  # None until the blocks of the store are indexed
+        self.block = None  # kept for side branches; active blocks live in the block store
+        self.active = False
+        self.invalid = False
+
+class BlockTree:
+    """
+    Index of the active chain and its side branches.
+
+    weight(entry) returns the weight a block adds to its branch; it gets the
+    index entry, which carries the block's hash, previous hash and height.
+    Side branches forking more than max_side_depth blocks below the tip are
+    pruned.
+
+    store is an optional non-empty block store holding the active chain. Only
+    its tip is indexed up front; the rest of the chain, and the chain work of
+    active entries, is indexed the first time a side branch or an entry below
+    the tip is looked up.
+    """
+
+    def __init__(self, weight, max_side_depth=256, store=None):
+        self.weight = weight
+        self.max_side_depth = max_side_depth
+        self.entries = {}  # block hash -> BlockIndexEntry
+        self.tip = None
+        self._side = {}  # block hash -> entry, for side-branch blocks only
+        self._store = store  # store whose blocks are not indexed yet
+        if store is not None:
+            height, previous_hash, block_hash = next(store.iter_links(len(store) - 1))
+            self.extend_active(block_hash, previous_hash, height)
+
+    def _load(self):
+        """
+        Indexes every block of the active chain in the store, replacing the
+        entries created without their ancestors.
+        """
+        store, self._store = self._store, None
+        if store is None:
+            return
+        parent = None
+        for height, previous_hash, block_hash in store.iter_links():
+            entry = self.entries.get(block_hash)
+            if entry is None:
+                entry = BlockIndexEntry(block_hash, previous_hash, height, parent)
+                entry.active = True
+                self.entries[block_hash] = entry
+            entry.parent = parent
+            entry.chain_work = (parent.chain_work if parent is not None else 0) + self.weight(entry)
+            parent = entry
+
+    def __contains__(self, block_hash):
+        if block_hash in self.entries:
+            return True
+        return self._store is not None and self._store.height_of(block_hash) is not None
+
+    def __len__(self):
+        self._load()
+        return len(self.entries)
+
+    def get(self, block_hash):
+        entry = self.entries.get(block_hash)
+        if entry is None and block_hash in self:
+            self._load()
+            entry = self.entries.get(block_hash)
+        return entry
+
+    def _new_entry(self, block_hash, previous_hash, height):
+        parent = self.entries.get(previous_hash)
+        entry = BlockIndexEntry(block_hash, previous_hash, height, parent)
+        if self._store is None:
+            entry.chain_work = (parent.chain_work if parent is not None else 0) + self.weight(entry)
+        else:
+            entry.chain_work = None
+        self.entries[block_hash] = entry
+        return entry
+
+    def extend_active(self, block_hash, previous_hash, height):
+        """
+        Records a block appended to the tip of the active chain.
+        """
+        entry = self._new_entry(block_hash, previous_hash, height)
+        entry.active = True
+        self.tip = entry
+        return entry
+
+    def add_side(self, block):
+        """
+        Records a block whose parent is known but is not the active tip.
+        Returns its entry, or None if the parent is unknown or invalid.
+        """
+        self._load()
+        parent = self.entries.get(block.previous_hash)
+        if parent is None or parent.invalid:
+            return None
+        entry = self._new_entry(block.hash, block.previous_hash, parent.height + 1)
+        entry.block = block
+        self._side[block.hash] = entry
+        self.prune()
+        return entry
+
+    def branch(self, entry):
+        """
+        Returns (fork, path): the last active ancestor of entry and the
+        entries from just after it up to entry, oldest first.
+        """
+        path = []
+        while not entry.active:
+            path.append(entry)
+            entry = entry.parent
+        path.reverse()
+        return entry, path
+
+    def detach(self, blocks):
+        """
+        Marks active blocks as a side branch, keeping the blocks themselves.
+        """
+        for block in blocks:
+            entry = self.entries[block.hash]
+            entry.active = False
+            entry.block = block
+            self._side[block.hash] = entry
+
+    def attach(self, entries):
+        """
+        Marks side-branch entries as active; the last one becomes the tip.
+        """
+        for entry in entries:
+            entry.active = True
+            entry.block = None
+            self._side.pop(entry.hash, None)
+        self.tip = entries[-1]
+
+    def mark_invalid(self, entry):
+        """
+        Marks a block and every side-branch block built on it as invalid.
+        """
+        entry.invalid = True
+        for side in self._side.values():
+            ancestor = side
+            while ancestor is not None and not ancestor.active:
+                if ancestor.invalid:
+                    side.invalid = True
+                    break
+                ancestor = ancestor.parent
+
+    def prune(self):
+        """
+        Forgets side-branch blocks too far below the tip to become active.
+        """
+        floor = self.tip.height - self.max_side_depth
+        for block_hash in [block_hash for block_hash, entry in self._side.items() if entry.height < floor]:
+            del self._side[block_hash]
+            del self.entries[block_hash]
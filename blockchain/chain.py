@@ -2,34 +2,82 @@
 # chain.py
 
 import hashlib
-import json
+import os
+import struct
 from time import time
 from typing import List, Dict, Any
 from cryptography.exceptions import InvalidSignature
 from .quantum_security import QuantumSecurity, SecurityError
+from .merkle import MerkleTree, verify_proof
+from .storage import MemoryBlockStore
+from .verification import verify_batch
+from .mempool import Mempool, transaction_id
+from .validation import ChainValidator
+from .state import StateError
+from .contract_engine import ContractEngine, ContractError, ExecutionReceipt, OutOfGas
+from .parallel_executor import ParallelContractExecutor
+from .events import EventLog
+from .encoding import encode_transaction, decode_transaction, encode_block, decode_block
+from .block_tree import BlockTree
+from .consensus import ProofOfWorkConsensus
+
+# Fixed-layout block header: previous hash, Merkle root, timestamp, nonce
+HEADER_PREFIX = struct.Struct(">32s32sd")
+HEADER_NONCE = struct.Struct(">Q")
 
 class Transaction:
-    def __init__(self, sender, recipient, amount, signature):
+    __slots__ = ("sender", "recipient", "amount", "signature", "fee", "nonce")
+
+    def __init__(self, sender, recipient, amount, signature=None, fee=0, nonce=0):
         self.sender = sender
         self.recipient = recipient
         self.amount = amount
         self.signature = signature
+        self.fee = fee  # Paid to the miner; orders transactions in the mempool
+        self.nonce = nonce  # Per-sender sequence number
 
     def to_dict(self):
         return {
             "sender": self.sender,
             "recipient": self.recipient,
             "amount": self.amount,
+            "fee": self.fee,
+            "nonce": self.nonce,
             "signature": self.signature
         }
 
+    def to_bytes(self):
+        """
+        Returns the canonical binary encoding of the transaction.
+        """
+        return encode_transaction(self.to_dict())
+
+    @classmethod
+    def from_bytes(cls, buffer):
+        data, _ = decode_transaction(buffer)
+        return cls(data.get("sender"), data.get("recipient"), data.get("amount"),
+                   data.get("signature"), data.get("fee", 0), data.get("nonce", 0))
+
+    def signing_payload(self):
+        """
+        Returns the message covered by the signature: the canonical encoding
+        of every field except the signature itself.
+        """
+        return encode_transaction(self.to_dict(), include_signature=False)
+
+    def sign(self, private_key):
+        """
+        Signs the transaction with the sender's private key.
+        """
+        self.signature = QuantumSecurity.sign(private_key, self.signing_payload())
+
     def verify_transaction_signature(self):
         """
         Verifies the signature of the transaction.
         """
         try:
             sender_public_key = QuantumSecurity.deserialize_public_key(self.sender)
-            return QuantumSecurity.verify_signature(sender_public_key, str(self.to_dict()), self.signature)
+            return QuantumSecurity.verify_signature(sender_public_key, self.signing_payload(), self.signature)
         except (InvalidSignature, SecurityError):
             return False
 
@@ -42,20 +90,203 @@ class Block:
         self.nonce = nonce
         self.hash = self.compute_hash()
 
+    def compute_merkle_root(self):
+        """
+        Rebuilds the Merkle tree from the block's transactions and returns its root.
+        """
+        self.merkle_tree = MerkleTree(serialize_transaction(tx) for tx in self.transactions)
+        return self.merkle_tree.root
+
+    def _current_merkle_tree(self):
+        # Rebuild if transactions were appended without going through add_transaction
+        if len(self.merkle_tree) != len(self.transactions):
+            self.compute_merkle_root()
+        return self.merkle_tree
+
+    @property
+    def merkle_root(self):
+        """
+        Returns the cached Merkle root of the block's transactions.
+        """
+        return self._current_merkle_tree().root
+
+    def add_transaction(self, transaction: Dict[str, Any]):
+        """
+        Appends a transaction and updates the Merkle tree incrementally.
+        """
+        merkle_tree = self._current_merkle_tree()
+        self.transactions.append(transaction)
+        merkle_tree.append(serialize_transaction(transaction))
+
+    def merkle_proof(self, tx_index: int):
+        """
+        Returns the inclusion proof for the transaction at tx_index.
+        """
+        return self._current_merkle_tree().proof(tx_index)
+
+    def header_prefix(self, root=None):
+        """
+        Returns the nonce-independent part of the binary block header.
+        """
+        return HEADER_PREFIX.pack(hash_to_bytes(self.previous_hash),
+                                  self.merkle_root if root is None else root,
+                                  self.timestamp)
+
+    def header(self):
+        """
+        Returns the full 80-byte block header whose SHA-256 is the block hash.
+        """
+        return self.header_prefix() + HEADER_NONCE.pack(self.nonce)
+
     def compute_hash(self):
         """
-        Computes a SHA-256 hash of the block's contents.
+        Computes a SHA-256 hash of the block header. The Merkle root is
+        recomputed from the transactions so the hash always reflects them.
         """
-        block_string = json.dumps(self.__dict__, sort_keys=True)
-        return hashlib.sha256(block_string.encode()).hexdigest()
+        return BlockHeaderJob(self.header_prefix(self.compute_merkle_root())).hash_nonce(self.nonce)
+
+    def mining_job(self):
+        """
+        Returns a picklable proof-of-work job for this block.
+        """
+        return BlockHeaderJob(self.header_prefix())
+
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "transactions": self.transactions,
+            "timestamp": self.timestamp,
+            "previous_hash": self.previous_hash,
+            "nonce": self.nonce,
+            "hash": self.hash
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]):
+        block = cls(data["index"], data["transactions"], data["timestamp"], data["previous_hash"], data["nonce"])
+        block.hash = data["hash"]
+        return block
+
+    def to_bytes(self):
+        """
+        Returns the canonical binary encoding of the block, as stored on disk.
+        """
+        return encode_block(self)
+
+    @classmethod
+    def from_bytes(cls, buffer):
+        """
+        Decodes a block from any buffer, e.g. a slice of a mapped segment.
+        The Merkle tree is built from the stored transaction bytes instead of
+        encoding the decoded transactions again.
+        """
+        data, leaves, _ = decode_block(buffer)
+        block = cls.__new__(cls)
+        block.index = data["index"]
+        block.transactions = data["transactions"]
+        block.timestamp = data["timestamp"]
+        block.previous_hash = data["previous_hash"]
+        block.nonce = data["nonce"]
+        block.merkle_tree = MerkleTree(leaves)
+        block.hash = data["hash"]
+        return block
+
+def serialize_transaction(transaction):
+    """
+    Returns the canonical bytes of a transaction.
+    """
+    return encode_transaction(transaction)
+
+def sign_transaction(transaction, private_key):
+    """
+    Signs a transaction dictionary, e.g. a contract call, as its sender and
+    returns it. The signature covers the canonical encoding of every other
+    field, so none of them can be changed or added afterwards; for a plain
+    payment it is the same signature Transaction.sign gives.
+    """
+    payload = encode_transaction(transaction, include_signature=False)
+    transaction["signature"] = QuantumSecurity.sign(private_key, payload)
+    return transaction
+
+def verify_transaction_proof(transaction, proof, merkle_root: bytes):
+    """
+    Checks that a transaction is included in the block whose header carries
+    merkle_root, using only the log-sized proof.
+    """
+    return verify_proof(serialize_transaction(transaction), proof, merkle_root)
+
+def hash_to_bytes(block_hash):
+    """
+    Converts a hex block hash to its 32-byte form. The genesis block's
+    previous hash "0" becomes all zero bytes.
+    """
+    return bytes.fromhex(block_hash.zfill(64))
+
+class BlockHeaderJob:
+    """
+    Hashes block headers that differ only in their nonce. The header prefix is
+    absorbed into a SHA-256 midstate once, so each nonce costs one copy of the
+    midstate and an 8-byte update regardless of how many transactions the
+    block holds.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._midstate = None
+
+    def __getstate__(self):
+        # hashlib objects cannot be pickled; workers rebuild the midstate
+        return {"prefix": self.prefix, "_midstate": None}
+
+    def hash_nonce(self, nonce):
+        if self._midstate is None:
+            self._midstate = hashlib.sha256(self.prefix)
+        header_hash = self._midstate.copy()
+        header_hash.update(HEADER_NONCE.pack(nonce))
+        return header_hash.hexdigest()
 
 class Blockchain:
-    difficulty = 4  # Difficulty of the Proof-of-Work algorithm
+    difficulty = 4  # Difficulty of the default Proof-of-Work consensus
+    max_block_bytes = 1024 * 1024  # Serialized transaction bytes per block
 
-    def __init__(self):
-        self.unconfirmed_transactions = []  # data yet to get into the blockchain
-        self.chain: List[Block] = []
-        self.create_genesis_block()
+    def __init__(self, mining_workers=None, store=None, mempool=None, state=None, event_log=None, consensus=None):
+        """
+        store is the block storage backend, e.g. a FileBlockStore for a
+        persistent ledger; by default blocks are only kept in memory.
+        An existing store is reopened as is, without rebuilding the genesis block.
+        state is an optional StateEngine; when given, blocks must apply cleanly
+        to the account state to be accepted. On start-up it only replays the
+        blocks after its latest snapshot that is still on the chain.
+        event_log is the EventLog receiving contract events; pass one with a
+        path to persist them.
+        consensus is the engine that seals mined blocks, checks the proof of
+        added blocks and weighs them for fork choice; by default it is
+        proof of work at Blockchain.difficulty.
+        """
+        self.state = state
+        self.mempool = mempool if mempool is not None else Mempool()  # data yet to get into the blockchain
+        self.chain = store if store is not None else MemoryBlockStore()
+        self.mining_workers = mining_workers or os.cpu_count() or 1
+        self.data_store = {}  # Persisted contract state, keyed by state hash
+        self.event_log = event_log if event_log is not None else EventLog()
+        self.contract_engine = ContractEngine(self)
+        self.contract_executor = ParallelContractExecutor(self.contract_engine, max_workers=self.mining_workers)
+        self.consensus = consensus if consensus is not None else ProofOfWorkConsensus()
+        self.consensus.blockchain = self
+        if not len(self.chain):
+            self.block_tree = BlockTree(self.consensus.block_weight)
+            self.create_genesis_block()
+        else:
+            # Stored blocks are only indexed once a fork needs them
+            self.block_tree = BlockTree(self.consensus.block_weight, store=self.chain)
+        if self.state is not None:
+            # A snapshot from an abandoned branch, or ahead of a store that was
+            # not synced before a crash, gives way to an older one
+            self.state.restore(lambda height, block_hash: height < len(self.chain)
+                               and self.chain[height].hash == block_hash)
+            for height in range(self.state.height + 1, len(self.chain)):
+                self.state.apply_block(self.chain[height])
+        self.event_log.begin_block(len(self.chain))
 
     def create_genesis_block(self):
         """
@@ -64,122 +295,285 @@ class Blockchain:
         genesis_block = Block(0, [], time(), "0")
         genesis_block.hash = genesis_block.compute_hash()
         self.chain.append(genesis_block)
+        self.block_tree.extend_active(genesis_block.hash, genesis_block.previous_hash, 0)
 
     @property
     def last_block(self):
         return self.chain[-1]
 
+    def current_block_number(self):
+        """
+        Returns the height of the block currently being built.
+        """
+        return self.last_block.index + 1
+
+    def get_block(self, height: int):
+        """
+        Returns the block at the given height.
+        """
+        return self.chain[height]
+
+    def get_block_by_hash(self, block_hash: str):
+        """
+        Returns the block with the given hash from the active chain or a side
+        branch, or None if it is unknown.
+        """
+        block = self.chain.get_by_hash(block_hash)
+        if block is None:
+            entry = self.block_tree.get(block_hash)
+            block = None if entry is None else entry.block
+        return block
+
+    def validate_chain(self, **options):
+        """
+        Validates the whole chain with a streaming ChainValidator and returns
+        its report. Options are passed on to ChainValidator, e.g.
+        checkpoint_path to make an interrupted audit resumable.
+        """
+        return ChainValidator(self.chain, self.consensus, **options).validate()
+
+    def close(self):
+        """
+        Flushes the block store and event log and stops any mining worker processes.
+        """
+        self.consensus.close()
+        if self.state is not None:
+            self.state.wait_for_snapshot()
+        self.event_log.close()
+        self.chain.close()
+
+    def get_transaction_proof(self, block_index: int, tx_index: int):
+        """
+        Returns the transaction at tx_index of a block together with its
+        Merkle inclusion proof, for light clients that only hold headers.
+        """
+        block = self.chain[block_index]
+        return block.transactions[tx_index], block.merkle_proof(tx_index)
+
     def add_block(self, block: Block, proof: str):
         """
-        Adds a block to the chain after verification.
+        Adds a block to the block tree after verification.
         Verification includes:
         - Checking that the proof is valid.
-        - The previous_hash referred in the block and the hash of latest block in the chain match.
-        """
-        previous_hash = self.last_block.hash
+        - The previous_hash referred in the block is a known block.
 
-        if previous_hash != block.previous_hash:
+        A block on the current tip is appended to the chain. A block on
+        another branch is kept as a side branch, and once that branch carries
+        more cumulative weight than the active chain the chain reorganises
+        onto it. Returns False if the block is rejected, including when it
+        does not apply to the account state.
+        """
+        if not self.is_valid_proof(block, proof):
+            return False
+        block.hash = proof
+        if proof in self.block_tree or not self._inherits_seed(block):
             return False
 
-        if not self.is_valid_proof(block, proof):
+        if block.previous_hash == self.last_block.hash:
+            if not self._connect_block(block):
+                return False
+            self.block_tree.extend_active(block.hash, block.previous_hash, block.index)
+            return True
+
+        parent = self.block_tree.get(block.previous_hash)
+        if parent is None or parent.height + 1 != block.index:
             return False
+        entry = self.block_tree.add_side(block)
+        if entry is None:
+            return False
+        if entry.chain_work > self.block_tree.tip.chain_work:
+            return self._reorganize(entry)
+        return True
 
-        block.hash = proof
+    def _inherits_seed(self, block):
+        """
+        Returns True if the block carries the seed its parent passes on, for
+        consensus engines that chain seeds (see ConsensusAlgorithm.parent_seed).
+        """
+        seed = self.consensus.parent_seed(block)
+        if seed is None:
+            return True
+        parent = self.get_block_by_hash(block.previous_hash)
+        return parent is not None and self.consensus.next_seed(parent) == seed
+
+    def _connect_block(self, block):
+        if self.state is not None:
+            try:
+                self.state.apply_block(block)
+            except StateError:
+                return False
         self.chain.append(block)
+        self._execute_contracts(block)
+        self.event_log.begin_block(block.index + 1)
         return True
 
-    def is_valid_proof(self, block: Block, block_hash: str):
+    def _execute_contracts(self, block):
         """
-        Check if block_hash is valid hash of block and satisfies the difficulty criteria.
+        Runs the contract calls of a block that joined the active chain and
+        commits their state changes with undo data at the block's height.
         """
-        return (block_hash.startswith('0' * Blockchain.difficulty) and
-                block_hash == block.compute_hash())
+        # Contract calls run in parallel with conflict detection; their state
+        # changes are cached during the block and written back once
+        self.contract_executor.execute_block([transaction for transaction in block.transactions
+                                              if transaction.get("is_contract")])
+        self.contract_engine.commit_block(block.index)
 
-    def proof_of_work(self, block: Block):
+    def _reorganize(self, entry):
         """
-        Function that tries different values of nonce to get a hash
-        that satisfies our difficulty criteria.
+        Switches the active chain to the branch ending in entry. Only the
+        blocks after the fork point are disconnected, with the account state,
+        contract state and events rolled back through their undo data, and
+        the new branch is connected on top, running its contract calls. If a
+        block of the new branch does not apply, the original chain is
+        restored and that branch is marked invalid.
         """
-        block.nonce = 0
-
-        computed_hash = block.compute_hash()
-        while not computed_hash.startswith('0' * Blockchain.difficulty):
-            block.nonce += 1
-            computed_hash = block.compute_hash()
-
-        return computed_hash
+        fork, path = self.block_tree.branch(entry)
+        depth = len(self.chain) - 1 - fork.height
+        if self.state is not None and self.state.undo_depth < depth:
+            return False
 
-    def add_new_transaction(self, transaction: Dict[str, Any]):
-        self.unconfirmed_transactions.append(transaction)
+        disconnected = [self.chain[height] for height in range(fork.height + 1, len(self.chain))]
+        self._disconnect_to(fork.height, len(disconnected))
+        self.block_tree.detach(disconnected)
+
+        connected = []
+        for candidate in path:
+            if not self._connect_block(candidate.block):
+                self.block_tree.mark_invalid(candidate)
+                self._disconnect_to(fork.height, len(connected))
+                for block in disconnected:
+                    self._connect_block(block)
+                self.block_tree.attach([self.block_tree.get(block.hash) for block in disconnected])
+                return False
+            connected.append(candidate.block)
+        self.block_tree.attach(path)
+
+        # Transactions only confirmed on the abandoned branch go back to the
+        # mempool; proof-of-stake forging records belong to their block only
+        confirmed = {transaction_id(transaction) for block in connected for transaction in block.transactions}
+        for block in disconnected:
+            for position, transaction in enumerate(block.transactions):
+                if (not self.consensus.is_forging_record(position, transaction)
+                        and transaction_id(transaction) not in confirmed):
+                    self.mempool.add(transaction)
+        for block in connected:
+            self.mempool.remove(block.transactions)
+        return True
 
-    def mine(self):
+    def _disconnect_to(self, height, count):
         """
-        This function serves as an interface to add the pending
-        transactions to the blockchain by adding them to the block
-        and figuring out Proof of Work.
+        Rolls back the top count blocks of the active chain, leaving height as the tip.
         """
-        if not self.unconfirmed_transactions:
-            return False
+        if self.state is not None:
+            for _ in range(count):
+                self.state.revert_block()
+        self.contract_engine.revert_blocks(height + 1)
+        self.chain.truncate(height + 1)
+        self.event_log.begin_block(height + 1)
+
+    def get_balance(self, address):
+        """
+        Returns the confirmed balance of an account. Requires a state engine.
+        """
+        return self.state.balance(address)
 
-        last_block = self.last_block
+    def is_valid_proof(self, block: Block, block_hash: str):
+        """
+        Check if block_hash is the hash of block and the block is sealed
+        according to the consensus engine.
+        """
+        return self.consensus.verify_block(block, block_hash)
 
-        new_block = Block(index=last_block.index + 1,
-                          transactions=self.unconfirmed_transactions,
-                          timestamp=time(),
-                          previous_hash=last_block.hash)
+    def proof_of_work(self, block: Block):
+        """
+        Seals a newly built block with the consensus engine and returns its
+        hash: a nonce search for proof of work, the forger's signature for
+        proof of stake.
+        """
+        return self.consensus.seal_block(block)
 
-        proof = self.proof_of_work(new_block)
-        self.add_block(new_block, proof)
-        self.unconfirmed_transactions = []
-        return new_block.index
+    @property
+    def unconfirmed_transactions(self):
+        """
+        Returns the transactions currently waiting in the mempool.
+        """
+        return list(self.mempool)
 
     def add_new_transaction(self, transaction: Transaction):
         """
-        Adds a new transaction to the unconfirmed transactions pool after verification.
+        Adds a new transaction to the mempool after verification.
+        Returns False if the mempool rejected it, e.g. as a duplicate.
         """
         if transaction.verify_transaction_signature():
-            self.unconfirmed_transactions.append(transaction.to_dict())
+            return self.mempool.add(transaction.to_dict())
         else:
             raise SecurityError("Invalid transaction signature.")
 
-    def execute_smart_contract(self, contract_address, action, params):
+    def add_new_transactions(self, transactions: List[Transaction], use_processes=False):
+        """
+        Verifies a batch of transactions in parallel and adds the valid ones to
+        the mempool. Returns the per-transaction results: True only for
+        transactions that verified and were admitted.
+        """
+        transactions = list(transactions)
+        results = verify_batch(transactions, max_workers=self.mining_workers, use_processes=use_processes)
+        return [valid and self.mempool.add(transaction.to_dict())
+                for transaction, valid in zip(transactions, results)]
+
+    def execute_smart_contract(self, contract_address, action, params, signature=None, gas_limit=None):
+        """
+        Executes a smart contract action on the blockchain and returns its
+        ExecutionReceipt. A failed or out-of-gas call is reverted and reported
+        in the receipt's error instead of raising.
+        """
+        try:
+            return self.contract_engine.execute(contract_address, action, params, signature, gas_limit)
+        except (ContractError, OutOfGas) as e:
+            return ExecutionReceipt(contract_address, action, None, 0, str(e))
+
+    def select_transactions(self):
+        """
+        Picks the mempool transactions for the next block, skipping those that
+        would not apply to the account state.
+        """
+        if self.state is not None:
+            transactions = self.mempool.select_for_block(self.max_block_bytes, next_nonce=self.state.nonce)
+            return self.state.filter_applicable(transactions)
+        return self.mempool.select_for_block(self.max_block_bytes)
+
+    def add_mined_block(self, block: Block, proof: str):
         """
-        Executes a smart contract action on the blockchain.
+        Adds a block this node mined to the chain, which runs its contract
+        calls; its transactions then leave the mempool. Returns the block
+        index, or False if the block was rejected or, because the tip moved
+        while it was being mined, only kept as a side branch. A side-branch
+        block has run no contract calls and its transactions stay in the
+        mempool.
         """
-        # Placeholder for smart contract execution logic.
-        # Would involve fetching the contract by address, executing the specified action
-        # with given parameters, and handling state changes.
-        pass
+        if not self.add_block(block, proof):
+            return False
+        if not self.block_tree.get(block.hash).active:
+            return False
+        self.mempool.remove(block.transactions)
+        return block.index
 
     # Update the mine method to include smart contract execution
     def mine(self):
         """
         Enhanced mining process that also executes smart contracts included in transactions.
+        Blocks the caller until the block is sealed; see
+        mining.mining_manager.MiningManager for mining in the background.
         """
-        if not self.unconfirmed_transactions:
+        transactions = self.select_transactions()
+        if not transactions:
             return False
 
-        # Placeholder for executing smart contracts within unconfirmed transactions
-        for transaction in self.unconfirmed_transactions:
-            if transaction.get("is_contract"):
-                self.execute_smart_contract(transaction["contract_address"],
-                                            transaction["action"], transaction["params"])
-
-        # Proceed with existing mining process
-        # Additional steps...
-
-# Consensus mechanism flexibility
-class ConsensusMechanism:
-    @staticmethod
-    def proof_of_work(blockchain, block):
-        # Implement PoW consensus algorithm
-        pass
-
-    @staticmethod
-    def proof_of_stake(blockchain, block):
-        # Implement PoS consensus algorithm
-        pass
+        last_block = self.last_block
 
-# The blockchain can now use a flexible consensus mechanism
-blockchain.consensus_mechanism = ConsensusMechanism.proof_of_work  # or .proof_of_stake
+        new_block = Block(index=last_block.index + 1,
+                          transactions=transactions,
+                          timestamp=time(),
+                          previous_hash=last_block.hash)
 
+        proof = self.proof_of_work(new_block)
+        return self.add_mined_block(new_block, proof)
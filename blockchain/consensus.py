@@ -2,52 +2,446 @@
 # blockchain/consensus.py
 
 """
-This module implements a Proof of Stake (PoS) consensus mechanism for the blockchain,
-aiming to achieve distributed consensus in a more energy-efficient manner than Proof of Work.
+Consensus engines for the blockchain. An engine seals the blocks this node
+creates, checks the seal of blocks it receives and weighs blocks for fork
+choice; Blockchain calls it for all three, so proof of work and the more
+energy-efficient proof of stake are interchangeable.
 """
 
-class ProofOfStakeConsensus:
-    def __init__(self, blockchain):
+import hashlib
+import os
+import statistics
+from time import perf_counter
+from cryptography.exceptions import InvalidSignature
+from .encoding import encode_transaction
+from .merkle import MerkleTree
+from .pow_engine import ParallelProofOfWork
+from .quantum_security import QuantumSecurity, SecurityError
+
+class ConsensusError(Exception):
+    """Raised when a block cannot be sealed under the consensus rules."""
+    pass
+
+class ConsensusAlgorithm:
+    """
+    Base class for the consensus engines the blockchain can run with.
+
+    An engine may be created without a blockchain; Blockchain attaches itself
+    when the engine is passed in.
+    """
+
+    difficulty = 0  # Leading zero hex digits a block hash must have
+
+    def __init__(self, blockchain=None):
+        self.blockchain = blockchain
+
+    def seal_block(self, block, difficulty=None):
+        """
+        Makes a newly built block valid under this engine and returns its hash.
+        difficulty overrides the engine's target where the engine has one.
+        """
+        raise NotImplementedError
+
+    def verify_block(self, block, block_hash):
+        """
+        Returns True if block_hash is the hash of block and the block carries
+        a valid seal.
+        """
+        raise NotImplementedError
+
+    def verify_header(self, block_hash):
+        """
+        Returns True if a block hash, known only from a header, can carry a
+        valid seal. Engines whose seal lives in the block body accept any.
+        """
+        return True
+
+    def is_forging_record(self, position, transaction):
+        """
+        Returns True if the transaction at position of a block is part of the
+        engine's seal, which verify_block checks, rather than a transaction
+        signed by a sender.
+        """
+        return False
+
+    def parent_seed(self, block):
+        """
+        Returns the seed a block states it inherited from its parent, or None
+        for engines that do not chain seeds. Blockchain and ChainValidator
+        check it against next_seed() of the parent.
+        """
+        return None
+
+    def next_seed(self, block):
+        """
+        Returns the seed a block passes on to its children, or None.
+        """
+        return None
+
+    def block_weight(self, entry):
+        """
+        Fork-choice weight a block adds to its branch, given its BlockIndexEntry.
+        """
+        return 1
+
+    def close(self):
+        """
+        Releases any worker processes held by the engine.
+        """
+        pass
+
+    def __getstate__(self):
+        # Validation workers receive a detached copy of the engine
+        state = dict(self.__dict__)
+        state["blockchain"] = None
+        return state
+
+class ProofOfWorkConsensus(ConsensusAlgorithm):
+    """
+    Hash-prefix proof of work. With more than one mining worker the nonce
+    space is searched in parallel by a ParallelProofOfWork pool, which is
+    started on first use and kept for later blocks.
+
+    difficulty fixes the target; otherwise it follows the attached
+    blockchain's class setting, or default_difficulty while detached.
+    """
+
+    default_difficulty = 4
+
+    def __init__(self, blockchain=None, workers=None, difficulty=None):
+        super().__init__(blockchain)
+        self.workers = workers
+        self._difficulty = difficulty
+        self._engine = None
+
+    @property
+    def difficulty(self):
+        if self._difficulty is not None:
+            return self._difficulty
+        if self.blockchain is None:
+            return self.default_difficulty
+        # Follows the Blockchain class setting, so it can be tuned globally
+        return type(self.blockchain).difficulty
+
+    @property
+    def mining_workers(self):
+        if self.workers:
+            return self.workers
+        return self.blockchain.mining_workers if self.blockchain is not None else 1
+
+    def seal_block(self, block, difficulty=None):
+        """
+        Tries nonces from 0 until the block hash meets the difficulty and
+        returns that hash; the nonce is left on the block.
+        """
+        if difficulty is None:
+            difficulty = self.difficulty
+        block.nonce = 0
+
+        if self.mining_workers > 1:
+            if self._engine is None:
+                self._engine = ParallelProofOfWork(workers=self.mining_workers)
+            nonce, computed_hash, _ = self._engine.search(block.mining_job(), difficulty)
+            block.nonce = nonce
+            return computed_hash
+
+        job = block.mining_job()
+        target = '0' * difficulty
+        computed_hash = job.hash_nonce(block.nonce)
+        while not computed_hash.startswith(target):
+            block.nonce += 1
+            computed_hash = job.hash_nonce(block.nonce)
+        return computed_hash
+
+    def verify_block(self, block, block_hash):
+        """
+        The header is rebuilt from the block's fields, so the check also
+        covers the Merkle root of its transactions.
+        """
+        return self.verify_header(block_hash) and block_hash == block.compute_hash()
+
+    def verify_header(self, block_hash):
+        return block_hash.startswith('0' * self.difficulty)
+
+    def block_weight(self, entry):
+        """
+        The expected number of hashes needed to find a block at the current
+        difficulty.
+        """
+        return 16 ** self.difficulty
+
+    def close(self):
+        if self._engine is not None:
+            self._engine.close()
+            self._engine = None
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["_difficulty"] = self.difficulty
+        state["_engine"] = None
+        return state
+
+class StakeIndex:
+    """
+    Fenwick (binary indexed) tree over stakeholder stakes. Updating a stake and
+    finding the stakeholder that covers a given point of the cumulative stake
+    are both O(log n), and the total stake is kept up to date incrementally.
+    """
+
+    def __init__(self):
+        self._tree = [0]  # 1-based Fenwick array
+        self._stakes = []  # stake per slot
+        self._addresses = []  # stakeholder address per slot
+        self._slots = {}  # stakeholder address -> slot
+        self.total = 0
+
+    def __len__(self):
+        return len(self._addresses)
+
+    def __contains__(self, address):
+        return address in self._slots
+
+    def items(self):
+        return zip(self._addresses, self._stakes)
+
+    def get(self, address, default=0):
+        slot = self._slots.get(address)
+        return default if slot is None else self._stakes[slot]
+
+    def _prefix_sum(self, position):
+        total = 0
+        while position > 0:
+            total += self._tree[position]
+            position -= position & -position
+        return total
+
+    def _append_slot(self, address):
+        position = len(self._tree)
+        # The new node covers (position - lowbit, position]; all of it except
+        # the new slot is already stored in the tree.
+        lowbit = position & -position
+        self._tree.append(self._prefix_sum(position - 1) - self._prefix_sum(position - lowbit))
+        self._slots[address] = len(self._addresses)
+        self._addresses.append(address)
+        self._stakes.append(0)
+
+    def add(self, address, amount):
+        """
+        Adds amount (which may be negative) to the stake of address.
+        """
+        if address not in self._slots:
+            self._append_slot(address)
+        slot = self._slots[address]
+        if self._stakes[slot] + amount < 0:
+            raise ValueError("Stake cannot become negative.")
+        self._stakes[slot] += amount
+        self.total += amount
+        position = slot + 1
+        while position < len(self._tree):
+            self._tree[position] += amount
+            position += position & -position
+
+    def find(self, point):
+        """
+        Returns the stakeholder whose stake interval contains point, i.e. the
+        first slot whose cumulative stake exceeds point.
+        """
+        if not 0 <= point < self.total:
+            return None
+        position = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        remaining = point
+        while step:
+            candidate = position + step
+            if candidate < len(self._tree) and self._tree[candidate] <= remaining:
+                position = candidate
+                remaining -= self._tree[candidate]
+            step >>= 1
+        return self._addresses[position] if position < len(self._addresses) else None
+
+def seed_to_fraction(seed):
+    """
+    Maps a seed (e.g. the previous block hash) to a number in [0, 1).
+    Every node derives the same value from the same seed.
+    """
+    if isinstance(seed, str):
+        seed = seed.encode()
+    return int.from_bytes(hashlib.sha256(seed).digest()[:8], "big") / 2 ** 64
+
+class ProofOfStakeConsensus(ConsensusAlgorithm):
+    """
+    Stake-weighted forger selection. The forger of each block is derived from
+    a seed chained through the blocks, and proves it forged the block with a
+    signature over the block position and contents carried in a forging
+    record, the block's first transaction. Stakeholder addresses are PEM
+    public keys.
+
+    The record also holds the seed the forger was selected with and the
+    forger's signature over it; the hash of that signature is the seed for
+    the next block. Ed25519 signatures are deterministic, so like a VRF
+    output the next seed is fixed by the forger's key and the previous seed:
+    varying the block's time or transactions does not change it, and the
+    forger cannot grind for a favourable successor. Its only influence is to
+    withhold the block, giving up the slot and its weight, so a single
+    forger can at most choose between its own successor and the one forged
+    in its place.
+    """
+
+    forging_record_fields = frozenset({"forger", "forger_signature", "seed", "seed_signature"})
+
+    def __init__(self, blockchain=None):
         """
         Initializes the consensus mechanism with a reference to the blockchain.
         """
-        self.blockchain = blockchain
-        self.stakeholders = {}  # Maps from stakeholder address to stake amount
+        super().__init__(blockchain)
+        self.stakes = StakeIndex()  # Stakeholder address -> stake amount, with prefix sums
+        self.forging_keys = {}  # Stakeholder address -> private key, for the stakeholders this node forges for
+
+    @property
+    def stakeholders(self):
+        """
+        Returns a snapshot of the stake table as a dict.
+        """
+        return dict(self.stakes.items())
 
     def add_stake(self, stakeholder_address, amount):
         """
-        Adds or updates the stake for a given stakeholder.
+        Adds or updates the stake for a given stakeholder. O(log n).
         """
-        self.stakeholders[stakeholder_address] = self.stakeholders.get(stakeholder_address, 0) + amount
+        self.stakes.add(stakeholder_address, amount)
 
-    def select_forger(self):
+    def add_forging_key(self, stakeholder_address, private_key):
         """
-        Selects the stakeholder responsible for creating the next block, based on their stake.
+        Lets this node forge the blocks assigned to stakeholder_address.
         """
-        total_stake = sum(self.stakeholders.values())
-        forging_threshold = total_stake * self.random_threshold_factor()
-        cumulative_stake = 0
-        for stakeholder, stake in self.stakeholders.items():
-            cumulative_stake += stake
-            if cumulative_stake >= forging_threshold:
-                return stakeholder
-        return None
+        self.forging_keys[stakeholder_address] = private_key
+
+    def select_forger(self, seed=None):
+        """
+        Selects the stakeholder responsible for creating the next block, with
+        probability proportional to stake. The choice is a deterministic
+        function of the seed, which defaults to the seed passed on by the
+        current tip, so every node can recompute it. O(log n).
+        """
+        if seed is None:
+            seed = self.next_seed(self.blockchain.last_block)
+        return self.stakes.find(self.stakes.total * self.random_threshold_factor(seed))
 
-    def random_threshold_factor(self):
+    def random_threshold_factor(self, seed):
         """
-        Generates a random threshold factor for selecting the forger. This is a simplified
-        placeholder for demonstration purposes.
+        Derives the selection point in [0, 1) from the verifiable seed.
         """
-        # In a real implementation, this would be a secure, verifiable random function
-        import random
-        return random.uniform(0.1, 1.0)
+        return seed_to_fraction(seed)
 
     def validate_block(self, block, forger_address):
         """
-        Validates the block by ensuring it was forged by the correct stakeholder.
+        Validates the block by ensuring it was forged by the correct stakeholder
+        for the seed it inherited.
         """
-        expected_forger = self.select_forger()
-        return expected_forger == forger_address
+        seed = self.parent_seed(block)
+        return seed is not None and self.select_forger(seed) == forger_address
+
+    def is_forging_record(self, position, transaction):
+        """
+        Only the block's first transaction can be its forging record, and it
+        carries nothing but the forger, the seeds and the forger's signatures.
+        """
+        return position == 0 and isinstance(transaction, dict) and set(transaction) == self.forging_record_fields
+
+    def parent_seed(self, block):
+        record = block.transactions[0] if block.transactions else None
+        return record["seed"] if self.is_forging_record(0, record) else None
+
+    def next_seed(self, block):
+        """
+        The genesis block passes on its hash; every other block the SHA-256 of
+        its forger's signature over the seed it inherited.
+        """
+        if block.index == 0:
+            return block.hash
+        if self.parent_seed(block) is None:
+            return None
+        try:
+            signature = bytes.fromhex(block.transactions[0]["seed_signature"])
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha256(signature).hexdigest()
+
+    @staticmethod
+    def seed_payload(seed):
+        """
+        Returns the message a forger signs to derive the next seed.
+        """
+        return f"seed:{seed}".encode()
+
+    @staticmethod
+    def forging_payload(block, transactions):
+        """
+        Returns the message a forger signs: the block's position and time and
+        the Merkle root of its transactions, not counting the forging record.
+        """
+        root = MerkleTree(encode_transaction(transaction) for transaction in transactions).root
+        return f"{block.index}:{block.previous_hash}:{block.timestamp!r}:".encode() + root
+
+    def seal_block(self, block, difficulty=None):
+        """
+        Signs the block as its selected forger and returns its hash. Raises
+        ConsensusError if this node holds no key for that forger.
+        """
+        parent = self.blockchain.get_block_by_hash(block.previous_hash)
+        if parent is None:
+            raise ConsensusError("The parent of the block is not known.")
+        seed = self.next_seed(parent)
+        forger = self.select_forger(seed)
+        private_key = self.forging_keys.get(forger)
+        if private_key is None:
+            raise ConsensusError("This node is not the selected forger for the block.")
+        signature = QuantumSecurity.sign(private_key, self.forging_payload(block, block.transactions))
+        block.transactions.insert(0, {"forger": forger, "forger_signature": signature, "seed": seed,
+                                      "seed_signature": QuantumSecurity.sign(private_key, self.seed_payload(seed))})
+        block.nonce = 0
+        return block.compute_hash()
+
+    def verify_block(self, block, block_hash):
+        """
+        Checks the hash and that the forging record is signed by the forger
+        selected with its seed. Sealed blocks carry no nonce, so the hash
+        cannot be varied. Whether the seed is the one the parent passes on
+        is checked by the caller, which has the parent.
+        """
+        if not block.transactions or block.nonce != 0 or block_hash != block.compute_hash():
+            return False
+        record = block.transactions[0]
+        if not self.is_forging_record(0, record):
+            return False
+        forger = record["forger"]
+        try:
+            if not self.validate_block(block, forger):
+                return False
+            public_key = QuantumSecurity.deserialize_public_key(forger)
+            QuantumSecurity.verify_signature(public_key, self.seed_payload(record["seed"]), record["seed_signature"])
+            return QuantumSecurity.verify_signature(public_key, self.forging_payload(block, block.transactions[1:]),
+                                                    record["forger_signature"])
+        except (InvalidSignature, SecurityError, TypeError, ValueError):
+            return False
+
+    def block_weight(self, entry):
+        """
+        Fork-choice weight of a block: the stake of the forger selected for
+        the position it extends, so the branch backed by the most stake wins.
+        The seed comes from the parent block; without one, e.g. for the
+        genesis block or a detached engine, the parent hash stands in.
+        """
+        parent = entry.parent.block if entry.parent is not None else None
+        if parent is None and self.blockchain is not None:
+            parent = self.blockchain.chain.get_by_hash(entry.previous_hash)
+        seed = self.next_seed(parent) if parent is not None else None
+        return self.stakes.get(self.select_forger(seed if seed is not None else entry.previous_hash))
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["forging_keys"] = {}  # Private keys never leave this process
+        return state
 
     def update_stakeholder_stakes(self, block):
         """
@@ -56,3 +450,86 @@ class ProofOfStakeConsensus:
         """
         # Placeholder for stake update logic
         pass
+
+class ConsensusBenchmark:
+    def __init__(self, engine, blocks, transactions, elapsed, validation_latencies, cpu_seconds):
+        self.engine = engine
+        self.blocks = blocks
+        self.transactions = transactions
+        self.elapsed = elapsed  # seconds spent creating and sealing blocks
+        self.validation_latencies = validation_latencies  # seconds per verify_block call
+        self.cpu_seconds = cpu_seconds  # including mining worker processes
+
+    @property
+    def blocks_per_second(self):
+        return self.blocks / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mean_validation_ms(self):
+        return statistics.fmean(self.validation_latencies) * 1000 if self.validation_latencies else 0.0
+
+    @property
+    def p95_validation_ms(self):
+        if len(self.validation_latencies) < 2:
+            return self.mean_validation_ms
+        return statistics.quantiles(self.validation_latencies, n=20)[-1] * 1000
+
+    @property
+    def cpu_per_block_ms(self):
+        return self.cpu_seconds / self.blocks * 1000 if self.blocks else 0.0
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def benchmark_consensus(blocks=50, transactions_per_block=100, stakeholders=16, workers=1, engines=None):
+    """
+    Mines blocks of synthetic payments with each engine and returns a
+    ConsensusBenchmark per engine name. engines maps names to engine
+    factories; by default proof of work at the chain difficulty and proof of
+    stake with stakeholders equally staked forgers whose keys are all held
+    locally, so every block can be forged.
+    """
+    from .chain import Blockchain
+
+    def staked():
+        engine = ProofOfStakeConsensus()
+        for _ in range(stakeholders):
+            private_key, address = QuantumSecurity.generate_keypair()
+            engine.add_stake(address, 100)
+            engine.add_forging_key(address, private_key)
+        return engine
+
+    if engines is None:
+        engines = {"proof-of-work": lambda: ProofOfWorkConsensus(workers=workers),
+                   "proof-of-stake": staked}
+    results = {}
+    for name, factory in engines.items():
+        engine = factory()
+        blockchain = Blockchain(mining_workers=workers, consensus=engine)
+        elapsed, latencies, transactions = 0.0, [], 0
+        cpu = _cpu_seconds()
+        for height in range(blocks):
+            for i in range(transactions_per_block):
+                blockchain.mempool.add({"sender": f"account-{i}", "recipient": "merchant", "amount": 1,
+                                        "fee": 0, "nonce": height})
+            started = perf_counter()
+            blockchain.mine()
+            elapsed += perf_counter() - started
+            block = blockchain.last_block
+            transactions += len(block.transactions)
+            started = perf_counter()
+            if not engine.verify_block(block, block.hash):
+                raise ConsensusError(f"{name} rejected its own block {block.index}.")
+            latencies.append(perf_counter() - started)
+        # Closing reaps the mining workers, so their CPU time is counted
+        blockchain.close()
+        results[name] = ConsensusBenchmark(name, blocks, transactions, elapsed, latencies,
+                                           _cpu_seconds() - cpu)
+    return results
+
+if __name__ == "__main__":
+    for result in benchmark_consensus().values():
+        print(f"{result.engine}: {result.blocks_per_second:.1f} blocks/s, "
+              f"validation {result.mean_validation_ms:.3f} ms mean / {result.p95_validation_ms:.3f} ms p95, "
+              f"CPU {result.cpu_per_block_ms:.1f} ms/block ({result.cpu_seconds:.2f}s total)")
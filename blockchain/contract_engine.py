@@ -0,0 +1,320 @@
+# UUID: 0d5f8b2e-c914-4a37-b6d0-97e1a4c3f58b
+# blockchain/contract_engine.py
+
+"""
+Execution engine for smart contracts. Each call runs against a metered view
+of the contract state: reads, writes and executed lines all consume gas, and
+a call that runs out of gas or raises is rolled back. Successful writes go
+into a per-block write-back cache, and every touched contract is persisted
+once when the block is committed instead of after every call.
+"""
+
+import copy
+import sys
+from collections import deque
+
+DEFAULT_GAS_LIMIT = 1_000_000
+GAS_PER_CALL = 100
+GAS_PER_LINE = 1
+GAS_PER_READ = 5
+GAS_PER_WRITE = 20
+
+class _Deleted:
+    """Marks a deleted key in buffered writes; unpickles to the same marker."""
+
+    def __reduce__(self):
+        return "_DELETED"
+
+_DELETED = _Deleted()
+
+class _AllKeys:
+    """Read-set entry of a call that enumerated the state; unpickles to the same marker."""
+
+    def __reduce__(self):
+        return "ALL_KEYS"
+
+ALL_KEYS = _AllKeys()
+
+class ContractError(Exception):
+    """Raised when a contract call is rejected or fails. Its state changes are discarded."""
+    pass
+
+class OutOfGas(BaseException):
+    """
+    Raised when a contract call exceeds its gas limit. It is not an Exception,
+    so contract code cannot swallow it with except Exception; callers of the
+    engine catch it together with ContractError.
+    """
+    pass
+
+class GasMeter:
+    """
+    Counts gas used by one contract call and aborts it at the limit.
+    """
+
+    def __init__(self, limit=DEFAULT_GAS_LIMIT):
+        self.limit = limit
+        self.used = 0
+
+    @property
+    def remaining(self):
+        return self.limit - self.used
+
+    def charge(self, amount):
+        self.used += amount
+        if self.used > self.limit:
+            raise OutOfGas(f"Gas limit of {self.limit} exceeded.")
+
+    def trace(self, frame, event, arg):
+        """
+        sys.settrace hook that charges GAS_PER_LINE for every executed line.
+        """
+        if event == "line":
+            self.charge(GAS_PER_LINE)
+        return self.trace
+
+class MeteredState:
+    """
+    Transactional, gas-metered view of a contract's state dictionary.
+
+    Writes are buffered until the engine commits the call, and the keys read
+    and written are recorded. Top-level keys are the unit of tracking, so contracts should
+    assign values rather than mutate nested objects in place.
+    """
+
+    def __init__(self, base, meter):
+        self._base = base
+        self._meter = meter
+        self._writes = {}
+        self.read_set = set()
+
+    @property
+    def write_set(self):
+        return set(self._writes)
+
+    @property
+    def writes(self):
+        """
+        Returns the buffered writes; deleted keys map to a deletion marker.
+        """
+        return dict(self._writes)
+
+    def _lookup(self, key):
+        self._meter.charge(GAS_PER_READ)
+        if key in self._writes:
+            return self._writes[key]
+        self.read_set.add(key)
+        return self._base.get(key, _DELETED)
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _DELETED else value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _DELETED
+
+    def __setitem__(self, key, value):
+        self._meter.charge(GAS_PER_WRITE)
+        self._writes[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._meter.charge(GAS_PER_WRITE)
+        self._writes[key] = _DELETED
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def keys(self):
+        self._meter.charge(GAS_PER_READ * (len(self._base) + len(self._writes)))
+        # Enumerating the state depends on every key, including ones added later
+        self.read_set.add(ALL_KEYS)
+        keys = (set(self._base) | set(self._writes))
+        # Sorted, so a contract sees the same order on every node whatever its hash seed
+        return sorted(key for key in keys if self._writes.get(key, self._base.get(key)) is not _DELETED)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+class ExecutionReceipt:
+    def __init__(self, address, action, result, gas_used, error=None):
+        self.address = address
+        self.action = action
+        self.result = result
+        self.gas_used = gas_used
+        self.error = error
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+class ContractEngine:
+    """
+    Runs contract calls for the blockchain.
+
+    Deployed contract instances are cached by address together with their
+    loaded state. The first time a contract is touched in a block its state is
+    copied so the block can be rolled back; commit_block() persists each
+    touched contract once and rollback_block() restores the copies. The copies
+    of the last max_undo_blocks committed blocks are kept so revert_blocks()
+    can undo blocks disconnected in a reorganisation.
+    """
+
+    def __init__(self, blockchain, default_gas_limit=DEFAULT_GAS_LIMIT, max_undo_blocks=256):
+        self.blockchain = blockchain
+        self.default_gas_limit = default_gas_limit
+        self.contracts = {}
+        self._dispatch_tables = {}
+        self._block_originals = {}  # address -> state before the current block
+        self._undo = deque(maxlen=max_undo_blocks)  # (height, originals) per committed block
+
+    def deploy(self, contract):
+        """
+        Registers a contract instance so calls to its address are routed to it.
+        """
+        self.contracts[contract.address] = contract
+        return contract
+
+    def get_contract(self, address):
+        contract = self.contracts.get(address)
+        if contract is None:
+            raise ContractError(f"No contract deployed at {address}.")
+        return contract
+
+    def _dispatch_table(self, contract_class):
+        """
+        Returns the callable actions of a contract class: its public methods
+        that are not part of the SmartContract base class.
+        """
+        table = self._dispatch_tables.get(contract_class)
+        if table is None:
+            from .smart_contracts import SmartContract
+            reserved = set(dir(SmartContract))
+            table = {name: getattr(contract_class, name) for name in dir(contract_class)
+                     if not name.startswith("_") and name not in reserved
+                     and callable(getattr(contract_class, name))}
+            self._dispatch_tables[contract_class] = table
+        return table
+
+    def run(self, address, action, params, signature=None, gas_limit=None):
+        """
+        Runs one action against a metered view of the contract state and
+        returns (result, metered_state, gas_used) without committing the writes.
+
+        The action runs on a shallow copy of the contract whose state is the
+        metered view, so the shared instance is never modified and several
+        calls can run concurrently against the same pre-block state.
+        """
+        contract = self.get_contract(address)
+        if not contract.verify_signature(action, params, signature):
+            raise ContractError("Invalid signature")
+        method = self._dispatch_table(type(contract)).get(action)
+        if method is None:
+            raise ContractError(f"Action {action} not found in contract.")
+        meter = GasMeter(gas_limit or self.default_gas_limit)
+        meter.charge(GAS_PER_CALL)
+        state = MeteredState(contract.state, meter)
+        runner = copy.copy(contract)
+        runner.state = state
+        previous_trace = sys.gettrace()
+        sys.settrace(meter.trace)
+        try:
+            result = method(runner, **params)
+        except (ContractError, OutOfGas):
+            raise
+        except Exception as e:
+            raise ContractError(f"Action {action} failed: {e}") from e
+        finally:
+            sys.settrace(previous_trace)
+        # A contract that caught OutOfGas anyway also lost its trace hook
+        if meter.used > meter.limit:
+            raise OutOfGas(f"Gas limit of {meter.limit} exceeded.")
+        return result, state, meter.used
+
+    def commit_call(self, address, writes):
+        """
+        Applies a successful call's writes to the cached contract state,
+        remembering the pre-block state the first time the contract changes.
+        """
+        contract = self.contracts[address]
+        if writes and address not in self._block_originals:
+            self._block_originals[address] = dict(contract.state)
+        for key, value in writes.items():
+            if value is _DELETED:
+                contract.state.pop(key, None)
+            else:
+                contract.state[key] = value
+
+    def execute(self, address, action, params, signature=None, gas_limit=None):
+        """
+        Executes a contract action and returns an ExecutionReceipt.
+        Raises ContractError (or OutOfGas) after discarding the call's writes.
+        """
+        result, state, gas_used = self.run(address, action, params, signature, gas_limit)
+        self.commit_call(address, state.writes)
+        self.contracts[address].log_event(action, params)
+        return ExecutionReceipt(address, action, result, gas_used)
+
+    def commit_block(self, height=None):
+        """
+        Persists every contract whose state changed in this block, once each,
+        and commits the block's events. With the block's height, its undo data
+        is kept for revert_blocks().
+        """
+        for address in self._block_originals:
+            self.contracts[address].save_contract_state()
+        if height is not None and self._block_originals:
+            self._undo.append((height, self._block_originals))
+        self._block_originals = {}
+        event_log = getattr(self.blockchain, "event_log", None)
+        if event_log is not None:
+            event_log.commit_block()
+
+    def rollback_block(self):
+        """
+        Restores every contract touched in this block to its state before the
+        block and drops the block's events.
+        """
+        for address, original in self._block_originals.items():
+            state = self.contracts[address].state
+            state.clear()
+            state.update(original)
+        self._block_originals.clear()
+        event_log = getattr(self.blockchain, "event_log", None)
+        if event_log is not None:
+            event_log.discard_block()
+
+    def revert_blocks(self, height):
+        """
+        Undoes the committed blocks at height and above, e.g. blocks
+        disconnected in a reorganisation: their contracts get back their
+        earlier state and their events are dropped.
+        """
+        reverted = set()
+        while self._undo and self._undo[-1][0] >= height:
+            _, originals = self._undo.pop()
+            for address, original in originals.items():
+                state = self.contracts[address].state
+                state.clear()
+                state.update(original)
+                reverted.add(address)
+        for address in reverted:
+            self.contracts[address].save_contract_state()
+        event_log = getattr(self.blockchain, "event_log", None)
+        if event_log is not None:
+            event_log.truncate(height)
@@ -0,0 +1,356 @@
+# UUID: 3f9c6e21-84ad-4b7f-a052-d6e8b1c47a93
+# blockchain/encoding.py
+
+"""
+Canonical binary encoding for transactions and blocks.
+
+A transaction is a version byte, a presence mask and its standard fields in
+a fixed order, so field names are never stored; any other fields (e.g. those
+of contract calls) follow as a key-sorted dictionary. Values are tagged and
+length-prefixed, which makes the encoding unambiguous: the same transaction
+always produces the same bytes, and those bytes are what gets signed, hashed
+into transaction ids and Merkle leaves, and stored.
+
+A block is a fixed-size header followed by its length-prefixed transactions.
+Decoders work on any buffer through memoryview and slice it without copying,
+so blocks can be decoded straight from a mapped segment file.
+"""
+
+import struct
+from hashlib import sha256
+
+TRANSACTION_VERSION = 1
+# Standard transaction fields in encoding order; bit i of the mask marks field i
+TRANSACTION_FIELDS = ("sender", "recipient", "amount", "fee", "nonce", "signature")
+EXTRA_FIELDS = 0x80
+
+# Block header: index, previous hash, hash, timestamp, nonce, transaction count
+BLOCK_HEADER = struct.Struct(">Q32s32sdQI")
+LENGTH = struct.Struct(">I")
+INT64 = struct.Struct(">q")
+FLOAT64 = struct.Struct(">d")
+MAX_DEPTH = 64  # deepest nesting of lists and dictionaries a decoder accepts
+
+class EncodingError(Exception):
+    """Raised when a value cannot be encoded or a buffer is not a valid encoding."""
+    pass
+
+def _encode_str(value, out, depth=0):
+    data = value.encode()
+    out += b"s"
+    out += LENGTH.pack(len(data))
+    out += data
+
+def _encode_int(value, out, depth=0):
+    if -2 ** 63 <= value < 2 ** 63:
+        out += b"i"
+        out += INT64.pack(value)
+    else:
+        data = value.to_bytes((value.bit_length() + 8) // 8, "big", signed=True)
+        out += b"I"
+        out += LENGTH.pack(len(data))
+        out += data
+
+def _encode_float(value, out, depth=0):
+    out += b"f"
+    out += FLOAT64.pack(value)
+
+def _encode_bytes(value, out, depth=0):
+    out += b"b"
+    out += LENGTH.pack(len(value))
+    out += value
+
+def _encode_list(value, out, depth=0):
+    if depth >= MAX_DEPTH:
+        raise EncodingError(f"Value is nested more than {MAX_DEPTH} levels deep.")
+    out += b"l"
+    out += LENGTH.pack(len(value))
+    for item in value:
+        encode_value(item, out, depth + 1)
+
+def _encode_dict(value, out, depth=0):
+    if depth >= MAX_DEPTH:
+        raise EncodingError(f"Value is nested more than {MAX_DEPTH} levels deep.")
+    out += b"d"
+    out += LENGTH.pack(len(value))
+    for key in sorted(value):
+        if not isinstance(key, str):
+            raise EncodingError(f"Dictionary keys must be strings, got {type(key).__name__}.")
+        _encode_str(key, out)
+        encode_value(value[key], out, depth + 1)
+
+_ENCODERS = {
+    str: _encode_str,
+    int: _encode_int,
+    float: _encode_float,
+    bytes: _encode_bytes,
+    list: _encode_list,
+    tuple: _encode_list,
+    dict: _encode_dict,
+}
+
+def encode_value(value, out, depth=0):
+    """
+    Appends the canonical encoding of a JSON-like value to the bytearray out.
+    depth is the nesting level of the value, as in decode_value().
+    """
+    if value is None:
+        out += b"N"
+    elif value is True:
+        out += b"T"
+    elif value is False:
+        out += b"F"
+    else:
+        encoder = _ENCODERS.get(type(value))
+        if encoder is None:
+            raise EncodingError(f"Cannot encode values of type {type(value).__name__}.")
+        encoder(value, out, depth)
+
+def _encode_signature(value, out):
+    # Hex signatures are stored as raw bytes and decoded back to lowercase hex
+    if isinstance(value, str):
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            raw = None
+        if raw is not None and raw.hex() == value:
+            out += b"x"
+            out += LENGTH.pack(len(raw))
+            out += raw
+            return
+    encode_value(value, out)
+
+def decode_value(view, offset, depth=0):
+    """
+    Decodes one value from a memoryview and returns (value, next_offset).
+    depth is the nesting level of the value; lists and dictionaries nested
+    deeper than MAX_DEPTH are rejected.
+    """
+    try:
+        tag = view[offset]
+        offset += 1
+        if tag == 0x73:  # s
+            length, = LENGTH.unpack_from(view, offset)
+            start = offset + LENGTH.size
+            if start + length > len(view):
+                raise EncodingError("Value extends past the end of the buffer.")
+            return str(view[start:start + length], "utf-8"), start + length
+        if tag == 0x69:  # i
+            return INT64.unpack_from(view, offset)[0], offset + INT64.size
+        if tag == 0x66:  # f
+            return FLOAT64.unpack_from(view, offset)[0], offset + FLOAT64.size
+        if tag == 0x4e:  # N
+            return None, offset
+        if tag == 0x54:  # T
+            return True, offset
+        if tag == 0x46:  # F
+            return False, offset
+        if tag in (0x62, 0x78, 0x49):  # b, x, I
+            length, = LENGTH.unpack_from(view, offset)
+            start = offset + LENGTH.size
+            data = view[start:start + length]
+            if len(data) != length:
+                raise EncodingError("Value extends past the end of the buffer.")
+            if tag == 0x62:
+                value = bytes(data)
+            elif tag == 0x78:
+                value = data.hex()
+            else:
+                value = int.from_bytes(data, "big", signed=True)
+            return value, start + length
+        if tag in (0x6c, 0x64) and depth >= MAX_DEPTH:
+            raise EncodingError(f"Value is nested more than {MAX_DEPTH} levels deep.")
+        if tag == 0x6c:  # l
+            count, = LENGTH.unpack_from(view, offset)
+            offset += LENGTH.size
+            items = []
+            for _ in range(count):
+                item, offset = decode_value(view, offset, depth + 1)
+                items.append(item)
+            return items, offset
+        if tag == 0x64:  # d
+            count, = LENGTH.unpack_from(view, offset)
+            offset += LENGTH.size
+            items = {}
+            for _ in range(count):
+                if view[offset] != 0x73:
+                    raise EncodingError("Dictionary keys must be strings.")
+                key, offset = decode_value(view, offset, depth + 1)
+                items[key], offset = decode_value(view, offset, depth + 1)
+            return items, offset
+    except (IndexError, struct.error, UnicodeDecodeError) as e:
+        raise EncodingError(f"Truncated or malformed value: {e}")
+    raise EncodingError(f"Unknown value tag {tag:#x}.")
+
+def encode_transaction(transaction, include_signature=True):
+    """
+    Returns the canonical bytes of a transaction, given as a dictionary or as
+    an object with to_dict(). Without include_signature the signature field
+    is left out, which gives the message the sender signs.
+    """
+    if not isinstance(transaction, dict):
+        transaction = transaction.to_dict() if hasattr(transaction, "to_dict") else vars(transaction)
+    out = bytearray(2)
+    out[0] = TRANSACTION_VERSION
+    mask = 0
+    standard = 0
+    for bit, field in enumerate(TRANSACTION_FIELDS):
+        if field not in transaction:
+            continue
+        standard += 1
+        if field != "signature":
+            encode_value(transaction[field], out)
+        elif include_signature:
+            _encode_signature(transaction[field], out)
+        else:
+            continue
+        mask |= 1 << bit
+    if len(transaction) > standard:
+        extra = {key: value for key, value in transaction.items() if key not in TRANSACTION_FIELDS}
+        if extra:
+            _encode_dict(extra, out)
+            mask |= EXTRA_FIELDS
+    out[1] = mask
+    return bytes(out)
+
+def decode_transaction(buffer, offset=0):
+    """
+    Decodes a transaction dictionary from any buffer and returns
+    (transaction, next_offset).
+    """
+    view = buffer if isinstance(buffer, memoryview) else memoryview(buffer)
+    if len(view) < offset + 2:
+        raise EncodingError("Truncated transaction.")
+    if view[offset] != TRANSACTION_VERSION:
+        raise EncodingError(f"Unsupported transaction version {view[offset]}.")
+    mask = view[offset + 1]
+    offset += 2
+    transaction = {}
+    for bit, field in enumerate(TRANSACTION_FIELDS):
+        if mask & (1 << bit):
+            transaction[field], offset = decode_value(view, offset)
+    if mask & EXTRA_FIELDS:
+        extra, offset = decode_value(view, offset)
+        if not isinstance(extra, dict):
+            raise EncodingError("Extra transaction fields must be a dictionary.")
+        transaction.update(extra)
+    return transaction, offset
+
+def transaction_hash(transaction):
+    """
+    Returns the id of a transaction: the SHA-256 of its canonical bytes.
+    """
+    return sha256(encode_transaction(transaction)).hexdigest()
+
+def encode_block(block, encoded_transactions=None):
+    """
+    Returns the canonical bytes of a block: its header followed by its
+    length-prefixed transactions. Already encoded transactions can be passed
+    in to avoid encoding them again.
+    """
+    from .chain import hash_to_bytes
+
+    if encoded_transactions is None:
+        encoded_transactions = [encode_transaction(transaction) for transaction in block.transactions]
+    parts = [BLOCK_HEADER.pack(block.index, hash_to_bytes(block.previous_hash), hash_to_bytes(block.hash),
+                               block.timestamp, block.nonce, len(encoded_transactions))]
+    for data in encoded_transactions:
+        parts.append(LENGTH.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+def decode_block(buffer, offset=0):
+    """
+    Decodes a block from any buffer. Returns (fields, transaction_slices,
+    next_offset), where fields has the keys of Block.to_dict() and
+    transaction_slices are memoryview slices of the encoded transactions,
+    ready to be hashed as Merkle leaves without encoding them again.
+    """
+    view = buffer if isinstance(buffer, memoryview) else memoryview(buffer)
+    try:
+        index, previous_hash, block_hash, timestamp, nonce, count = BLOCK_HEADER.unpack_from(view, offset)
+    except struct.error as e:
+        raise EncodingError(f"Truncated block header: {e}")
+    offset += BLOCK_HEADER.size
+    transactions = []
+    slices = []
+    for _ in range(count):
+        try:
+            length, = LENGTH.unpack_from(view, offset)
+        except struct.error as e:
+            raise EncodingError(f"Truncated block: {e}")
+        start = offset + LENGTH.size
+        offset = start + length
+        data = view[start:offset]
+        transaction, end = decode_transaction(data)
+        if end != length:
+            raise EncodingError("Transaction length does not match its encoding.")
+        transactions.append(transaction)
+        slices.append(data)
+    fields = {
+        "index": index,
+        "transactions": transactions,
+        "timestamp": timestamp,
+        # The genesis block links to the placeholder hash "0"
+        "previous_hash": "0" if index == 0 and not any(previous_hash) else previous_hash.hex(),
+        "nonce": nonce,
+        "hash": block_hash.hex(),
+    }
+    return fields, slices, offset
+
+def benchmark_encoding(count=50000, senders=100):
+    """
+    Compares the dict/JSON path with slotted transactions and the binary
+    encoding. Returns {path: (resident_bytes, encode_seconds, decode_seconds,
+    encoded_bytes)} for count transactions.
+    """
+    import gc
+    import json
+    import tracemalloc
+    from time import perf_counter
+    from .chain import Transaction
+
+    sender_keys = [f"-----BEGIN PUBLIC KEY-----\nMCowBQYDK2VwAyEA{i:032d}=\n-----END PUBLIC KEY-----\n"
+                   for i in range(senders)]
+    signature = "ab" * 64
+
+    def build_dicts():
+        return [{"sender": sender_keys[i % senders], "recipient": sender_keys[(i + 1) % senders],
+                 "amount": i, "fee": i % 7, "nonce": i // senders, "signature": signature} for i in range(count)]
+
+    def build_objects():
+        return [Transaction(sender_keys[i % senders], sender_keys[(i + 1) % senders], i, signature,
+                            i % 7, i // senders) for i in range(count)]
+
+    def measure_memory(build):
+        gc.collect()
+        tracemalloc.start()
+        objects = build()
+        resident, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return objects, resident
+
+    results = {}
+    transactions, resident = measure_memory(build_dicts)
+    started = perf_counter()
+    encoded = [json.dumps(transaction, sort_keys=True).encode() for transaction in transactions]
+    encode_seconds = perf_counter() - started
+    started = perf_counter()
+    for data in encoded:
+        json.loads(data)
+    results["dict/json"] = (resident, encode_seconds, perf_counter() - started, sum(map(len, encoded)))
+
+    transactions, resident = measure_memory(build_objects)
+    started = perf_counter()
+    encoded = [transaction.to_bytes() for transaction in transactions]
+    encode_seconds = perf_counter() - started
+    started = perf_counter()
+    for data in encoded:
+        Transaction.from_bytes(data)
+    results["slots/binary"] = (resident, encode_seconds, perf_counter() - started, sum(map(len, encoded)))
+    return results
+
+if __name__ == "__main__":
+    for path, (resident, encode_seconds, decode_seconds, size) in benchmark_encoding().items():
+        print(f"{path:>12}: {resident / 2 ** 20:6.1f} MiB resident, {size / 2 ** 20:5.1f} MiB encoded, "
+              f"encode {encode_seconds:.3f}s, decode {decode_seconds:.3f}s")
@@ -0,0 +1,188 @@
+# UUID: b5e18d3a-7f26-4c90-8e4b-1d9a6c2f07e3
+# blockchain/events.py
+
+"""
+Structured contract event log. Events are buffered in memory while a block
+executes and are written in batches as JSON lines to an append-only file.
+Indexes by contract address, action name and (contract, action) pair hold
+event ids in emission order; because events are emitted block by block, the
+block heights of consecutive ids never decrease, so a block range maps to an
+id range with two binary searches.
+"""
+
+import json
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+
+class EventLog:
+    """
+    Append-only, indexed log of contract events.
+
+    Without a path, flushed events stay in memory. With a path, existing
+    events are re-indexed on open and flushed events are read back from the
+    file on demand.
+    """
+
+    def __init__(self, path=None, flush_every=1024):
+        self.path = path
+        self.flush_every = flush_every
+        self._heights = array("q")  # block height per event id
+        self._offsets = array("Q")  # file offset per flushed event id
+        self._flushed = []  # flushed events when there is no file
+        self._pending = []  # events not yet written
+        self._committed = 0  # pending events that belong to committed blocks
+        self._by_contract = {}
+        self._by_action = {}
+        self._by_pair = {}
+        self.height = 0  # block height assigned to emitted events
+        self._file = None
+        if path is not None:
+            self._open(path)
+
+    def _open(self, path):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                offset = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn final write
+                    self._index(json.loads(line))
+                    self._offsets.append(offset)
+                    offset += len(line)
+            with open(path, "ab") as f:
+                f.truncate(offset)
+        self._file = open(path, "ab+")
+
+    def __len__(self):
+        return len(self._heights)
+
+    def _index(self, event):
+        event_id = len(self._heights)
+        if self._heights and event["block"] < self._heights[-1]:
+            raise ValueError("Events must be emitted in block order.")
+        self._heights.append(event["block"])
+        self._by_contract.setdefault(event["contract"], []).append(event_id)
+        self._by_action.setdefault(event["action"], []).append(event_id)
+        self._by_pair.setdefault((event["contract"], event["action"]), []).append(event_id)
+
+    def begin_block(self, height):
+        """
+        Sets the block height recorded for subsequently emitted events.
+        """
+        self.height = height
+
+    def emit(self, contract, action, params, block=None):
+        """
+        Buffers an event and indexes it immediately; no I/O happens here.
+        """
+        event = {"id": len(self._heights), "contract": contract, "action": action,
+                 "params": params, "block": self.height if block is None else block}
+        self._index(event)
+        self._pending.append(event)
+        return event["id"]
+
+    def commit_block(self):
+        """
+        Marks the buffered events as belonging to a committed block and
+        flushes once enough of them have accumulated.
+        """
+        self._committed = len(self._pending)
+        if self._committed >= self.flush_every:
+            self.flush()
+
+    def discard_block(self):
+        """
+        Drops the events of a block that was not committed.
+        """
+        discarded = self._pending[self._committed:]
+        del self._pending[self._committed:]
+        for event in reversed(discarded):
+            self._heights.pop()
+            self._by_contract[event["contract"]].pop()
+            self._by_action[event["action"]].pop()
+            self._by_pair[(event["contract"], event["action"])].pop()
+
+    def truncate(self, height):
+        """
+        Drops the events of blocks at height and above, including ones
+        already written to the file.
+        """
+        first_id = bisect_left(self._heights, height)
+        if first_id == len(self._heights):
+            return
+        for index in (self._by_contract, self._by_action, self._by_pair):
+            for ids in index.values():
+                del ids[bisect_left(ids, first_id):]
+        del self._heights[first_id:]
+        flushed = len(self._offsets) if self._file is not None else len(self._flushed)
+        if first_id >= flushed:
+            del self._pending[first_id - flushed:]
+            self._committed = min(self._committed, len(self._pending))
+            return
+        self._pending = []
+        self._committed = 0
+        if self._file is None:
+            del self._flushed[first_id:]
+        else:
+            self._file.truncate(self._offsets[first_id])
+            del self._offsets[first_id:]
+
+    def flush(self):
+        """
+        Writes all committed buffered events in a single append.
+        """
+        events, self._pending = self._pending[:self._committed], self._pending[self._committed:]
+        self._committed = 0
+        if not events:
+            return
+        if self._file is None:
+            self._flushed.extend(events)
+            return
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        lines = []
+        for event in events:
+            line = (json.dumps(event, sort_keys=True) + "\n").encode()
+            self._offsets.append(offset)
+            offset += len(line)
+            lines.append(line)
+        self._file.write(b"".join(lines))
+        self._file.flush()
+
+    def get(self, event_id):
+        """
+        Returns the event with the given id.
+        """
+        flushed = len(self._offsets) if self._file is not None else len(self._flushed)
+        if event_id >= flushed:
+            return self._pending[event_id - flushed]
+        if self._file is None:
+            return self._flushed[event_id]
+        self._file.seek(self._offsets[event_id])
+        return json.loads(self._file.readline())
+
+    def query(self, contract=None, action=None, from_block=None, to_block=None):
+        """
+        Returns the events matching every given filter, in emission order.
+        Block bounds are inclusive.
+        """
+        if contract is not None and action is not None:
+            ids = self._by_pair.get((contract, action), [])
+        elif contract is not None:
+            ids = self._by_contract.get(contract, [])
+        elif action is not None:
+            ids = self._by_action.get(action, [])
+        else:
+            ids = range(len(self._heights))
+
+        first_id = 0 if from_block is None else bisect_left(self._heights, from_block)
+        last_id = len(self._heights) if to_block is None else bisect_right(self._heights, to_block)
+        return [self.get(event_id) for event_id in ids[bisect_left(ids, first_id):bisect_left(ids, last_id)]]
+
+    def close(self):
+        if self._file is not None:
+            self._committed = len(self._pending)
+            self.flush()
+            self._file.close()
+            self._file = None
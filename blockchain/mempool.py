@@ -0,0 +1,152 @@
+# UUID: 2a6d91c8-f4e3-4b57-8d0a-b39e17c6f520
+# blockchain/mempool.py
+
+"""
+Pool of unconfirmed transactions. Transactions are indexed by hash for O(1)
+duplicate detection, queued per sender by nonce, and prioritised by fee rate
+(fee per byte of canonical encoding). When the pool exceeds its byte budget the
+lowest-priority transactions are evicted.
+"""
+
+import hashlib
+import heapq
+import itertools
+from .encoding import encode_transaction, transaction_hash
+
+def transaction_id(transaction):
+    """
+    Returns the hash identifying a transaction dictionary.
+    """
+    return transaction_hash(transaction)
+
+class MempoolEntry:
+    __slots__ = ("txid", "transaction", "sender", "nonce", "fee", "size", "fee_rate", "sequence")
+
+    def __init__(self, txid, transaction, size, sequence):
+        self.txid = txid
+        self.transaction = transaction
+        self.sender = transaction.get("sender")
+        self.nonce = transaction.get("nonce", 0)
+        self.fee = transaction.get("fee", 0)
+        self.size = size
+        self.fee_rate = self.fee / size
+        self.sequence = sequence
+
+class Mempool:
+    """
+    Fee- and nonce-ordered transaction pool with a memory bound.
+
+    A transaction that reuses a pooled (sender, nonce) pair replaces the pooled
+    one only if it pays a higher fee rate. Evicting a transaction also evicts
+    the sender's later nonces, which could no longer be included.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = {}  # txid -> MempoolEntry
+        self._by_sender = {}  # sender -> {nonce: MempoolEntry}
+        self._eviction_heap = []  # (fee_rate, -sequence, txid), lazily pruned
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, txid):
+        return txid in self._entries
+
+    def __iter__(self):
+        return (entry.transaction for entry in self._entries.values())
+
+    def get(self, txid):
+        entry = self._entries.get(txid)
+        return None if entry is None else entry.transaction
+
+    def add(self, transaction):
+        """
+        Adds a transaction dictionary. Returns False if it is a duplicate, loses
+        against the pooled transaction with the same sender and nonce, or is
+        immediately evicted because it has the lowest priority in a full pool.
+        """
+        serialized = encode_transaction(transaction)
+        txid = hashlib.sha256(serialized).hexdigest()
+        if txid in self._entries:
+            return False
+
+        entry = MempoolEntry(txid, transaction, len(serialized), next(self._sequence))
+        queue = self._by_sender.setdefault(entry.sender, {})
+        existing = queue.get(entry.nonce)
+        if existing is not None:
+            if entry.fee_rate <= existing.fee_rate:
+                return False
+            self._discard(existing)
+            queue = self._by_sender.setdefault(entry.sender, {})
+
+        queue[entry.nonce] = entry
+        self._entries[txid] = entry
+        self.total_bytes += entry.size
+        heapq.heappush(self._eviction_heap, (entry.fee_rate, -entry.sequence, txid))
+
+        self._enforce_limit()
+        return txid in self._entries
+
+    def _discard(self, entry):
+        del self._entries[entry.txid]
+        self.total_bytes -= entry.size
+        queue = self._by_sender[entry.sender]
+        del queue[entry.nonce]
+        if not queue:
+            del self._by_sender[entry.sender]
+
+    def _enforce_limit(self):
+        while self.total_bytes > self.max_bytes and self._eviction_heap:
+            _, _, txid = heapq.heappop(self._eviction_heap)
+            entry = self._entries.get(txid)
+            if entry is None:
+                continue
+            queue = self._by_sender[entry.sender]
+            for nonce in sorted(n for n in queue if n >= entry.nonce):
+                self._discard(queue[nonce])
+        # Drop stale heap records once they dominate the heap
+        if len(self._eviction_heap) > 2 * len(self._entries) + 64:
+            self._eviction_heap = [item for item in self._eviction_heap if item[2] in self._entries]
+            heapq.heapify(self._eviction_heap)
+
+    def remove(self, transactions):
+        """
+        Removes transactions, e.g. once they are confirmed in a block.
+        """
+        for transaction in transactions:
+            entry = self._entries.get(transaction_id(transaction))
+            if entry is not None:
+                self._discard(entry)
+
+    def select_for_block(self, max_bytes, max_count=None, next_nonce=None):
+        """
+        Picks transactions for a new block without removing them from the pool.
+
+        Senders are served by fee rate, each sender strictly in nonce order
+        and stopping at the first gap. A sender starts at next_nonce(sender)
+        if given (e.g. from the account state), otherwise at its lowest pooled
+        nonce. The selection fills at most max_bytes of serialized transactions.
+        """
+        ready = []
+        for sender, queue in self._by_sender.items():
+            entry = queue.get(next_nonce(sender)) if next_nonce is not None else queue[min(queue)]
+            if entry is not None:
+                ready.append((-entry.fee_rate, entry.sequence, entry))
+        heapq.heapify(ready)
+
+        selected = []
+        used_bytes = 0
+        while ready and (max_count is None or len(selected) < max_count):
+            _, _, entry = heapq.heappop(ready)
+            if used_bytes + entry.size > max_bytes:
+                # Later nonces of this sender depend on this one, so skip the sender
+                continue
+            selected.append(entry.transaction)
+            used_bytes += entry.size
+            successor = self._by_sender[entry.sender].get(entry.nonce + 1)
+            if successor is not None:
+                heapq.heappush(ready, (-successor.fee_rate, successor.sequence, successor))
+        return selected
@@ -0,0 +1,138 @@
+# UUID: 9f2c4e71-0d3b-4a8e-b6c5-71e2a9d40f18
+# blockchain/merkle.py
+
+"""
+Merkle trees over block transactions. Leaves and interior nodes are hashed
+with distinct prefixes so an interior node can never be passed off as a leaf.
+A node without a sibling is promoted to the next level unchanged.
+
+The tree keeps every interior node, so appending a transaction only rehashes
+the path from the new leaf to the root, and inclusion proofs hold one sibling
+digest per level.
+"""
+
+from hashlib import sha256
+
+EMPTY_ROOT = bytes(32)
+
+def hash_leaf(data):
+    """
+    Hashes the serialized bytes of a single transaction.
+    """
+    return sha256(b"\x00" + data).digest()
+
+def hash_node(left, right):
+    """
+    Hashes two child digests into their parent digest.
+    """
+    return sha256(b"\x01" + left + right).digest()
+
+class MerkleProof:
+    """
+    Inclusion proof for the leaf at position index in a tree of size leaves.
+    """
+
+    def __init__(self, index, size, siblings):
+        self.index = index
+        self.size = size
+        self.siblings = siblings
+
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "size": self.size,
+            "siblings": [sibling.hex() for sibling in self.siblings]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["index"], data["size"], [bytes.fromhex(sibling) for sibling in data["siblings"]])
+
+class MerkleTree:
+    """
+    Incrementally built Merkle tree with cached interior nodes.
+    """
+
+    def __init__(self, leaves=()):
+        self._levels = [[]]
+        for leaf in leaves:
+            self.append(leaf)
+
+    def __len__(self):
+        return len(self._levels[0])
+
+    @property
+    def root(self):
+        """
+        Returns the current root digest; an empty tree has an all-zero root.
+        """
+        if not self._levels[0]:
+            return EMPTY_ROOT
+        return self._levels[-1][0]
+
+    def append(self, data):
+        """
+        Adds a serialized transaction as the next leaf and updates the
+        interior nodes on its path to the root. O(log n).
+        """
+        self._levels[0].append(hash_leaf(data))
+        depth = 0
+        while len(self._levels[depth]) > 1:
+            level = self._levels[depth]
+            position = (len(level) - 1) // 2
+            left = level[2 * position]
+            parent = hash_node(left, level[2 * position + 1]) if 2 * position + 1 < len(level) else left
+            if depth + 1 == len(self._levels):
+                self._levels.append([])
+            upper = self._levels[depth + 1]
+            if position < len(upper):
+                upper[position] = parent
+            else:
+                upper.append(parent)
+            depth += 1
+
+    def proof(self, index):
+        """
+        Builds the inclusion proof for the leaf at the given position.
+        """
+        size = len(self)
+        if not 0 <= index < size:
+            raise IndexError("Leaf index out of range.")
+        siblings = []
+        position = index
+        for level in self._levels[:-1]:
+            if position % 2:
+                siblings.append(level[position - 1])
+            elif position + 1 < len(level):
+                siblings.append(level[position + 1])
+            position //= 2
+        return MerkleProof(index, size, siblings)
+
+def verify_proof(data, proof, root):
+    """
+    Checks that the serialized transaction is included under the given root.
+    """
+    if not 0 <= proof.index < proof.size:
+        return False
+    digest = hash_leaf(data)
+    position, width = proof.index, proof.size
+    siblings = iter(proof.siblings)
+    try:
+        while width > 1:
+            if position % 2:
+                digest = hash_node(next(siblings), digest)
+            elif position + 1 < width:
+                digest = hash_node(digest, next(siblings))
+            position //= 2
+            width = (width + 1) // 2
+    except StopIteration:
+        return False
+    if next(siblings, None) is not None:
+        return False
+    return digest == root
+
+def merkle_root(leaves):
+    """
+    Computes the Merkle root of a list of serialized transactions.
+    """
+    return MerkleTree(leaves).root
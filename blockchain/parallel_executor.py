@@ -0,0 +1,164 @@
+# UUID: 6c2a9f47-e81b-4d35-a0c9-58f3b1e7d264
+# blockchain/parallel_executor.py
+
+"""
+Optimistic parallel execution of a block's contract calls.
+
+Every call is first run speculatively against the pre-block contract state,
+in parallel, while its read and write sets are recorded. The results are then
+committed in block order: a call whose read set overlaps a key written by an
+earlier call of the same block, or that enumerated the keys of a contract an
+earlier call wrote to, saw stale data, so only that call is re-executed
+against the committed state. Calls without conflicts commit their
+speculative writes directly, which makes the final state identical to serial
+execution in block order.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+from .contract_engine import ALL_KEYS, ContractError, ExecutionReceipt, OutOfGas
+
+# Engine and calls inherited by forked worker processes
+_speculation = None
+
+def _speculate(engine, call):
+    """
+    Runs one call against the pre-block state. Returns (result, read_set,
+    writes, gas_used, error) without committing anything. A call missing its
+    address, action or parameters fails like any other rejected call.
+    """
+    try:
+        result, state, gas_used = engine.run(call.get("contract_address"), call.get("action"), call.get("params", {}),
+                                             call.get("signature"), call.get("gas_limit"))
+    except (ContractError, OutOfGas) as e:
+        return None, None, None, 0, str(e)
+    return result, state.read_set, state.writes, gas_used, None
+
+def _speculate_in_worker(indices):
+    engine, calls = _speculation
+    return [_speculate(engine, calls[i]) for i in indices]
+
+class ParallelContractExecutor:
+    """
+    Executes the contract calls of a block across workers with read/write-set
+    conflict detection.
+
+    With use_processes the speculative phase runs in forked worker processes
+    that inherit the pre-block state, which gives real CPU parallelism; the
+    default thread pool avoids forking but is limited by the GIL for
+    CPU-bound contracts.
+    """
+
+    def __init__(self, engine, max_workers=None, use_processes=False, chunk_size=32):
+        self.engine = engine
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.use_processes = use_processes and "fork" in multiprocessing.get_all_start_methods()
+        self.chunk_size = chunk_size
+        self.reexecuted = 0
+
+    def _speculate_all(self, calls):
+        global _speculation
+        if self.max_workers == 1 or len(calls) < 2:
+            return [_speculate(self.engine, call) for call in calls]
+
+        chunks = [range(i, min(i + self.chunk_size, len(calls))) for i in range(0, len(calls), self.chunk_size)]
+        if self.use_processes:
+            _speculation = (self.engine, calls)
+            try:
+                with ProcessPoolExecutor(max_workers=self.max_workers,
+                                         mp_context=multiprocessing.get_context("fork")) as executor:
+                    return [outcome for chunk in executor.map(_speculate_in_worker, chunks) for outcome in chunk]
+            finally:
+                _speculation = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(lambda call: _speculate(self.engine, call), calls))
+
+    def execute_block(self, calls):
+        """
+        Executes contract call transactions in block order semantics and
+        returns one ExecutionReceipt per call.
+        """
+        outcomes = self._speculate_all(calls)
+        written = set()  # (contract address, key) written by earlier calls
+        written_contracts = set()  # addresses of the contracts those keys belong to
+        receipts = []
+        for call, (result, read_set, writes, gas_used, error) in zip(calls, outcomes):
+            address = call.get("contract_address")
+            stale = (read_set is None or (ALL_KEYS in read_set and address in written_contracts)
+                     or any((address, key) in written for key in read_set))
+            if stale and written:
+                # Re-run against the state committed so far
+                self.reexecuted += 1
+                result, read_set, writes, gas_used, error = _speculate(self.engine, call)
+            if error is not None:
+                receipts.append(ExecutionReceipt(address, call.get("action"), None, gas_used, error))
+                continue
+            self.engine.commit_call(address, writes)
+            written.update((address, key) for key in writes)
+            if writes:
+                written_contracts.add(address)
+            self.engine.contracts[address].log_event(call["action"], call["params"])
+            receipts.append(ExecutionReceipt(address, call["action"], result, gas_used))
+        return receipts
+
+def benchmark_parallel_execution(conflict_rates=(0.0, 0.1, 0.5, 1.0), calls=400, workers=None, work=2000):
+    """
+    Compares serial execution with the optimistic parallel executor on a
+    synthetic contract whose calls touch a shared key with the given
+    probability. Returns a list of
+    (conflict_rate, serial_seconds, parallel_seconds, speedup, reexecuted) tuples.
+    """
+    import random
+    from .smart_contracts import SmartContract
+
+    class BenchmarkContract(SmartContract):
+        def work(self, key, rounds):
+            value = self.state.get(key, 0)
+            for i in range(rounds):
+                value = (value * 31 + i) % 1000003
+            self.state[key] = value
+
+        def log_event(self, action, params):
+            pass
+
+    class BenchmarkChain:
+        def current_block_number(self):
+            return 0
+
+    def build(conflict_rate):
+        from .contract_engine import ContractEngine
+        engine = ContractEngine(BenchmarkChain(), default_gas_limit=10 ** 9)
+        engine.deploy(BenchmarkContract("benchmark", engine.blockchain))
+        rng = random.Random(42)
+        block = [{"contract_address": "benchmark", "action": "work",
+                  "params": {"key": "hot" if rng.random() < conflict_rate else f"key-{i}", "rounds": work}}
+                 for i in range(calls)]
+        return engine, block
+
+    results = []
+    for conflict_rate in conflict_rates:
+        engine, block = build(conflict_rate)
+        started = perf_counter()
+        for call in block:
+            engine.execute(call["contract_address"], call["action"], call["params"])
+        serial_seconds = perf_counter() - started
+        serial_state = dict(engine.contracts["benchmark"].state)
+
+        engine, block = build(conflict_rate)
+        executor = ParallelContractExecutor(engine, max_workers=workers, use_processes=True)
+        started = perf_counter()
+        executor.execute_block(block)
+        parallel_seconds = perf_counter() - started
+        assert engine.contracts["benchmark"].state == serial_state
+
+        results.append((conflict_rate, serial_seconds, parallel_seconds,
+                        serial_seconds / parallel_seconds, executor.reexecuted))
+    return results
+
+if __name__ == "__main__":
+    for conflict_rate, serial_seconds, parallel_seconds, speedup, reexecuted in benchmark_parallel_execution():
+        print(f"conflict rate {conflict_rate:>4.0%}: serial {serial_seconds:.2f}s, "
+              f"parallel {parallel_seconds:.2f}s, speedup {speedup:.2f}x, {reexecuted} re-executed")
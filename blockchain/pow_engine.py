@@ -0,0 +1,176 @@
+# UUID: 3b9d8f0e-6a51-4c27-9e3f-58c1d7a2b604
+# blockchain/pow_engine.py
+
+"""
+Multi-process proof-of-work search. The nonce space is partitioned into
+fixed-size ranges that are handed out to a pool of worker processes. As soon
+as one worker finds a hash meeting the difficulty target, a shared stop event
+tells every other worker to abandon its range.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from time import perf_counter
+
+# Set in each worker process by _init_worker
+_stop_event = None
+
+def _init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+def _search_range(job, start, stop, difficulty, check_interval):
+    """
+    Scans the nonces in [start, stop) and returns (nonce, hash, attempts) for the
+    first hash with the required number of leading zeros, or (None, None, attempts).
+    The stop event is polled every check_interval nonces.
+    """
+    target = '0' * difficulty
+    hash_nonce = job.hash_nonce
+    nonce = start
+    while nonce < stop:
+        if _stop_event is not None and _stop_event.is_set():
+            return None, None, nonce - start
+        batch_end = min(nonce + check_interval, stop)
+        for candidate in range(nonce, batch_end):
+            computed_hash = hash_nonce(candidate)
+            if computed_hash.startswith(target):
+                return candidate, computed_hash, candidate - start + 1
+        nonce = batch_end
+    return None, None, stop - start
+
+class ParallelProofOfWork:
+    """
+    Distributes a proof-of-work search across a pool of worker processes.
+
+    A job is any picklable object with a hash_nonce(nonce) method that returns
+    the hex digest the block would have with that nonce.
+    """
+
+    def __init__(self, workers=None, chunk_size=20000, check_interval=1000):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.check_interval = check_interval
+        self._context = multiprocessing.get_context()
+        self._stop_event = self._context.Event()
+        self._executor = None
+        self.hashes = 0  # nonces tried over all searches
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=self._context,
+                                                 initializer=_init_worker,
+                                                 initargs=(self._stop_event,))
+        return self._executor
+
+    def search(self, job, difficulty, start_nonce=0, max_nonce=None, is_stale=None, poll_interval=0.05):
+        """
+        Searches nonces from start_nonce upwards until a hash with the required
+        difficulty is found. Returns (nonce, hash, attempts); nonce and hash are
+        None if max_nonce was reached without a solution.
+
+        is_stale, if given, is called about every poll_interval seconds while
+        the search runs; once it returns True the search is abandoned and
+        returns without a solution.
+        """
+        executor = self._get_executor()
+        self._stop_event.clear()
+        next_start = start_nonce
+        pending = set()
+        result = (None, None)
+        attempts = 0
+
+        def submit_next():
+            nonlocal next_start
+            if max_nonce is not None and next_start >= max_nonce:
+                return
+            stop = next_start + self.chunk_size
+            if max_nonce is not None:
+                stop = min(stop, max_nonce)
+            pending.add(executor.submit(_search_range, job, next_start, stop,
+                                        difficulty, self.check_interval))
+            next_start = stop
+
+        def collect(done):
+            nonlocal attempts, result
+            for future in done:
+                if future.cancelled():
+                    continue
+                nonce, computed_hash, tried = future.result()
+                attempts += tried
+                self.hashes += tried
+                if nonce is not None and (result[0] is None or nonce < result[0]):
+                    result = (nonce, computed_hash)
+
+        # Keep two ranges queued per worker so no process idles between ranges
+        for _ in range(self.workers * 2):
+            submit_next()
+
+        timeout = poll_interval if is_stale is not None else None
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                collect(done)
+                if result[0] is not None:
+                    self._stop_event.set()
+                    continue
+                if is_stale is not None and is_stale():
+                    break
+                for _ in done:
+                    submit_next()
+        finally:
+            self._stop_event.set()
+            for future in pending:
+                future.cancel()
+            # Running ranges see the stop event within check_interval nonces;
+            # wait for them so they cannot run on into the next search
+            collect(wait(pending).done)
+
+        return result[0], result[1], attempts
+
+    def close(self):
+        """
+        Shuts down the worker processes.
+        """
+        if self._executor is not None:
+            self._stop_event.set()
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def benchmark_hashrate(worker_counts=None, hashes_per_run=200000, transactions=100):
+    """
+    Measures proof-of-work throughput for each worker count by scanning a fixed
+    number of nonces with an unreachable difficulty target.
+    Returns a list of (workers, hashes_per_second) tuples.
+    """
+    from .chain import Block
+
+    if worker_counts is None:
+        cpu_count = os.cpu_count() or 1
+        worker_counts = sorted({1, 2, 4, 8, 16, cpu_count} & set(range(1, cpu_count + 1)))
+
+    block = Block(1, [{"sender": f"sender-{i}", "recipient": f"recipient-{i}", "amount": i}
+                      for i in range(transactions)], 0, "0")
+    job = block.mining_job()
+    results = []
+    for workers in worker_counts:
+        with ParallelProofOfWork(workers=workers) as engine:
+            # Warm up the pool so process start-up is not part of the measurement
+            engine.search(job, 65, max_nonce=workers)
+            started = perf_counter()
+            _, _, attempts = engine.search(job, 65, max_nonce=hashes_per_run)
+            elapsed = perf_counter() - started
+        results.append((workers, attempts / elapsed))
+    return results
+
+if __name__ == "__main__":
+    for workers, rate in benchmark_hashrate():
+        print(f"{workers:>3} workers: {rate:,.0f} hashes/sec")
@@ -1,7 +1,12 @@
 import os
+import struct
+import threading
+import time
+from collections import OrderedDict
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.serialization import (
     load_pem_public_key, load_der_public_key, PublicFormat, Encoding
@@ -12,41 +17,260 @@ class SecurityError(Exception):
     """Custom exception for security-related errors."""
     pass
 
+DEFAULT_KEY_CACHE_SIZE = 4096
+
+class PublicKeyCache:
+    """
+    Bounded, thread-safe LRU cache of parsed public keys, keyed on the raw
+    key bytes. Repeat senders skip PEM/DER parsing entirely. A maxsize of 0
+    disables caching.
+    """
+
+    def __init__(self, maxsize=DEFAULT_KEY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_parse(self, key_bytes, parser):
+        """
+        Returns the cached key for key_bytes, parsing and caching it on a miss.
+        Parse errors propagate and are not cached.
+        """
+        with self._lock:
+            public_key = self._entries.get(key_bytes)
+            if public_key is not None:
+                self._entries.move_to_end(key_bytes)
+                self.hits += 1
+                return public_key
+            self.misses += 1
+        # Parse outside the lock; a concurrent miss on the same key just parses it twice
+        public_key = parser(key_bytes)
+        with self._lock:
+            if self.maxsize > 0:
+                self._entries[key_bytes] = public_key
+                self._entries.move_to_end(key_bytes)
+                self._evict()
+        return public_key
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxsize):
+        """
+        Changes the capacity, evicting the least recently used keys if needed.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+# Parsed X25519 keys used by encrypt_data/decrypt_data
+exchange_key_cache = PublicKeyCache()
+
 def is_valid_raw_public_key(key_bytes):
     """Check if raw public key bytes represent a valid X25519 public key."""
     return len(key_bytes) == 32
 
+def _parse_exchange_key(key_bytes):
+    if b"-----BEGIN" in key_bytes:
+        public_key = load_pem_public_key(key_bytes)
+    elif is_valid_raw_public_key(key_bytes):
+        public_key = X25519PublicKey.from_public_bytes(key_bytes)
+    else:
+        public_key = load_der_public_key(key_bytes)
+    if not isinstance(public_key, X25519PublicKey):
+        raise ValueError("The provided public key is not a valid X25519 public key.")
+    return public_key
+
 def sanitize_public_key(public_key_input):
     """
-    Validates and sanitizes the public key input, supporting both PEM and raw formats.
-    Ensures it is a valid X25519 public key.
+    Validates and sanitizes the public key input, supporting PEM, DER and raw formats.
+    Ensures it is a valid X25519 public key. Parsed keys are cached by their bytes.
     """
+    if isinstance(public_key_input, X25519PublicKey):
+        return public_key_input
+    if isinstance(public_key_input, str):
+        public_key_input = public_key_input.encode()
+    if not isinstance(public_key_input, bytes):
+        raise SecurityError("Invalid public key provided: unsupported public key input format.")
     try:
-        if isinstance(public_key_input, str) or (isinstance(public_key_input, bytes) and b"-----BEGIN" in public_key_input):
-            public_key = load_pem_public_key(public_key_input)
-        elif isinstance(public_key_input, bytes) and is_valid_raw_public_key(public_key_input):
-            public_key = load_der_public_key(public_key_input)
-        else:
-            raise ValueError("Unsupported public key input format.")
-        if not isinstance(public_key, X25519PublicKey):
-            raise ValueError("The provided public key is not a valid X25519 public key.")
-        return public_key
+        return exchange_key_cache.get_or_parse(public_key_input, _parse_exchange_key)
     except (ValueError, InvalidKey, TypeError) as e:
         raise SecurityError(f"Invalid public key provided: {e}")
 
+def configure_key_cache(maxsize):
+    """
+    Sets the capacity of both public key caches.
+    """
+    exchange_key_cache.resize(maxsize)
+    QuantumSecurity.key_cache.resize(maxsize)
+
+NONCE_SIZE = 12
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_HEADER = struct.Struct(">7sI")  # nonce prefix, chunk size
+STREAM_NONCE = struct.Struct(">7sIB")  # nonce prefix, chunk counter, final-chunk flag
+TAG_SIZE = 16
+
+def is_valid_nonce(nonce):
+    """Check that a nonce has the size AES-GCM expects."""
+    return isinstance(nonce, bytes) and len(nonce) == NONCE_SIZE
+
+def _public_bytes(public_key):
+    return public_key.public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+class SecureSession:
+    """
+    Symmetric session between two X25519 peers. The shared key is derived once
+    with X25519 and HKDF, and the AES-GCM context is reused for every message.
+    Both peers derive the same key, so a session can decrypt what the peer's
+    session encrypted.
+    """
+
+    def __init__(self, my_private_key, their_public_key):
+        shared_secret = my_private_key.exchange(their_public_key)
+        derived_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'quantum-safe encryption').derive(shared_secret)
+        self._aesgcm = AESGCM(derived_key)
+        self.created_at = time.monotonic()
+
+    def encrypt(self, data, associated_data=None):
+        """
+        Encrypts a message under a fresh random nonce. Returns (ciphertext, nonce).
+        """
+        nonce = os.urandom(NONCE_SIZE)
+        return self._aesgcm.encrypt(nonce, data, associated_data), nonce
+
+    def decrypt(self, encrypted_data, nonce, associated_data=None):
+        if not is_valid_nonce(nonce):
+            raise ValueError("Invalid nonce provided.")
+        try:
+            return self._aesgcm.decrypt(nonce, encrypted_data, associated_data)
+        except Exception as e:
+            raise SecurityError(f"Decryption failed: {e}")
+
+    def encrypt_stream(self, source, sink, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Encrypts a readable binary stream into a writable one chunk by chunk, so
+        neither the plaintext nor the ciphertext is held in memory at once.
+        Each chunk is sealed under a nonce that encodes its position and whether
+        it is the last one, which makes reordering or truncation detectable.
+        """
+        prefix = os.urandom(7)
+        sink.write(STREAM_HEADER.pack(prefix, chunk_size))
+        counter = 0
+        chunk = source.read(chunk_size)
+        while True:
+            next_chunk = source.read(chunk_size)
+            final = not next_chunk
+            nonce = STREAM_NONCE.pack(prefix, counter, final)
+            sink.write(self._aesgcm.encrypt(nonce, chunk, None))
+            if final:
+                return counter + 1
+            chunk = next_chunk
+            counter += 1
+
+    def decrypt_stream(self, source, sink):
+        """
+        Decrypts a stream produced by encrypt_stream. Raises SecurityError if any
+        chunk was altered, reordered or if the stream was truncated.
+        """
+        header = source.read(STREAM_HEADER.size)
+        if len(header) != STREAM_HEADER.size:
+            raise SecurityError("Decryption failed: missing stream header.")
+        prefix, chunk_size = STREAM_HEADER.unpack(header)
+        counter = 0
+        chunk = source.read(chunk_size + TAG_SIZE)
+        while True:
+            next_chunk = source.read(chunk_size + TAG_SIZE)
+            final = not next_chunk
+            nonce = STREAM_NONCE.pack(prefix, counter, final)
+            try:
+                sink.write(self._aesgcm.decrypt(nonce, chunk, None))
+            except Exception as e:
+                raise SecurityError(f"Decryption failed at chunk {counter}: {e}")
+            if final:
+                return counter + 1
+            chunk = next_chunk
+            counter += 1
+
+class SessionCache:
+    """
+    Thread-safe cache of SecureSession objects per (local key, peer key) pair.
+    Sessions expire after ttl seconds and the least recently used session is
+    evicted once maxsize is reached.
+    """
+
+    def __init__(self, ttl=300.0, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, my_private_key, their_public_key):
+        """
+        Returns the session for this peer pair, deriving a new one if none is
+        cached or the cached one has expired.
+        """
+        cache_key = (_public_bytes(my_private_key.public_key()), _public_bytes(their_public_key))
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(cache_key)
+            if session is not None and now - session.created_at < self.ttl:
+                self._sessions.move_to_end(cache_key)
+                return session
+        session = SecureSession(my_private_key, their_public_key)
+        with self._lock:
+            self._sessions[cache_key] = session
+            self._sessions.move_to_end(cache_key)
+            while len(self._sessions) > self.maxsize:
+                self._sessions.popitem(last=False)
+        return session
+
+    def purge_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            for cache_key in [k for k, session in self._sessions.items() if now - session.created_at >= self.ttl]:
+                del self._sessions[cache_key]
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+# Sessions shared by encrypt_data/decrypt_data
+session_cache = SessionCache()
+
 def encrypt_data(public_key, data, my_private_key):
     """
     Encrypts data using a hybrid encryption scheme with X25519, HKDF, and AES-GCM.
+    The derived key and AES-GCM context are reused for the same peer pair.
     """
     if not isinstance(public_key, X25519PublicKey):
         raise ValueError("Public key must be an instance of X25519PublicKey.")
-    
-    shared_secret = my_private_key.exchange(public_key)
-    derived_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'quantum-safe encryption').derive(shared_secret)
-    aesgcm = AESGCM(derived_key)
-    nonce = os.urandom(12)
-    encrypted_data = aesgcm.encrypt(nonce, data, None)
-    return encrypted_data, nonce
+
+    return session_cache.get(my_private_key, public_key).encrypt(data)
 
 def decrypt_data(private_key, encrypted_data, nonce, their_public_key):
     """
@@ -54,19 +278,12 @@ def decrypt_data(private_key, encrypted_data, nonce, their_public_key):
     """
     if not isinstance(private_key, X25519PrivateKey):
         raise ValueError("Private key must be an instance of X25519PrivateKey.")
-    
+
     if not is_valid_nonce(nonce):
         raise ValueError("Invalid nonce provided.")
     their_public_key = sanitize_public_key(their_public_key)
-    
-    shared_secret = private_key.exchange(their_public_key)
-    derived_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'quantum-safe encryption').derive(shared_secret)
-    aesgcm = AESGCM(derived_key)
-    try:
-        decrypted_data = aesgcm.decrypt(nonce, encrypted_data, None)
-    except Exception as e:
-        raise SecurityError(f"Decryption failed: {e}")
-    return decrypted_data
+
+    return session_cache.get(private_key, their_public_key).decrypt(encrypted_data, nonce)
 
 def select_algorithm(algorithm):
     """
@@ -82,18 +299,93 @@ def select_algorithm(algorithm):
     else:
         raise ValueError("Unsupported algorithm choice.")
 
+class QuantumSecurity:
+    """
+    Signature helpers used by the ledger. Account addresses are PEM-encoded
+    Ed25519 public keys, and signatures travel as hex strings.
+    """
+
+    # Parsed sender keys, shared by every transaction verification
+    key_cache = PublicKeyCache()
+
+    @staticmethod
+    def generate_keypair():
+        """
+        Generates a signing key pair and returns the private key together with
+        the PEM-encoded public key used as the account address.
+        """
+        private_key = Ed25519PrivateKey.generate()
+        return private_key, QuantumSecurity.serialize_public_key(private_key.public_key())
+
+    @staticmethod
+    def serialize_public_key(public_key):
+        """
+        Serializes a signing public key to its PEM string form.
+        """
+        return public_key.public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo).decode()
+
+    @staticmethod
+    def _parse_signing_key(key_bytes):
+        if b"-----BEGIN" in key_bytes:
+            public_key = load_pem_public_key(key_bytes)
+        else:
+            public_key = load_der_public_key(key_bytes)
+        if not isinstance(public_key, Ed25519PublicKey):
+            raise ValueError("The provided public key is not a valid Ed25519 public key.")
+        return public_key
+
+    @staticmethod
+    def deserialize_public_key(public_key_input):
+        """
+        Parses a PEM or DER encoded signing public key, using the key cache.
+        """
+        if isinstance(public_key_input, str):
+            public_key_input = public_key_input.encode()
+        if not isinstance(public_key_input, bytes):
+            raise SecurityError("Invalid public key provided: unsupported public key input format.")
+        try:
+            return QuantumSecurity.key_cache.get_or_parse(public_key_input, QuantumSecurity._parse_signing_key)
+        except (ValueError, TypeError) as e:
+            raise SecurityError(f"Invalid public key provided: {e}")
+
+    @staticmethod
+    def sign(private_key, message):
+        """
+        Signs a message and returns the signature as a hex string.
+        """
+        if isinstance(message, str):
+            message = message.encode()
+        return private_key.sign(message).hex()
+
+    @staticmethod
+    def verify_signature(public_key, message, signature):
+        """
+        Verifies a hex or raw signature over a message.
+        Raises InvalidSignature if the signature does not match.
+        """
+        if isinstance(message, str):
+            message = message.encode()
+        if isinstance(signature, str):
+            try:
+                signature = bytes.fromhex(signature)
+            except ValueError:
+                raise SecurityError("Signature is not valid hex.")
+        public_key.verify(signature, message)
+        return True
+
 # Example usage and validation
-try:
-    # Placeholder for actual key generation and data encryption/decryption operations
-    my_private_key = X25519PrivateKey.generate()
-    their_public_key = my_private_key.public_key()  # In real use, this would be the recipient's public key
-    public_key_input = their_public_key.public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo)
-    
-    sanitized_public_key = sanitize_public_key(public_key_input)
-    data = b"Secret message"
-    encrypted_data, nonce = encrypt_data(sanitized_public_key, data, my_private_key)
-    decrypted_data = decrypt_data(my_private_key, encrypted_data, nonce, sanitized_public_key)
-    assert data == decrypted_data
-    print("Encryption and decryption were successful.")
-except SecurityError as e:
-    print(e)
+if __name__ == "__main__":
+    try:
+        # Placeholder for actual key generation and data encryption/decryption operations
+        my_private_key = X25519PrivateKey.generate()
+        their_public_key = my_private_key.public_key()  # In real use, this would be the recipient's public key
+        public_key_input = their_public_key.public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo)
+
+        sanitized_public_key = sanitize_public_key(public_key_input)
+        data = b"Secret message"
+        encrypted_data, nonce = encrypt_data(sanitized_public_key, data, my_private_key)
+        decrypted_data = decrypt_data(my_private_key, encrypted_data, nonce, sanitized_public_key)
+        assert data == decrypted_data
+        print("Encryption and decryption were successful.")
+    except SecurityError as e:
+        print(e)
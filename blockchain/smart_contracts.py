@@ -15,6 +15,9 @@ class SmartContract:
         self.address = address  # Unique address/identifier for the contract on the blockchain
         self.blockchain = blockchain  # Reference to the blockchain instance
         self.state = self.load_contract_state()  # Load or initialize contract state
+        engine = getattr(blockchain, "contract_engine", None)
+        if engine is not None:
+            engine.deploy(self)  # The engine caches this instance and its loaded state
 
     def load_contract_state(self):
         # Load contract state from blockchain storage. Placeholder for actual implementation.
@@ -28,24 +31,26 @@ class SmartContract:
         """
         pass
 
-    def execute(self, action, params, signature):
+    def execute(self, action, params, signature, gas_limit=None):
         """
         Executes an action defined within the contract, verifying the signature
         to ensure that the action is authorized.
-        """
-        # Placeholder for signature verification logic
-        if not self.verify_signature(action, params, signature):
-            raise Exception("Invalid signature")
-
-        if hasattr(self, action):
-            # Execute the contract method and log the event
-            getattr(self, action)(**params)
-            self.log_event(action, params)
-        else:
-            raise ValueError(f"Action {action} not found in contract.")
 
+        Calls go through the blockchain's ContractEngine, which meters gas and
+        defers saving the state until the block is committed. Without an
+        engine the contract runs metered on its own and saves immediately.
+        """
+        engine = getattr(self.blockchain, "contract_engine", None)
+        if engine is not None:
+            return engine.execute(self.address, action, params, signature, gas_limit)
+
+        from .contract_engine import ContractEngine
+        engine = ContractEngine(self.blockchain)
+        engine.deploy(self)
+        receipt = engine.execute(self.address, action, params, signature, gas_limit)
         # Save state changes to the blockchain
-        self.save_contract_state()
+        engine.commit_block()
+        return receipt
 
     def verify_signature(self, action, params, signature):
         """
@@ -58,15 +63,12 @@ class SmartContract:
     def log_event(self, action, params):
         """
         Logs contract execution events for transparency and auditability.
+        Events are buffered in the blockchain's EventLog and written to disk
+        in batches once their block is committed.
         """
-        event = {
-            "contract": self.address,
-            "action": action,
-            "params": params,
-            "block": self.blockchain.current_block_number()
-        }
-        # In a real implementation, this would append the event to the blockchain's event log.
-        print("Event logged:", json.dumps(event))
+        event_log = getattr(self.blockchain, "event_log", None)
+        if event_log is not None:
+            event_log.emit(self.address, action, params)
 
 class TransactionManager(SmartContract):
     def __init__(self, address, blockchain):
@@ -0,0 +1,297 @@
+# UUID: 71c3e9a4-b2d8-4e05-9f16-3a8d5c0e2b94
+# blockchain/state.py
+
+"""
+Account state for the ledger. The StateEngine keeps a compact table of
+(balance, nonce) per account and applies each block's transactions to it
+incrementally, recording an undo log per block so a reorganisation can roll
+blocks back. Snapshots are copy-on-write: taking one is O(1), and the engine
+only saves an account's previous value the first time it changes while a
+snapshot is open. Snapshots are written to disk in the background, keeping a
+few older generations, so a restart loads the latest one that is still on
+the chain instead of replaying the whole chain.
+"""
+
+import json
+import os
+import threading
+from collections import deque
+
+_MISSING = object()
+EMPTY_ACCOUNT = (0, 0)
+
+class StateError(Exception):
+    """Raised when a transaction cannot be applied to the account state."""
+    pass
+
+class StateSnapshot:
+    """
+    Consistent, read-only view of the account state at a given block.
+    """
+
+    def __init__(self, engine, height, block_hash):
+        self._engine = engine
+        self.height = height
+        self.block_hash = block_hash
+        self._preimages = {}  # address -> value when the snapshot was taken
+
+    def get(self, address):
+        with self._engine._lock:
+            if address in self._preimages:
+                value = self._preimages[address]
+            else:
+                value = self._engine._accounts.get(address, _MISSING)
+        return EMPTY_ACCOUNT if value is _MISSING else value
+
+    def items(self, batch_size=1024):
+        """
+        Yields (address, (balance, nonce)) for every account in the snapshot.
+        Accounts created since the snapshot have a missing preimage and are
+        skipped; accounts removed since are found through their preimage.
+        """
+        with self._engine._lock:
+            addresses = list(self._engine._accounts)
+            addresses.extend(address for address in self._preimages if address not in self._engine._accounts)
+        for start in range(0, len(addresses), batch_size):
+            batch = []
+            with self._engine._lock:
+                for address in addresses[start:start + batch_size]:
+                    if address in self._preimages:
+                        value = self._preimages[address]
+                    else:
+                        value = self._engine._accounts.get(address, _MISSING)
+                    if value is not _MISSING:
+                        batch.append((address, value))
+            yield from batch
+
+    def save(self, path):
+        """
+        Atomically writes the snapshot to path.
+        """
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({
+                "height": self.height,
+                "hash": self.block_hash,
+                "accounts": {address: list(value) for address, value in self.items()}
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, path)
+
+    def release(self):
+        """
+        Stops tracking changes for this snapshot.
+        """
+        with self._engine._lock:
+            if self in self._engine._snapshots:
+                self._engine._snapshots.remove(self)
+
+class StateEngine:
+    """
+    Incrementally maintained balance/nonce table.
+
+    Transactions are dictionaries with sender, recipient and amount and
+    optional fee and nonce fields; a sender's nonces must be consecutive from
+    0. Transactions without a sender or amount (e.g. contract calls) and
+    proof-of-stake forging records do not move funds and are skipped.
+    """
+
+    def __init__(self, genesis_balances=None, snapshot_path=None, snapshot_every=1000, max_undo_blocks=256,
+                 snapshots_kept=3):
+        self._genesis = {address: (balance, 0) for address, balance in (genesis_balances or {}).items()}
+        self._accounts = dict(self._genesis)
+        self._lock = threading.Lock()
+        self._snapshots = []
+        self._undo = deque(maxlen=max_undo_blocks)
+        self._writer = None
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self.snapshots_kept = snapshots_kept  # snapshot_path plus older generations at snapshot_path.1, .2, ...
+        self.height = -1
+        self.block_hash = None
+        if snapshot_path and os.path.exists(snapshot_path):
+            self._load(snapshot_path)
+
+    def _load(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        self._accounts = {address: tuple(value) for address, value in data["accounts"].items()}
+        self.height = data["height"]
+        self.block_hash = data["hash"]
+
+    def _snapshot_file(self, generation):
+        return self.snapshot_path if generation == 0 else f"{self.snapshot_path}.{generation}"
+
+    def restore(self, is_valid):
+        """
+        Makes sure the state belongs to a block for which
+        is_valid(height, block_hash) holds, e.g. a block of the active chain.
+        Otherwise the newest saved snapshot that passes is loaded, or the
+        genesis state if none does, and the undo log is cleared. Returns the
+        height of the state; the caller replays the blocks after it.
+        """
+        if self.height < 0 or is_valid(self.height, self.block_hash):
+            return self.height
+        self.wait_for_snapshot()
+        self._undo.clear()
+        for generation in range(self.snapshots_kept if self.snapshot_path else 0):
+            path = self._snapshot_file(generation)
+            if os.path.exists(path):
+                self._load(path)
+                if is_valid(self.height, self.block_hash):
+                    return self.height
+        self._accounts = dict(self._genesis)
+        self.height, self.block_hash = -1, None
+        return self.height
+
+    def balance(self, address):
+        return self._accounts.get(address, EMPTY_ACCOUNT)[0]
+
+    def nonce(self, address):
+        """
+        Returns the nonce the account's next transaction must carry.
+        """
+        return self._accounts.get(address, EMPTY_ACCOUNT)[1]
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def _set(self, address, value, undo):
+        with self._lock:
+            previous = self._accounts.get(address, _MISSING)
+            if address not in undo:
+                undo[address] = previous
+            for snapshot in self._snapshots:
+                if address not in snapshot._preimages:
+                    snapshot._preimages[address] = previous
+            if value is _MISSING:
+                self._accounts.pop(address, None)
+            else:
+                self._accounts[address] = value
+
+    def apply_transaction(self, transaction, undo=None, fee_recipient=None):
+        """
+        Applies one transaction. Raises StateError if the nonce is out of order
+        or the sender cannot cover amount plus fee.
+        """
+        undo = {} if undo is None else undo
+        sender, amount = transaction.get("sender"), transaction.get("amount")
+        if sender is None or amount is None or "forger" in transaction:
+            return undo
+        fee = transaction.get("fee", 0)
+        if not isinstance(amount, (int, float)) or amount < 0 or fee < 0:
+            raise StateError("Transaction amount and fee must be non-negative numbers.")
+
+        balance, nonce = self._accounts.get(sender, EMPTY_ACCOUNT)
+        if transaction.get("nonce", 0) != nonce:
+            raise StateError(f"Expected nonce {nonce} from sender, got {transaction.get('nonce', 0)}.")
+        if balance < amount + fee:
+            raise StateError("Insufficient balance.")
+
+        self._set(sender, (balance - amount - fee, nonce + 1), undo)
+        recipient = transaction["recipient"]
+        recipient_balance, recipient_nonce = self._accounts.get(recipient, EMPTY_ACCOUNT)
+        self._set(recipient, (recipient_balance + amount, recipient_nonce), undo)
+        if fee and fee_recipient is not None:
+            miner_balance, miner_nonce = self._accounts.get(fee_recipient, EMPTY_ACCOUNT)
+            self._set(fee_recipient, (miner_balance + fee, miner_nonce), undo)
+        return undo
+
+    def _restore(self, undo):
+        discard = {}
+        for address, previous in undo.items():
+            self._set(address, previous, discard)
+
+    def apply_block(self, block, fee_recipient=None):
+        """
+        Applies all transactions of a block atomically and records its undo log.
+        """
+        undo = {}
+        try:
+            for transaction in block.transactions:
+                self.apply_transaction(transaction, undo, fee_recipient)
+        except StateError:
+            self._restore(undo)
+            raise
+        self._undo.append((self.height, self.block_hash, undo))
+        self.height, self.block_hash = block.index, block.hash
+        if self.snapshot_path and self.height % self.snapshot_every == 0:
+            self.write_snapshot()
+
+    def filter_applicable(self, transactions):
+        """
+        Returns the transactions that can be applied in order on top of the
+        current state, leaving the state itself unchanged.
+        """
+        applicable = []
+        undo = {}
+        try:
+            for transaction in transactions:
+                attempt = {}
+                try:
+                    self.apply_transaction(transaction, attempt)
+                except StateError:
+                    self._restore(attempt)
+                    continue
+                for address, previous in attempt.items():
+                    undo.setdefault(address, previous)
+                applicable.append(transaction)
+        finally:
+            self._restore(undo)
+        return applicable
+
+    @property
+    def undo_depth(self):
+        """
+        Number of blocks that can currently be reverted.
+        """
+        return len(self._undo)
+
+    def revert_block(self):
+        """
+        Rolls back the most recently applied block using its undo log.
+        """
+        if not self._undo:
+            raise StateError("No undo data left to revert.")
+        height, block_hash, undo = self._undo.pop()
+        self._restore(undo)
+        self.height, self.block_hash = height, block_hash
+
+    def snapshot(self):
+        """
+        Returns an O(1) copy-on-write snapshot of the current state. Call
+        release() on it when done.
+        """
+        snapshot = StateSnapshot(self, self.height, self.block_hash)
+        with self._lock:
+            self._snapshots.append(snapshot)
+        return snapshot
+
+    def write_snapshot(self, wait=False):
+        """
+        Persists a snapshot of the current state to snapshot_path on a
+        background thread while blocks keep being applied.
+        """
+        self.wait_for_snapshot()
+        snapshot = self.snapshot()
+
+        def write():
+            try:
+                # Older snapshots stay available in case this one leaves the chain
+                for generation in range(self.snapshots_kept - 1, 0, -1):
+                    if os.path.exists(self._snapshot_file(generation - 1)):
+                        os.replace(self._snapshot_file(generation - 1), self._snapshot_file(generation))
+                snapshot.save(self.snapshot_path)
+            finally:
+                snapshot.release()
+
+        self._writer = threading.Thread(target=write, daemon=True)
+        self._writer.start()
+        if wait:
+            self.wait_for_snapshot()
+
+    def wait_for_snapshot(self):
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
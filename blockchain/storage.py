@@ -0,0 +1,313 @@
+# UUID: c81e5a3f-27d4-4b90-a6e2-0f4d9b7c1e35
+# blockchain/storage.py
+
+"""
+Storage backends for the block chain. MemoryBlockStore keeps blocks in a list
+for tests and throwaway chains. FileBlockStore persists blocks to append-only
+segment files of length-prefixed records, reads them back through mmap, and
+keeps a fixed-size index record per block so opening a store never requires
+decoding the blocks themselves.
+"""
+
+import mmap
+import os
+import struct
+from .encoding import BLOCK_HEADER
+
+# Per-block index record: segment number, offset, record length, block hash
+INDEX_RECORD = struct.Struct(">IQI32s")
+RECORD_LENGTH = struct.Struct(">I")
+
+class StorageError(Exception):
+    """Raised when the block store is inconsistent or cannot be written."""
+    pass
+
+class MemoryBlockStore:
+    """
+    In-memory block store with a hash index.
+    """
+
+    def __init__(self):
+        self._blocks = []
+        self._heights = {}
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def __getitem__(self, height):
+        return self._blocks[height]
+
+    def __iter__(self):
+        return iter(self._blocks)
+
+    def append(self, block):
+        self._heights[block.hash] = len(self._blocks)
+        self._blocks.append(block)
+
+    def iter_serialized(self, start=0):
+        """
+        Yields the serialized form of each block from height start onwards.
+        """
+        for height in range(start, len(self._blocks)):
+            yield self._blocks[height].to_bytes()
+
+    def iter_links(self, start=0):
+        """
+        Yields (index, previous_hash, hash) for each block from height start onwards.
+        """
+        for block in self._blocks[start:]:
+            yield block.index, block.previous_hash, block.hash
+
+    def truncate(self, height):
+        """
+        Removes every block at or above height.
+        """
+        for block in self._blocks[height:]:
+            del self._heights[block.hash]
+        del self._blocks[height:]
+
+    def get_by_hash(self, block_hash):
+        height = self._heights.get(block_hash)
+        return None if height is None else self._blocks[height]
+
+    def height_of(self, block_hash):
+        return self._heights.get(block_hash)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class FileBlockStore:
+    """
+    Append-only, segmented block store.
+
+    Blocks are written in their canonical binary encoding as 4-byte
+    length-prefixed records to blkNNNNN.dat
+    segment files. index.dat holds one INDEX_RECORD per height, which makes
+    lookups by height O(1); a hash-to-height map is built from the index when
+    the store is opened. Writes are fsynced in batches of sync_every blocks:
+    segment data first, then the index, so after a crash the index never
+    refers to data that did not reach the disk.
+    """
+
+    def __init__(self, directory, block_class=None, segment_size=64 * 1024 * 1024, sync_every=64):
+        if block_class is None:
+            from .chain import Block as block_class
+        self.directory = directory
+        self.block_class = block_class
+        self.segment_size = segment_size
+        self.sync_every = sync_every
+        self._unsynced = 0
+        self._maps = {}
+        self._last_block = None
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, "index.dat")
+        self._load_index()
+        self._segment_number = self._record(len(self) - 1)[0] if len(self) else 0
+        self._segment = open(self._segment_path(self._segment_number), "ab")
+        self._index_file = open(self._index_path, "ab")
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"blk{number:05d}.dat")
+
+    def _load_index(self):
+        """
+        Reads the index and drops any trailing entries whose block data did not
+        reach the disk, then truncates segments past the last indexed block.
+        """
+        index = bytearray()
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "rb") as f:
+                index = bytearray(f.read())
+        stored_length = len(index)
+        del index[len(index) - len(index) % INDEX_RECORD.size:]
+
+        segment_sizes = {}
+        count = len(index) // INDEX_RECORD.size
+        while count:
+            segment, offset, length, _ = INDEX_RECORD.unpack_from(index, (count - 1) * INDEX_RECORD.size)
+            if segment not in segment_sizes:
+                path = self._segment_path(segment)
+                segment_sizes[segment] = os.path.getsize(path) if os.path.exists(path) else 0
+            if offset + length <= segment_sizes[segment]:
+                break
+            count -= 1
+        del index[count * INDEX_RECORD.size:]
+
+        # Only a torn tail is cut off, in place; an intact index is not rewritten
+        if len(index) < stored_length:
+            with open(self._index_path, "r+b") as f:
+                f.truncate(len(index))
+                f.flush()
+                os.fsync(f.fileno())
+
+        if count:
+            segment, offset, length, _ = INDEX_RECORD.unpack_from(index, (count - 1) * INDEX_RECORD.size)
+            if segment_sizes[segment] > offset + length:
+                with open(self._segment_path(segment), "r+b") as f:
+                    f.truncate(offset + length)
+
+        self._index = index
+        self._heights = {}
+        for height in range(count):
+            block_hash = INDEX_RECORD.unpack_from(index, height * INDEX_RECORD.size)[3]
+            self._heights[block_hash] = height
+
+    def _record(self, height):
+        return INDEX_RECORD.unpack_from(self._index, height * INDEX_RECORD.size)
+
+    def _map(self, segment):
+        """
+        Returns a read-only map of a segment, remapping it if it has grown.
+        """
+        mapped = self._maps.get(segment)
+        size = os.path.getsize(self._segment_path(segment))
+        if mapped is None or len(mapped) < size:
+            if mapped is not None:
+                mapped.close()
+            with open(self._segment_path(segment), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def __len__(self):
+        return len(self._index) // INDEX_RECORD.size
+
+    def __getitem__(self, height):
+        count = len(self)
+        if height < 0:
+            height += count
+        if not 0 <= height < count:
+            raise IndexError("Block height out of range.")
+        if height == count - 1 and self._last_block is not None:
+            return self._last_block
+        segment, offset, length, _ = self._record(height)
+        if segment == self._segment_number:
+            self._segment.flush()
+        # Decode straight from the mapping; the view is released before returning
+        with memoryview(self._map(segment)) as view:
+            block = self.block_class.from_bytes(view[offset + RECORD_LENGTH.size:offset + length])
+        if height == count - 1:
+            self._last_block = block
+        return block
+
+    def __iter__(self):
+        for height in range(len(self)):
+            yield self[height]
+
+    def iter_serialized(self, start=0):
+        """
+        Yields the stored bytes of each block from height start onwards,
+        straight from the mapped segments without decoding them.
+        """
+        self._segment.flush()
+        for height in range(start, len(self)):
+            segment, offset, length, _ = self._record(height)
+            yield self._map(segment)[offset + RECORD_LENGTH.size:offset + length]
+
+    def iter_links(self, start=0):
+        """
+        Yields (index, previous_hash, hash) for each block from height start
+        onwards, reading only the fixed-size part of each record.
+        """
+        for record in self.iter_serialized(start):
+            index, previous_hash, block_hash = BLOCK_HEADER.unpack_from(record)[:3]
+            # The genesis block links to the placeholder hash "0"
+            previous = "0" if index == 0 and not any(previous_hash) else previous_hash.hex()
+            yield index, previous, block_hash.hex()
+
+    def truncate(self, height):
+        """
+        Removes every block at or above height, e.g. when a reorganisation
+        disconnects them. The index is cut first, so after a crash it never
+        refers to removed data.
+        """
+        count = len(self)
+        if height >= count:
+            return
+        self.flush()
+        segment, offset, _, _ = self._record(height)
+        for removed in range(height, count):
+            del self._heights[self._record(removed)[3]]
+        del self._index[height * INDEX_RECORD.size:]
+        self._index_file.close()
+        with open(self._index_path, "r+b") as f:
+            f.truncate(len(self._index))
+            f.flush()
+            os.fsync(f.fileno())
+        self._index_file = open(self._index_path, "ab")
+
+        # Unmap before shrinking files; touching a mapping past the end of its file faults
+        for number in [number for number in self._maps if number >= segment]:
+            self._maps.pop(number).close()
+        self._segment.close()
+        for number in range(segment + 1, self._segment_number + 1):
+            if os.path.exists(self._segment_path(number)):
+                os.remove(self._segment_path(number))
+        with open(self._segment_path(segment), "r+b") as f:
+            f.truncate(offset)
+            f.flush()
+            os.fsync(f.fileno())
+        self._segment_number = segment
+        self._segment = open(self._segment_path(segment), "ab")
+        self._last_block = None
+
+    def append(self, block):
+        """
+        Appends a block to the active segment and records it in the index.
+        """
+        payload = block.to_bytes()
+        record = RECORD_LENGTH.pack(len(payload)) + payload
+        offset = self._segment.tell()
+        if offset and offset + len(record) > self.segment_size:
+            self._roll_segment()
+            offset = 0
+        self._segment.write(record)
+
+        index_record = INDEX_RECORD.pack(self._segment_number, offset, len(record), bytes.fromhex(block.hash))
+        self._index_file.write(index_record)
+        self._index += index_record
+        self._heights[bytes.fromhex(block.hash)] = len(self) - 1
+        self._last_block = block
+
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.flush()
+
+    def _roll_segment(self):
+        self.flush()
+        self._segment.close()
+        self._segment_number += 1
+        self._segment = open(self._segment_path(self._segment_number), "ab")
+
+    def get_by_hash(self, block_hash):
+        height = self.height_of(block_hash)
+        return None if height is None else self[height]
+
+    def height_of(self, block_hash):
+        try:
+            return self._heights.get(bytes.fromhex(block_hash))
+        except ValueError:
+            return None
+
+    def flush(self):
+        """
+        Makes every appended block durable: segment data first, then the index.
+        """
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+        self._index_file.flush()
+        os.fsync(self._index_file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        if self._segment.closed:
+            return
+        self.flush()
+        self._segment.close()
+        self._index_file.close()
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
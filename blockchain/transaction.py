@@ -5,7 +5,11 @@ Includes features for transaction creation, validation, and execution,
 with emphasis on security and scalability.
 """
 
+from .encoding import decode_transaction, encode_transaction
+
 class Transaction:
+    __slots__ = ("sender", "recipient", "amount", "nonce")
+
     def __init__(self, sender, recipient, amount, nonce):
         self.sender = sender  # Public key of the sender
         self.recipient = recipient  # Public key of the recipient
@@ -28,13 +32,31 @@ class Transaction:
         # Placeholder implementation
         pass
 
-    def execute_transaction(self):
+    def to_dict(self):
+        return {
+            "sender": self.sender,
+            "recipient": self.recipient,
+            "amount": self.amount,
+            "nonce": self.nonce
+        }
+
+    def to_bytes(self):
         """
-        Executes the transaction by updating the sender's and recipient's account balances.
-        Placeholder for actual execution logic.
+        Returns the canonical binary encoding used for hashing and storage.
         """
-        # Placeholder implementation
-        pass
+        return encode_transaction(self.to_dict())
+
+    @classmethod
+    def from_bytes(cls, buffer):
+        data, _ = decode_transaction(buffer)
+        return cls(data["sender"], data["recipient"], data["amount"], data["nonce"])
+
+    def execute_transaction(self, state):
+        """
+        Executes the transaction by updating the sender's and recipient's account balances
+        in the given StateEngine. Raises StateError if the sender's nonce or balance does not allow it.
+        """
+        return state.apply_transaction(self.to_dict())
 
 # Placeholder for additional classes and functions related to transaction management
 
@@ -0,0 +1,204 @@
+# UUID: e4b7a0d2-58c3-4f19-9a6e-c20d8f35b1a7
+# blockchain/validation.py
+
+"""
+Streaming validation of a whole chain. Blocks are read from the block store
+as a generator and checked in batches on a pool of worker processes, which
+recompute each block's header hash, check its seal with a copy of the
+consensus engine and verify the transaction signatures. The main process
+checks the hash links between consecutive blocks as batch results come back
+in order, and periodically writes a checkpoint so an interrupted audit can
+resume where it stopped.
+"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from cryptography.exceptions import InvalidSignature
+from .encoding import EncodingError, encode_transaction
+from .quantum_security import QuantumSecurity, SecurityError
+
+class ValidationError(Exception):
+    """Raised when a block in the chain fails validation."""
+
+    def __init__(self, height, reason):
+        super().__init__(f"Block {height} is invalid: {reason}")
+        self.height = height
+        self.reason = reason
+
+def verify_signed_transaction(data):
+    """
+    Returns True if a transaction dictionary carries a valid signature by its
+    sender over all of its other fields, including the extra fields of
+    contract calls (see chain.sign_transaction). Unsigned transactions are
+    rejected.
+    """
+    if not isinstance(data, dict) or not data.get("signature"):
+        return False
+    try:
+        public_key = QuantumSecurity.deserialize_public_key(data.get("sender"))
+        QuantumSecurity.verify_signature(public_key, encode_transaction(data, include_signature=False),
+                                         data["signature"])
+    except (InvalidSignature, SecurityError, EncodingError, TypeError, ValueError):
+        return False
+    return True
+
+def _check_signatures(transactions, consensus):
+    """
+    Verifies the signature of every transaction. A forging record of the
+    consensus engine (see ConsensusAlgorithm.is_forging_record) is exempt;
+    the engine's seal check covers it. Returns the position of the first
+    invalid transaction, or None.
+    """
+    for position, data in enumerate(transactions):
+        if consensus.is_forging_record(position, data):
+            continue
+        if not verify_signed_transaction(data):
+            return position
+    return None
+
+def validate_blocks(records, consensus):
+    """
+    Checks the seal and signatures of a batch of serialized blocks against
+    the consensus engine. Returns (index, previous_hash, hash, error,
+    parent_seed, seed) for each block, where the seeds are those of engines
+    that chain them (see ConsensusAlgorithm.parent_seed) or None.
+    """
+    from .chain import Block
+
+    results = []
+    for record in records:
+        block = Block.from_bytes(record)
+        error = None
+        computed_hash = block.compute_hash()
+        if computed_hash != block.hash:
+            error = "hash does not match block header"
+        elif block.index > 0 and not consensus.verify_block(block, computed_hash):
+            error = "block seal is not valid under the consensus rules"
+        else:
+            position = _check_signatures(block.transactions, consensus)
+            if position is not None:
+                error = f"invalid signature on transaction {position}"
+        results.append((block.index, block.previous_hash, block.hash, error,
+                        consensus.parent_seed(block), consensus.next_seed(block)))
+    return results
+
+class ValidationReport:
+    def __init__(self, start_height, blocks, elapsed, tip_hash):
+        self.start_height = start_height
+        self.blocks = blocks
+        self.elapsed = elapsed
+        self.tip_hash = tip_hash
+
+    @property
+    def blocks_per_second(self):
+        return self.blocks / self.elapsed if self.elapsed else 0.0
+
+class ChainValidator:
+    """
+    Validates a block store from genesis, or from the last checkpoint.
+
+    progress, if given, is called as progress(height, blocks_per_second)
+    after every report_every blocks.
+    """
+
+    def __init__(self, store, consensus, workers=None, batch_size=64, checkpoint_path=None,
+                 checkpoint_every=1000, progress=None, report_every=1000):
+        self.store = store
+        self.consensus = consensus  # ConsensusAlgorithm checking each block's seal
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.progress = progress
+        self.report_every = report_every
+
+    def load_checkpoint(self):
+        """
+        Returns (height, hash) of the last validated block, or None.
+        A checkpoint that no longer matches the store is ignored.
+        """
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        height, block_hash = checkpoint["height"], checkpoint["hash"]
+        if height >= len(self.store) or self.store[height].hash != block_hash:
+            return None
+        return height, block_hash
+
+    def save_checkpoint(self, height, block_hash):
+        """
+        Atomically replaces the checkpoint file.
+        """
+        temporary_path = self.checkpoint_path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({"height": height, "hash": block_hash}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def _batches(self, start):
+        batch = []
+        for record in self.store.iter_serialized(start):
+            batch.append(bytes(record))
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def validate(self):
+        """
+        Validates the chain and returns a ValidationReport.
+        Raises ValidationError at the first invalid block.
+        """
+        checkpoint = self.load_checkpoint()
+        if checkpoint is None:
+            start, previous_hash, previous_seed = 0, None, None
+        else:
+            start, previous_hash = checkpoint[0] + 1, checkpoint[1]
+            previous_seed = self.consensus.next_seed(self.store[checkpoint[0]])
+
+        expected_height = start
+        last_checkpoint = start
+        started = perf_counter()
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = []
+            batches = self._batches(start)
+            # Keep a bounded number of batches in flight so memory use stays flat
+            for batch in batches:
+                pending.append(executor.submit(validate_blocks, batch, self.consensus))
+                if len(pending) >= self.workers * 2:
+                    break
+            while pending:
+                results = pending.pop(0).result()
+                next_batch = next(batches, None)
+                if next_batch is not None:
+                    pending.append(executor.submit(validate_blocks, next_batch, self.consensus))
+
+                for index, block_previous_hash, block_hash, error, parent_seed, seed in results:
+                    if index != expected_height:
+                        error = error or f"index {index} found at height {expected_height}"
+                    elif previous_hash is not None and block_previous_hash != previous_hash:
+                        error = error or "previous hash does not link to the prior block"
+                    elif parent_seed != previous_seed:
+                        error = error or "seed is not the one the prior block passes on"
+                    if error:
+                        for future in pending:
+                            future.cancel()
+                        raise ValidationError(expected_height, error)
+                    previous_hash, previous_seed = block_hash, seed
+                    expected_height += 1
+
+                    if self.checkpoint_path and expected_height - last_checkpoint >= self.checkpoint_every:
+                        self.save_checkpoint(expected_height - 1, previous_hash)
+                        last_checkpoint = expected_height
+                    if self.progress and (expected_height - start) % self.report_every == 0:
+                        self.progress(expected_height - 1, (expected_height - start) / (perf_counter() - started))
+
+        if self.checkpoint_path and expected_height > last_checkpoint:
+            self.save_checkpoint(expected_height - 1, previous_hash)
+        return ValidationReport(start, expected_height - start, perf_counter() - started, previous_hash)
@@ -0,0 +1,88 @@
+# UUID: 5e07b2c4-93fa-4d18-8b61-e4a2c9f03d7b
+# blockchain/verification.py
+
+"""
+Batched signature verification for transaction admission. Sender keys are
+parsed once per distinct sender, and the signature checks are spread across a
+thread or process pool in chunks.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from cryptography.exceptions import InvalidSignature
+from .quantum_security import QuantumSecurity, SecurityError
+
+def _parse_keys(senders):
+    """
+    Parses each distinct sender key once; unparseable keys map to None.
+    """
+    keys = {}
+    for sender in senders:
+        if sender not in keys:
+            try:
+                keys[sender] = QuantumSecurity.deserialize_public_key(sender)
+            except SecurityError:
+                keys[sender] = None
+    return keys
+
+def _verify_one(public_key, payload, signature):
+    if public_key is None or not signature:
+        return False
+    try:
+        return QuantumSecurity.verify_signature(public_key, payload, signature)
+    except (InvalidSignature, SecurityError, TypeError, ValueError):
+        # A signature of the wrong type fails like a wrong signature
+        return False
+
+def _verify_chunk(items):
+    """
+    Verifies (public_key, payload, signature) items with already parsed keys.
+    """
+    return [_verify_one(*item) for item in items]
+
+def _verify_serialized_chunk(items):
+    """
+    Verifies (sender, payload, signature) items in a worker process, parsing
+    each distinct sender key once per chunk.
+    """
+    keys = _parse_keys(sender for sender, _, _ in items)
+    return [_verify_one(keys[sender], payload, signature) for sender, payload, signature in items]
+
+def verify_batch(transactions, max_workers=None, use_processes=False, chunk_size=256):
+    """
+    Verifies the signatures of a batch of transactions and returns a list of
+    booleans in the same order.
+
+    With use_processes the chunks are verified in worker processes, which only
+    receive the serialized keys; otherwise keys are parsed once up front and
+    the chunks are verified on a thread pool.
+    """
+    transactions = list(transactions)
+    if not transactions:
+        return []
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if use_processes:
+        # Group by sender so each chunk parses as few distinct keys as possible
+        order = sorted(range(len(transactions)), key=lambda i: transactions[i].sender)
+        items = [(transactions[i].sender, transactions[i].signing_payload(), transactions[i].signature)
+                 for i in order]
+        worker, executor_class = _verify_serialized_chunk, ProcessPoolExecutor
+    else:
+        keys = _parse_keys(tx.sender for tx in transactions)
+        order = range(len(transactions))
+        items = [(keys[tx.sender], tx.signing_payload(), tx.signature) for tx in transactions]
+        worker, executor_class = _verify_chunk, ThreadPoolExecutor
+
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    if len(chunks) == 1 or max_workers == 1:
+        chunk_results = map(worker, chunks)
+    else:
+        with executor_class(max_workers=min(max_workers, len(chunks))) as executor:
+            chunk_results = list(executor.map(worker, chunks))
+
+    results = [False] * len(transactions)
+    flat = (result for chunk in chunk_results for result in chunk)
+    for position, result in zip(order, flat):
+        results[position] = result
+    return results
@@ -4,28 +4,249 @@
 Advanced implementation of mining management for a quantum-resistant blockchain.
 Includes features for block creation, proof-of-work, and mining coordination,
 with emphasis on security and scalability.
+
+MiningManager runs mining in the background: a scheduler thread keeps a block
+template built from the mempool on top of the current tip and has a pool of
+worker processes search its nonce space in ranges. Work on a template is
+abandoned as soon as the tip moves or a template with more fees can be built.
 """
 
-from block import Block
+import threading
+from collections import deque
+from time import monotonic, time
+from blockchain.chain import Block
+from blockchain.consensus import ConsensusError, ProofOfWorkConsensus
+from blockchain.pow_engine import ParallelProofOfWork
+
+class BlockTemplate:
+    """
+    A candidate block on top of a given tip. Its proof-of-work job is built
+    once and shared by every nonce range handed out for it.
+    """
+
+    def __init__(self, block):
+        self.block = block
+        self.fees = sum(transaction.get("fee", 0) for transaction in block.transactions)
+        self.created = monotonic()
+        self.job = block.mining_job()
+
+    @property
+    def previous_hash(self):
+        return self.block.previous_hash
+
+    @property
+    def age(self):
+        return monotonic() - self.created
+
+    def is_improved_by(self, transactions):
+        """
+        Returns True if a block of transactions pays more fees than this
+        template, or as much while confirming more transactions.
+        """
+        fees = sum(transaction.get("fee", 0) for transaction in transactions)
+        return (fees, len(transactions)) > (self.fees, len(self.block.transactions))
 
 class MiningManager:
-    def __init__(self, blockchain):
+    """
+    Background mining scheduler for a proof-of-work chain.
+
+    Nonce ranges of chunk_size go to workers worker processes. The tip is
+    checked every poll_interval seconds and the mempool every
+    refresh_interval seconds, or right away after notify(). Found blocks are
+    added to the chain and passed to on_block(block), e.g.
+    QuantumMiner.submit_block to announce them. difficulty defaults to the
+    consensus engine's.
+
+    The scheduler changes the blockchain under self.lock; other threads that
+    change the same blockchain while it runs must hold the lock too. Pass
+    lock to share an existing one, e.g. the Node.lock of a networked chain.
+    """
+
+    def __init__(self, blockchain, workers=None, chunk_size=20000, check_interval=1000, refresh_interval=1.0,
+                 poll_interval=0.05, on_block=None, difficulty=None, hashrate_window=10.0, lock=None):
         self.blockchain = blockchain  # Reference to the blockchain instance
+        self.workers = workers or blockchain.mining_workers
+        self.chunk_size = chunk_size
+        self.check_interval = check_interval
+        self.refresh_interval = refresh_interval
+        self.poll_interval = poll_interval
+        self.on_block = on_block
+        self.difficulty = difficulty
+        self.hashrate_window = hashrate_window
+        self.lock = lock if lock is not None else threading.RLock()
+        self.template = None  # BlockTemplate being searched
+        self.blocks_found = 0
+        self.stale_templates = 0
+        self._engine = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._wake = threading.Event()
+        self._checked = 0.0
+        self._samples = deque()  # (monotonic time, hashes tried) for the hashrate
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        Starts the scheduler thread and the worker pool.
+        """
+        if self.running:
+            return self
+        if not isinstance(self.blockchain.consensus, ProofOfWorkConsensus):
+            raise ConsensusError("Background mining needs a proof-of-work consensus engine.")
+        self._engine = ParallelProofOfWork(workers=self.workers, chunk_size=self.chunk_size,
+                                           check_interval=self.check_interval)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="mining-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the scheduler, abandoning the current template, and shuts down
+        the worker processes.
+        """
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._engine is not None:
+            self._engine.close()
+            self._engine = None
+        self.template = None
+
+    def notify(self):
+        """
+        Tells the scheduler the tip or the mempool changed, so the current
+        template is checked before the next refresh_interval.
+        """
+        self._wake.set()
+
+    def build_template(self):
+        """
+        Builds a template from the pending transactions on top of the current
+        tip, or returns None if there is nothing to mine.
+        """
+        with self.lock:
+            transactions = self.blockchain.select_transactions()
+            if not transactions:
+                return None
+            last_block = self.blockchain.last_block
+            return BlockTemplate(Block(last_block.index + 1, transactions, time(), last_block.hash))
 
     def mine_block(self, transactions):
         """
         Mines a new block by coordinating the proof-of-work process.
-        Placeholder for actual mining coordination logic.
+        The block of transactions is built on the current tip, sealed in the
+        caller's thread and added to the chain. Returns the block, or None if
+        the chain rejected it.
+        """
+        with self.lock:
+            last_block = self.blockchain.last_block
+            block = Block(last_block.index + 1, list(transactions), time(), last_block.hash)
+            proof = self.proof_of_work(block, self.difficulty)
+            if self.blockchain.add_mined_block(block, proof) is False:
+                return None
+        if self.on_block is not None:
+            self.on_block(block)
+        return block
+
+    def proof_of_work(self, block, difficulty=None):
+        """
+        Seals the block with the blockchain's consensus engine and returns its
+        hash. difficulty overrides the chain's proof-of-work target.
+        """
+        return self.blockchain.consensus.seal_block(block, difficulty)
+
+    @property
+    def hashrate(self):
+        """
+        Hashes per second over the last hashrate_window seconds.
         """
-        # Placeholder implementation
-        pass
+        if len(self._samples) < 2:
+            return 0.0
+        (first_time, first_hashes), (last_time, last_hashes) = self._samples[0], self._samples[-1]
+        return (last_hashes - first_hashes) / (last_time - first_time) if last_time > first_time else 0.0
 
-    def proof_of_work(self, block, difficulty):
+    @property
+    def template_age(self):
         """
-        Performs proof-of-work by finding a nonce that satisfies the difficulty requirement.
-        Placeholder for actual proof-of-work algorithm.
+        Seconds since the current template was built, or None while idle.
         """
-        # Placeholder implementation
-        pass
+        template = self.template
+        return None if template is None else template.age
+
+    def stats(self):
+        template = self.template
+        return {
+            "hashrate": self.hashrate,
+            "template_age": self.template_age,
+            "template_height": None if template is None else template.block.index,
+            "template_transactions": 0 if template is None else len(template.block.transactions),
+            "template_fees": 0 if template is None else template.fees,
+            "hashes": 0 if self._engine is None else self._engine.hashes,
+            "blocks_found": self.blocks_found,
+            "stale_templates": self.stale_templates,
+        }
+
+    def _sample_hashrate(self):
+        now = monotonic()
+        self._samples.append((now, self._engine.hashes))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.hashrate_window:
+            self._samples.popleft()
+
+    def _is_stale(self, template):
+        """
+        Polled by the nonce search: True once the template should be replaced.
+        """
+        self._sample_hashrate()
+        if self._stopping.is_set():
+            return True
+        if self.blockchain.block_tree.tip.hash != template.previous_hash:
+            return True
+        if not self._wake.is_set() and monotonic() - self._checked < self.refresh_interval:
+            return False
+        self._wake.clear()
+        self._checked = monotonic()
+        with self.lock:
+            return template.is_improved_by(self.blockchain.select_transactions())
+
+    def _run(self):
+        difficulty = self.difficulty
+        while not self._stopping.is_set():
+            self._wake.clear()
+            self._checked = monotonic()
+            template = self.template = self.build_template()
+            if template is None:
+                self._wake.wait(self.refresh_interval)
+                continue
+            if self.difficulty is None:
+                difficulty = self.blockchain.consensus.difficulty
+            nonce, block_hash, _ = self._engine.search(template.job, difficulty,
+                                                       is_stale=lambda: self._is_stale(template),
+                                                       poll_interval=self.poll_interval)
+            self._sample_hashrate()
+            stale = nonce is None
+            if not stale:
+                template.block.nonce = nonce
+                with self.lock:
+                    # The tip can move between the search and taking the lock
+                    stale = self.blockchain.block_tree.tip.hash != template.previous_hash
+                    accepted = not stale and self.blockchain.add_mined_block(template.block, block_hash) is not False
+            if stale:
+                if not self._stopping.is_set():
+                    self.stale_templates += 1
+                continue
+            if accepted:
+                self.blocks_found += 1
+                if self.on_block is not None:
+                    self.on_block(template.block)
+
+    def __enter__(self):
+        return self.start()
 
-# Placeholder for additional classes and functions related to mining management
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -5,43 +5,84 @@ Includes features for mining blocks using quantum-resistant algorithms and coord
 with other nodes in the network.
 """
 
-from block import Block
+from contextlib import nullcontext
+from blockchain.chain import Block
+from .mining_manager import MiningManager
 
 class QuantumMiner:
-    def __init__(self, blockchain):
+    def __init__(self, blockchain, node=None):
         self.blockchain = blockchain  # Reference to the blockchain instance
+        self.node = node  # Optional api.blockchain_operations.Node that gossips to peers
+        self.manager = None  # MiningManager while mining
 
-    def start_mining(self):
+    def start_mining(self, **options):
         """
         Initiates the mining process for the quantum-resistant miner node.
-        Placeholder for actual mining logic using quantum-resistant algorithms.
+        Mining runs in the background on a MiningManager, created with the
+        given options; every block it finds is submitted to the network.
+        With a node, the manager takes the node's lock so the scheduler and
+        the node's event loop never change the chain at the same time.
         """
-        # Placeholder implementation
-        pass
+        if self.node is not None:
+            options.setdefault("lock", self.node.lock)
+        if self.manager is None:
+            self.manager = MiningManager(self.blockchain, on_block=self.submit_block, **options)
+        return self.manager.start()
+
+    def _lock(self):
+        if self.manager is not None:
+            return self.manager.lock
+        return self.node.lock if self.node is not None else nullcontext()
+
+    def stop_mining(self):
+        """
+        Stops background mining.
+        """
+        if self.manager is not None:
+            self.manager.stop()
+            self.manager = None
 
     def process_transactions(self, transactions):
         """
         Processes transactions received from the network and includes them in the block
         being mined by the quantum-resistant miner node.
+        Signatures are verified in a batch; admitted transactions are announced
+        to the node's peers. Returns one boolean per transaction.
         """
-        # Placeholder implementation
-        pass
+        transactions = list(transactions)
+        with self._lock():
+            results = self.blockchain.add_new_transactions(transactions)
+        if self.manager is not None and any(results):
+            self.manager.notify()
+        if self.node is not None:
+            for transaction, admitted in zip(transactions, results):
+                if admitted:
+                    self.node.publish_transaction(transaction)
+        return results
 
     def find_nonce(self, block):
         """
         Finds a valid nonce for the given block using quantum-resistant algorithms.
-        Placeholder for actual quantum-resistant nonce finding logic.
+        The block is sealed by the chain's consensus engine; its nonce is
+        returned and its hash set.
         """
-        # Placeholder implementation
-        pass
+        block.hash = self.blockchain.proof_of_work(block)
+        return block.nonce
 
     def submit_block(self, mined_block):
         """
         Submits the mined block to the blockchain network for validation and inclusion.
-        Placeholder for block submission logic.
+        A block that is not in the local chain yet is appended first. Returns
+        False if the chain rejects it.
         """
-        # Placeholder implementation
-        pass
+        if self.blockchain.get_block_by_hash(mined_block.hash) is None:
+            with self._lock():
+                if not self.blockchain.add_block(mined_block, mined_block.hash):
+                    return False
+                self.blockchain.mempool.remove(mined_block.transactions)
+        if self.node is not None:
+            self.node.publish_block(mined_block)
+        return True
 
 # Placeholder for additional classes and functions related to quantum-resistant mining
 
@@ -1,2 +1,179 @@
 # UUID: ad578697-e97b-4313-a289-9d5566761ad9
+# quantum/error_correction/error_mitigation.py
 
+"""
+Error mitigation for circuits run on the local simulator backend
+(utils.quantum_simulation_tools.SimulatorBackend) or anything offering the
+same histograms(circuits, shots) call.
+
+Both techniques work on batches. Readout mitigation inverts per-qubit
+confusion matrices, measured once and cached, on a whole array of count
+histograms with one tensor contraction per qubit. Zero-noise extrapolation
+submits every noise-scaled variant of every circuit as one batch and fits
+all extrapolations together with a single polynomial fit over arrays.
+"""
+
+import weakref
+import numpy as np
+from utils.quantum_simulation_tools import QuantumCircuit
+
+def counts_to_array(histograms, num_qubits):
+    """
+    Stacks {bitstring: count} dicts into a (histograms, 2**num_qubits)
+    array indexed by basis state.
+    """
+    array = np.zeros((len(histograms), 1 << num_qubits))
+    for row, counts in enumerate(histograms):
+        for bitstring, count in counts.items():
+            array[row, int(bitstring, 2)] = count
+    return array
+
+class ReadoutMitigator:
+    """
+    Tensored readout-error mitigation for num_qubits qubits.
+
+    Calibration prepares all-zeros and all-ones on the backend and
+    estimates each qubit's 2x2 confusion matrix A[measured, prepared],
+    assuming readout errors are independent between qubits. The inverses
+    are computed once; for_backend caches one mitigator per backend, width
+    and number of calibration shots so the calibration runs are shared.
+    The backend is released once calibration is done, so cached mitigators
+    do not keep their backend alive.
+    """
+
+    _cache = weakref.WeakKeyDictionary()  # backend -> {(num_qubits, shots): mitigator}
+
+    def __init__(self, backend, num_qubits, shots=8192):
+        self.backend = backend  # None once calibrated
+        self.num_qubits = num_qubits
+        self.shots = shots
+        self.confusion = None  # (num_qubits, 2, 2), qubit 0 first
+        self._inverses = None
+
+    @classmethod
+    def for_backend(cls, backend, num_qubits, shots=8192):
+        """
+        Returns the calibrated mitigator for backend, calibrating it on first use.
+        """
+        mitigators = cls._cache.setdefault(backend, {})
+        key = (num_qubits, shots)
+        if key not in mitigators:
+            mitigators[key] = cls(backend, num_qubits, shots).calibrate()
+        return mitigators[key]
+
+    def calibrate(self):
+        """
+        Measures the confusion matrices if that has not been done yet.
+        """
+        if self._inverses is not None:
+            return self
+        zeros = QuantumCircuit(self.num_qubits)
+        ones = QuantumCircuit(self.num_qubits)
+        for qubit in range(self.num_qubits):
+            # A fresh register is all zeros; the identity gate keeps both circuits the same depth
+            zeros.gate(np.eye(2), qubit)
+            ones.x(qubit)
+        histograms = self.backend.histograms([zeros, ones], self.shots)
+        states = np.arange(1 << self.num_qubits)
+        self.confusion = np.empty((self.num_qubits, 2, 2))
+        for qubit in range(self.num_qubits):
+            read_one = ((states >> qubit) & 1).astype(bool)
+            for prepared in (0, 1):
+                flipped = histograms[prepared, read_one if prepared == 0 else ~read_one].sum() / self.shots
+                self.confusion[qubit, 1 - prepared, prepared] = flipped
+                self.confusion[qubit, prepared, prepared] = 1 - flipped
+        self._inverses = np.linalg.inv(self.confusion)
+        self.backend = None
+        return self
+
+    @property
+    def matrix(self):
+        """
+        The full 2**n x 2**n calibration matrix, for inspection of small registers.
+        """
+        self.calibrate()
+        matrix = np.ones((1, 1))
+        for qubit in reversed(range(self.num_qubits)):
+            matrix = np.kron(matrix, self.confusion[qubit])
+        return matrix
+
+    def apply(self, histograms, clip=True):
+        """
+        Returns mitigated probability distributions for a batch of count
+        histograms, given as a (batch, 2**n) array or a list of
+        {bitstring: count} dicts. With clip, negative quasi-probabilities are
+        set to zero and each row renormalised.
+        """
+        self.calibrate()
+        if not isinstance(histograms, np.ndarray):
+            histograms = counts_to_array(histograms, self.num_qubits)
+        histograms = np.atleast_2d(histograms).astype(float)
+        totals = histograms.sum(axis=1, keepdims=True)
+        # One axis per qubit, highest qubit first after the batch axis
+        tensor = (histograms / np.where(totals, totals, 1)).reshape((-1,) + (2,) * self.num_qubits)
+        for qubit in range(self.num_qubits):
+            axis = self.num_qubits - qubit
+            tensor = np.moveaxis(np.tensordot(self._inverses[qubit], tensor, axes=([1], [axis])), 0, axis)
+        probabilities = tensor.reshape(len(histograms), -1)
+        if clip:
+            np.clip(probabilities, 0, None, out=probabilities)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+        return probabilities
+
+def fold_gates(circuit, scale):
+    """
+    Returns circuit with each gate G replaced by G (G^dagger G)^k, where
+    scale = 2k + 1 is an odd integer. The folded circuit has the same
+    effect, and scale times the gates and so about scale times the noise.
+    """
+    if scale < 1 or scale % 2 != 1:
+        raise ValueError("Gate folding needs an odd integer scale factor.")
+    folded = QuantumCircuit(circuit.num_qubits)
+    for kind, qubits, matrix in circuit.operations:
+        inverse = None if matrix is None else matrix.conj().T
+        folded.operations.append((kind, qubits, matrix))
+        for _ in range(scale // 2):
+            folded.operations.append((kind, qubits, inverse))
+            folded.operations.append((kind, qubits, matrix))
+    return folded
+
+def parity_signs(num_qubits, observables):
+    """
+    Returns a (observables, 2**num_qubits) array of the eigenvalue (+1 or -1)
+    of each Z-parity observable, given as a tuple of qubits, on every basis state.
+    """
+    states = np.arange(1 << num_qubits)
+    signs = np.ones((len(observables), len(states)))
+    for row, qubits in enumerate(observables):
+        mask = sum(1 << qubit for qubit in qubits)
+        signs[row] -= 2 * (np.bitwise_count(states & mask) & 1)
+    return signs
+
+def zero_noise_extrapolation(backend, circuits, observables, scale_factors=(1, 3, 5), shots=8192, degree=None,
+                             mitigator=None):
+    """
+    Estimates the noise-free expectation values of Z-parity observables for
+    each circuit and returns them as a (circuits, observables) array.
+
+    Every circuit is folded at every scale factor and the whole batch goes to
+    the backend at once. The expectation values at each scale are fitted
+    with a polynomial of the given degree, by default len(scale_factors) - 1
+    (Richardson extrapolation), and evaluated at zero noise. mitigator, e.g.
+    a ReadoutMitigator, corrects the histograms first.
+    """
+    circuits = list(circuits)
+    num_qubits = circuits[0].num_qubits
+    scale_factors = np.asarray(scale_factors, dtype=float)
+    degree = len(scale_factors) - 1 if degree is None else degree
+    variants = [fold_gates(circuit, int(scale)) for circuit in circuits for scale in scale_factors]
+    histograms = backend.histograms(variants, shots)
+    if mitigator is not None:
+        probabilities = mitigator.apply(histograms)
+    else:
+        probabilities = histograms / histograms.sum(axis=1, keepdims=True)
+    values = probabilities @ parity_signs(num_qubits, observables).T  # (variants, observables)
+    values = values.reshape(len(circuits), len(scale_factors), len(observables))
+    # polyfit fits every (circuit, observable) column in one call
+    columns = values.transpose(1, 0, 2).reshape(len(scale_factors), -1)
+    coefficients = np.polyfit(scale_factors, columns, degree)
+    return coefficients[-1].reshape(len(circuits), len(observables))
@@ -1,2 +1,404 @@
 # UUID: ba717539-f74d-4fad-b347-b72356e95774
+# quantum/error_correction/qec.py
 
+"""
+Stabilizer simulation and decoding for evaluating quantum error-correcting
+codes.
+
+StabilizerTableau runs Clifford circuits in polynomial time with the
+Aaronson-Gottesman tableau: one row of X and Z bits per destabilizer and
+stabilizer generator, packed 64 qubits to a uint64 word. Gates touch one bit
+column across all rows; measurements multiply whole packed rows.
+
+For Monte Carlo estimates of logical error rates the data-qubit errors of a
+shot are one uint64 mask, so a batch of shots is a NumPy vector. Syndromes are
+parities of those masks against each check, and a lookup table, built once
+per code and cached, maps each syndrome to its minimum-weight correction.
+"""
+
+from time import perf_counter
+import numpy as np
+
+WORD_BITS = 64
+MAX_LOOKUP_CHECKS = 24  # 2**24 table entries of 8 bytes
+
+def _pauli_product(x1, z1, r1, x2, z2, r2):
+    """
+    Multiplies packed Pauli rows, returning P1 * P2 as (x, z, r) with r the
+    sign bit. Rows broadcast over any leading axes. The phase is the
+    Aaronson-Gottesman g function, summed over qubits as popcounts of the
+    qubits contributing +i and -i.
+    """
+    y1, only_x1, only_z1 = x1 & z1, x1 & ~z1, z1 & ~x1
+    plus = (y1 & z2 & ~x2) | (only_x1 & z2 & x2) | (only_z1 & x2 & ~z2)
+    minus = (y1 & x2 & ~z2) | (only_x1 & z2 & ~x2) | (only_z1 & x2 & z2)
+    phase = (2 * r1.astype(np.int64) + 2 * r2.astype(np.int64)
+             + np.bitwise_count(plus).sum(axis=-1, dtype=np.int64)
+             - np.bitwise_count(minus).sum(axis=-1, dtype=np.int64)) % 4
+    return x1 ^ x2, z1 ^ z2, (phase == 2).astype(np.uint8)
+
+class StabilizerTableau:
+    """
+    Stabilizer state of num_qubits qubits, starting in |0...0>.
+
+    Rows 0..n-1 hold the destabilizers and rows n..2n-1 the stabilizer
+    generators; x and z are (2n, words) uint64 arrays with qubit q at bit
+    q % 64 of word q // 64, and r holds each row's sign bit.
+    """
+
+    def __init__(self, num_qubits, seed=None):
+        self.num_qubits = num_qubits
+        words = -(-num_qubits // WORD_BITS)
+        self.x = np.zeros((2 * num_qubits, words), dtype=np.uint64)
+        self.z = np.zeros((2 * num_qubits, words), dtype=np.uint64)
+        self.r = np.zeros(2 * num_qubits, dtype=np.uint8)
+        self.rng = np.random.default_rng(seed)
+        for qubit in range(num_qubits):
+            word, bit = divmod(qubit, WORD_BITS)
+            self.x[qubit, word] = 1 << bit
+            self.z[num_qubits + qubit, word] = 1 << bit
+
+    def _columns(self, qubit):
+        """
+        Returns (x word column, z word column, bit) for a qubit; the columns
+        are views, so updating them updates the tableau.
+        """
+        word, bit = divmod(qubit, WORD_BITS)
+        return self.x[:, word], self.z[:, word], bit
+
+    def _bits(self, column, bit):
+        return (column >> bit) & 1
+
+    def h(self, qubit):
+        x, z, bit = self._columns(qubit)
+        self.r ^= (self._bits(x, bit) & self._bits(z, bit)).astype(np.uint8)
+        swapped = (x ^ z) & (1 << bit)
+        x ^= swapped
+        z ^= swapped
+
+    def s(self, qubit):
+        x, z, bit = self._columns(qubit)
+        self.r ^= (self._bits(x, bit) & self._bits(z, bit)).astype(np.uint8)
+        z ^= x & (1 << bit)
+
+    def x_gate(self, qubit):
+        _, z, bit = self._columns(qubit)
+        self.r ^= self._bits(z, bit).astype(np.uint8)
+
+    def z_gate(self, qubit):
+        x, _, bit = self._columns(qubit)
+        self.r ^= self._bits(x, bit).astype(np.uint8)
+
+    def y_gate(self, qubit):
+        x, z, bit = self._columns(qubit)
+        self.r ^= (self._bits(x, bit) ^ self._bits(z, bit)).astype(np.uint8)
+
+    def cx(self, control, target):
+        x_control, z_control, control_bit = self._columns(control)
+        x_target, z_target, target_bit = self._columns(target)
+        xc, zc = self._bits(x_control, control_bit), self._bits(z_control, control_bit)
+        xt, zt = self._bits(x_target, target_bit), self._bits(z_target, target_bit)
+        self.r ^= (xc & zt & (xt ^ zc ^ 1)).astype(np.uint8)
+        x_target ^= xc << target_bit
+        z_control ^= zt << control_bit
+
+    def cz(self, first, second):
+        self.h(second)
+        self.cx(first, second)
+        self.h(second)
+
+    def measure(self, qubit):
+        """
+        Measures a qubit in the Z basis, collapsing the state, and returns
+        the outcome bit.
+        """
+        n = self.num_qubits
+        x, _, bit = self._columns(qubit)
+        has_x = self._bits(x, bit).astype(bool)
+        anticommuting = np.flatnonzero(has_x[n:])
+        if len(anticommuting):
+            # Random outcome: make every other row commute with Z_qubit by
+            # multiplying in the first anticommuting stabilizer, then replace it
+            p = n + anticommuting[0]
+            rows = np.flatnonzero(has_x)
+            rows = rows[rows != p]
+            self.x[rows], self.z[rows], self.r[rows] = _pauli_product(
+                self.x[p], self.z[p], self.r[p], self.x[rows], self.z[rows], self.r[rows])
+            self.x[p - n], self.z[p - n], self.r[p - n] = self.x[p], self.z[p], self.r[p]
+            outcome = int(self.rng.integers(2))
+            word = qubit // WORD_BITS
+            self.x[p] = 0
+            self.z[p] = 0
+            self.z[p, word] = 1 << bit
+            self.r[p] = outcome
+            return outcome
+
+        # Deterministic outcome: the sign of the product of the stabilizers
+        # paired with destabilizers that anticommute with Z_qubit. These
+        # commute, so the product can be taken as a tree of vectorised pairs.
+        rows = n + np.flatnonzero(has_x[:n])
+        xs, zs, rs = self.x[rows], self.z[rows], self.r[rows]
+        while len(rs) > 1:
+            half = len(rs) // 2
+            paired = _pauli_product(xs[:half], zs[:half], rs[:half],
+                                    xs[half:2 * half], zs[half:2 * half], rs[half:2 * half])
+            if len(rs) % 2:
+                paired = tuple(np.concatenate((part, whole[-1:])) for part, whole in zip(paired, (xs, zs, rs)))
+            xs, zs, rs = paired
+        return int(rs[0]) if len(rs) else 0
+
+    def reset(self, qubit):
+        """
+        Returns a qubit to |0>.
+        """
+        if self.measure(qubit):
+            self.x_gate(qubit)
+
+    def run(self, operations):
+        """
+        Applies (name, *qubits) operations, where name is one of h, s, x, y,
+        z, cx, cz, measure and reset, and returns the measurement outcomes in
+        order.
+        """
+        outcomes = []
+        gates = {"h": self.h, "s": self.s, "x": self.x_gate, "y": self.y_gate, "z": self.z_gate,
+                 "cx": self.cx, "cz": self.cz, "reset": self.reset}
+        for name, *qubits in operations:
+            if name == "measure":
+                outcomes.append(self.measure(*qubits))
+            else:
+                gates[name](*qubits)
+        return outcomes
+
+    def stabilizers(self):
+        """
+        Returns the stabilizer generators as strings such as '+XZ_',
+        qubit 0 first.
+        """
+        generators = []
+        for row in range(self.num_qubits, 2 * self.num_qubits):
+            paulis = []
+            for qubit in range(self.num_qubits):
+                word, bit = divmod(qubit, WORD_BITS)
+                has_x, has_z = (int(self.x[row, word]) >> bit) & 1, (int(self.z[row, word]) >> bit) & 1
+                paulis.append("_XZY"[has_x + 2 * has_z])
+            generators.append(("-" if self.r[row] else "+") + "".join(paulis))
+        return generators
+
+class CSSCode:
+    """
+    A CSS code on num_data data qubits. Checks and logical operators are
+    bitmasks over the data qubits: X-type checks detect Z errors and Z-type
+    checks detect X errors. An X error is a logical failure when it flips
+    logical_z, a Z error when it flips logical_x.
+    """
+
+    def __init__(self, name, distance, num_data, x_checks, z_checks, logical_x, logical_z):
+        self.name = name
+        self.distance = distance
+        self.num_data = num_data
+        self.x_checks = x_checks
+        self.z_checks = z_checks
+        self.logical_x = logical_x
+        self.logical_z = logical_z
+
+    @property
+    def num_checks(self):
+        return len(self.x_checks) + len(self.z_checks)
+
+    def syndrome_circuit(self):
+        """
+        Returns tableau operations that measure every check with its own
+        ancilla, X-type checks first; ancillas follow the data qubits and
+        are reset after use, so the circuit can be repeated.
+        """
+        operations = []
+        ancilla = self.num_data
+        for checks, is_x in ((self.x_checks, True), (self.z_checks, False)):
+            for mask in checks:
+                support = [qubit for qubit in range(self.num_data) if (mask >> qubit) & 1]
+                if is_x:
+                    operations.append(("h", ancilla))
+                    operations += [("cx", ancilla, qubit) for qubit in support]
+                    operations.append(("h", ancilla))
+                else:
+                    operations += [("cx", qubit, ancilla) for qubit in support]
+                operations += [("measure", ancilla), ("reset", ancilla)]
+                ancilla += 1
+        return operations
+
+    @staticmethod
+    def syndromes(errors, checks):
+        """
+        Returns the syndrome of each error mask as an integer whose bit i is
+        the parity of the error against checks[i].
+        """
+        errors = np.asarray(errors, dtype=np.uint64)
+        syndromes = np.zeros(errors.shape, dtype=np.int64)
+        for position, mask in enumerate(checks):
+            syndromes |= (np.bitwise_count(errors & np.uint64(mask)) & 1).astype(np.int64) << position
+        return syndromes
+
+def repetition_code(distance):
+    """
+    Bit-flip repetition code: Z-type checks on neighbouring qubits. It has no
+    X-type checks, so any odd number of Z errors is a logical failure.
+    """
+    z_checks = [(1 << qubit) | (1 << (qubit + 1)) for qubit in range(distance - 1)]
+    return CSSCode("repetition", distance, distance, [], z_checks, (1 << distance) - 1, 1)
+
+def surface_code(distance):
+    """
+    Rotated surface code on a distance x distance grid of data qubits, with
+    qubit (row, column) at row * distance + column. Weight-two X-type checks
+    lie on the top and bottom boundaries and Z-type ones on the left and
+    right; logical Z runs along the first row and logical X down the first
+    column.
+    """
+    x_checks, z_checks = [], []
+    for i in range(distance + 1):
+        for j in range(distance + 1):
+            support = [row * distance + column for row, column in ((i - 1, j - 1), (i - 1, j), (i, j - 1), (i, j))
+                       if 0 <= row < distance and 0 <= column < distance]
+            mask = sum(1 << qubit for qubit in support)
+            is_x = (i + j) % 2 == 0
+            if len(support) == 4:
+                (x_checks if is_x else z_checks).append(mask)
+            elif len(support) == 2 and is_x and i in (0, distance):
+                x_checks.append(mask)
+            elif len(support) == 2 and not is_x and j in (0, distance):
+                z_checks.append(mask)
+    logical_z = (1 << distance) - 1
+    logical_x = sum(1 << (row * distance) for row in range(distance))
+    return CSSCode("surface", distance, distance * distance, x_checks, z_checks, logical_x, logical_z)
+
+class LookupDecoder:
+    """
+    Maps every syndrome of a set of checks to a minimum-weight error with that
+    syndrome. The table is filled breadth-first from the empty error, adding
+    one single-qubit error per level, so each syndrome is first reached by a
+    minimum-weight error; the work is O(2**checks * num_data). Syndromes not
+    reached within max_weight errors decode to no correction. Decoders are
+    cached per code and check type by for_code.
+    """
+
+    _cache = {}
+
+    def __init__(self, checks, num_data, max_weight=None):
+        if len(checks) > MAX_LOOKUP_CHECKS:
+            raise ValueError(f"A lookup table for {len(checks)} checks would have 2**{len(checks)} entries.")
+        if num_data > WORD_BITS:
+            raise ValueError(f"Error masks hold at most {WORD_BITS} data qubits.")
+        self.checks = list(checks)
+        self.num_data = num_data
+        self.table = np.zeros(1 << len(self.checks), dtype=np.uint64)
+        seen = np.zeros(len(self.table), dtype=bool)
+        seen[0] = True
+        single = CSSCode.syndromes([1 << qubit for qubit in range(num_data)], self.checks)
+        frontier = np.zeros(1, dtype=np.int64)
+        weight = 0
+        while len(frontier) and (max_weight is None or weight < max_weight):
+            reached = []
+            for qubit in range(num_data):
+                # XOR with a fixed syndrome is one-to-one, so there are no
+                # duplicates within a qubit's step
+                neighbours = frontier ^ single[qubit]
+                fresh = ~seen[neighbours]
+                neighbours = neighbours[fresh]
+                seen[neighbours] = True
+                self.table[neighbours] = self.table[frontier[fresh]] | np.uint64(1 << qubit)
+                reached.append(neighbours)
+            frontier = np.concatenate(reached)
+            weight += 1
+        self.coverage = float(seen.mean())
+
+    @classmethod
+    def for_code(cls, code, check_type):
+        """
+        Returns the cached decoder for a code's "x" or "z" checks.
+        """
+        key = (code.name, code.distance, check_type)
+        if key not in cls._cache:
+            checks = code.x_checks if check_type == "x" else code.z_checks
+            cls._cache[key] = cls(checks, code.num_data)
+        return cls._cache[key]
+
+    def decode(self, syndromes):
+        """
+        Returns the correction mask for each syndrome.
+        """
+        return self.table[syndromes]
+
+def sample_errors(code, error_rate, shots, noise, rng):
+    """
+    Samples (x_errors, z_errors) masks for shots independent shots. Under
+    "bit_flip" noise each data qubit suffers an X error with probability
+    error_rate; under "depolarizing" it suffers X, Y or Z with probability
+    error_rate / 3 each.
+    """
+    x_errors = np.zeros(shots, dtype=np.uint64)
+    z_errors = np.zeros(shots, dtype=np.uint64)
+    for qubit in range(code.num_data):
+        draws = rng.random(shots)
+        if noise == "bit_flip":
+            x_errors |= (draws < error_rate).astype(np.uint64) << np.uint64(qubit)
+        elif noise == "depolarizing":
+            # [0, p/3): X, [p/3, 2p/3): Y, [2p/3, p): Z
+            x_errors |= (draws < 2 * error_rate / 3).astype(np.uint64) << np.uint64(qubit)
+            z_errors |= ((draws >= error_rate / 3) & (draws < error_rate)).astype(np.uint64) << np.uint64(qubit)
+        else:
+            raise ValueError(f"Unsupported noise model: {noise}")
+    return x_errors, z_errors
+
+def logical_failures(code, x_errors, z_errors):
+    """
+    Decodes each shot with the cached lookup decoders and returns a boolean
+    array marking the shots left with a logical error.
+    """
+    failures = np.zeros(len(x_errors), dtype=bool)
+    for errors, checks, check_type, logical in ((x_errors, code.z_checks, "z", code.logical_z),
+                                                (z_errors, code.x_checks, "x", code.logical_x)):
+        residual = errors ^ LookupDecoder.for_code(code, check_type).decode(CSSCode.syndromes(errors, checks))
+        failures |= (np.bitwise_count(residual & np.uint64(logical)) & 1).astype(bool)
+    return failures
+
+def logical_error_rate(code, error_rate, shots, noise="depolarizing", seed=None, batch_size=1 << 18):
+    """
+    Monte Carlo estimate of the logical error rate of code at a physical
+    error rate, under code-capacity noise (perfect syndrome measurements).
+    """
+    rng = np.random.default_rng(seed)
+    failures = 0
+    for start in range(0, shots, batch_size):
+        x_errors, z_errors = sample_errors(code, error_rate, min(batch_size, shots - start), noise, rng)
+        failures += int(logical_failures(code, x_errors, z_errors).sum())
+    return failures / shots
+
+def sweep(codes, error_rates, shots, noise="depolarizing", seed=None):
+    """
+    Returns a (codes, error rates) array of logical error rates.
+    """
+    rng = np.random.default_rng(seed)
+    return np.array([[logical_error_rate(code, error_rate, shots, noise, seed=rng.integers(2 ** 63))
+                      for error_rate in error_rates] for code in codes])
+
+def benchmark_sweep(distances=(3, 5), error_rates=(0.01, 0.03, 0.1), shots=1_000_000, noise="depolarizing"):
+    """
+    Runs a surface-code sweep and returns (rates, shots per second). Table
+    construction is excluded, as later sweeps reuse the cached tables.
+    """
+    codes = [surface_code(distance) for distance in distances]
+    for code in codes:
+        LookupDecoder.for_code(code, "x")
+        LookupDecoder.for_code(code, "z")
+    started = perf_counter()
+    rates = sweep(codes, error_rates, shots, noise, seed=0)
+    elapsed = perf_counter() - started
+    return rates, len(codes) * len(error_rates) * shots / elapsed
+
+if __name__ == "__main__":
+    distances, error_rates = (3, 5), (0.01, 0.03, 0.1)
+    rates, shots_per_second = benchmark_sweep(distances, error_rates)
+    for distance, row in zip(distances, rates):
+        print(f"surface d={distance}: " + ", ".join(f"p={p:g} -> {rate:.2e}" for p, rate in zip(error_rates, row)))
+    print(f"{shots_per_second * 60:,.0f} shots/minute")
@@ -64,12 +64,12 @@ class DilithiumSignature:
         return "signature"
 
     @staticmethod
-def verify(public_key, message, signature):
-    """
-    Verifies a signature against a message using the public key.
-    """
-    # Actual implementation would verify the signature
-    return True
+    def verify(public_key, message, signature):
+        """
+        Verifies a signature against a message using the public key.
+        """
+        # Actual implementation would verify the signature
+        return True
 
 # Demonstration of usage
 if __name__ == "__main__":
@@ -8,7 +8,8 @@ into the blockchain. It abstracts the complexity of quantum-resistant algorithms
 distribution (QKD) mechanisms, providing a simplified API for the rest of the blockchain system.
 """
 
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional
+from utils.quantum_simulation_tools import QuantumCircuit, StateVectorSimulator
 from .quantum_algorithms import KyberKEM, DilithiumSignature
 
 class QuantumInterface:
@@ -75,6 +76,16 @@ class QuantumInterface:
         else:
             raise ValueError(f"Verification not supported for algorithm: {algorithm}")
 
+    @staticmethod
+    def run_circuit(circuit: QuantumCircuit, shots: int = 1024, qubits=None, seed=None, **options) -> Dict[str, int]:
+        """
+        Runs a circuit on the local state-vector simulator and returns the
+        measured {bitstring: count} over the given number of shots. Options
+        are passed on to StateVectorSimulator, e.g. dtype.
+        """
+        simulator = StateVectorSimulator(circuit.num_qubits, **options)
+        return simulator.run(circuit).counts(shots, qubits, seed)
+
 # Example usage demonstrating the interface
 if __name__ == "__main__":
     # Key generation example using Kyber
@@ -1,2 +1,302 @@
 # UUID: 4ef77c14-3ce5-4482-afd5-909b78c849cd
 
+import asyncio
+
+import pytest
+
+from api.blockchain_operations import (INV_BLOCK, INV_TX, MSG_BLOCK, MSG_GETHEADERS, MSG_INV, MSG_TX, LocalNetwork,
+                                      Node, Peer, ProtocolError, decode_inventory)
+from api.chain_sync import ChainSync, SyncError, benchmark_sync, verify_headers
+from api.quantum_computing_access import DONE, FAILED, QUEUED, JobError, QuantumJobQueue
+from blockchain.chain import Block, Blockchain, Transaction, hash_to_bytes
+from blockchain.quantum_security import QuantumSecurity
+from blockchain.storage import MemoryBlockStore
+from mining.quantum_miner import QuantumMiner
+from utils.quantum_simulation_tools import QuantumCircuit
+
+
+def _signed(count):
+    private_key, address = QuantumSecurity.generate_keypair()
+    transactions = []
+    for nonce in range(count):
+        transaction = Transaction(address, "recipient", 1, nonce=nonce)
+        transaction.sign(private_key)
+        transactions.append(transaction)
+    return transactions
+
+
+def test_gossip_reaches_every_node_once():
+    async def run():
+        async with LocalNetwork(5, degree=3) as network:
+            origin = network.nodes[0]
+            miner = QuantumMiner(origin.blockchain, node=origin)
+            transactions = _signed(30)
+            assert all(miner.process_transactions(transactions))
+            await network.wait_for(lambda: all(len(node.blockchain.mempool) == 30 for node in network.nodes))
+            # Inventory announcements mean each node downloads each transaction once
+            assert all(node.messages_received[MSG_TX] == 30 for node in network.nodes[1:])
+
+            # A forged transaction is not accepted or relayed
+            forged = _signed(1)[0]
+            forged.amount = 1000
+            network.nodes[1].blockchain.mempool.add(forged.to_dict())
+            network.nodes[1].publish_transaction(forged)
+
+            assert origin.blockchain.mine() == 1
+            assert miner.submit_block(origin.blockchain.last_block)
+            await network.wait_for(lambda: all(len(node.blockchain.chain) == 2 for node in network.nodes))
+            assert all(node.blockchain.last_block.hash == origin.blockchain.last_block.hash for node in network.nodes)
+            assert all(len(node.blockchain.mempool) == 0 for node in network.nodes if node is not network.nodes[1])
+
+            report = await network.measure_transactions(_signed(20))
+            assert report.items == 20 and len(report.latencies) == 20 * 4
+            assert report.max_latency >= report.mean_latency > 0
+
+    asyncio.run(run())
+
+
+def test_background_miner_shares_the_node_lock():
+    node = Node(Blockchain(mining_workers=1))
+    miner = QuantumMiner(node.blockchain, node=node)
+    manager = miner.start_mining(refresh_interval=0.01)
+    try:
+        assert manager.lock is node.lock
+    finally:
+        miner.stop_mining()
+
+
+def test_orphan_blocks_connect_when_their_parent_arrives():
+    async def run():
+        async with LocalNetwork(2) as network:
+            origin, follower = network.nodes
+            parent = Block(1, [], 1.0, origin.blockchain.last_block.hash)
+            parent.hash = origin.blockchain.proof_of_work(parent)
+            child = Block(2, [], 2.0, parent.hash)
+            child.hash = origin.blockchain.proof_of_work(child)
+            peer = next(iter(follower.peers))
+            await follower.handle_message(peer, MSG_BLOCK, child.to_bytes())
+            assert len(follower.blockchain.chain) == 1
+            await follower.handle_message(peer, MSG_BLOCK, parent.to_bytes())
+            assert follower.blockchain.last_block.hash == child.hash
+            assert not follower._orphans and not follower._orphans_by_parent
+
+            # The orphan buffer holds max_orphans blocks in total, each once
+            follower.max_orphans = 2
+            orphans = []
+            for timestamp in range(3):
+                orphan = Block(5, [], float(timestamp), "ab" * 32)
+                orphan.hash = origin.blockchain.proof_of_work(orphan)
+                orphans.append(orphan)
+                await follower.handle_message(peer, MSG_BLOCK, orphan.to_bytes())
+            follower._add_orphan(orphans[2])
+            assert list(follower._orphans) == [orphans[1].hash, orphans[2].hash]
+            assert follower._orphans_by_parent == {"ab" * 32: [orphans[1].hash, orphans[2].hash]}
+
+    asyncio.run(run())
+
+
+def test_peer_blocks_with_unsigned_transactions_are_rejected():
+    async def run():
+        async with LocalNetwork(2) as network:
+            origin, follower = network.nodes
+            peer = next(iter(follower.peers))
+            theft = {"sender": "victim", "recipient": "thief", "amount": 50, "fee": 0, "nonce": 0}
+            block = Block(1, [theft], 1.0, origin.blockchain.last_block.hash)
+            block.hash = origin.blockchain.proof_of_work(block)
+            await follower.handle_message(peer, MSG_BLOCK, block.to_bytes())
+            assert len(follower.blockchain.chain) == 1
+
+            # Orphans are checked before they are buffered
+            orphan = Block(2, [theft], 2.0, "ab" * 32)
+            orphan.hash = origin.blockchain.proof_of_work(orphan)
+            await follower.handle_message(peer, MSG_BLOCK, orphan.to_bytes())
+            assert not follower._orphans
+
+            signed = Block(1, [_signed(1)[0].to_dict()], 1.0, origin.blockchain.last_block.hash)
+            signed.hash = origin.blockchain.proof_of_work(signed)
+            await follower.handle_message(peer, MSG_BLOCK, signed.to_bytes())
+            assert follower.blockchain.last_block.hash == signed.hash
+
+    asyncio.run(run())
+
+
+def test_peer_messages_are_checked():
+    async def run():
+        async with LocalNetwork(2) as network:
+            follower = network.nodes[1]
+            peer = next(iter(follower.peers))
+            unsigned = Transaction("alice", "bob", 1)
+            await follower.handle_message(peer, MSG_TX, unsigned.to_bytes())
+            assert len(follower.blockchain.mempool) == 0
+            await follower.handle_message(peer, MSG_TX, _signed(1)[0].to_bytes())
+            assert len(follower.blockchain.mempool) == 1
+
+            # Malformed requests are protocol errors, which close the connection
+            with pytest.raises(ProtocolError):
+                await follower.handle_message(peer, MSG_GETHEADERS, b"\x00" * 3)
+            with pytest.raises(ProtocolError):
+                await follower.handle_message(peer, MSG_INV, b"\x01" * 10)
+
+            follower.max_received = 2
+            for transaction in _signed(3):
+                await follower.handle_message(peer, MSG_TX, transaction.to_bytes())
+            assert len(follower.received_at) == 2
+
+    asyncio.run(run())
+
+
+def test_slow_peer_announcements_are_capped():
+    class Writer:
+        def get_extra_info(self, name):
+            return None
+
+    peer = Peer(None, None, Writer(), max_inventory=3)
+    for i in range(5):
+        peer.announce((INV_TX, bytes([i]) * 32))
+    peer.known.add((INV_BLOCK, b"\x09" * 32))
+    peer.announce((INV_BLOCK, b"\x09" * 32))
+    assert len(peer._inventory) == 3 and peer.dropped_announcements == 2
+
+
+def test_headers_first_sync_from_several_peers(monkeypatch):
+    monkeypatch.setattr(Blockchain, "difficulty", 2)
+    report = benchmark_sync(blocks=40, peers=3, transactions_per_block=5, window=12, batch=4, workers=1)
+    assert report.blocks == 40
+    assert len(report.blocks_by_peer) == 3 and sum(report.blocks_by_peer.values()) == 40
+    assert report.blocks_per_second > 0
+
+
+def test_sync_gives_up_on_a_block_no_peer_delivers(monkeypatch):
+    monkeypatch.setattr(Blockchain, "difficulty", 1)
+
+    async def run():
+        async with LocalNetwork(2) as network:
+            server, node = network.nodes
+            block = Block(1, [], 1.0, server.blockchain.last_block.hash)
+            assert server.blockchain.add_block(block, server.blockchain.proof_of_work(block))
+
+            async def ignore(peer, payload):
+                pass
+
+            # The server offers the header but never sends the body
+            server._on_getdata = ignore
+            with pytest.raises(SyncError, match="No peer delivered block 0"):
+                await ChainSync(node, timeout=0.05, workers=1, max_requeues=2).run()
+            assert len(node.blockchain.chain) == 1
+
+    asyncio.run(run())
+
+
+def test_sync_drops_a_peer_that_sends_invalid_bodies(monkeypatch):
+    monkeypatch.setattr(Blockchain, "difficulty", 1)
+
+    async def run():
+        async with LocalNetwork(3) as network:
+            honest, tampering, node = network.nodes
+            parent = honest.blockchain.last_block
+            for timestamp in range(1, 5):
+                block = Block(parent.index + 1, [], float(timestamp), parent.hash)
+                proof = honest.blockchain.proof_of_work(block)
+                assert honest.blockchain.add_block(block, proof)
+                copy = Block(block.index, [], block.timestamp, parent.hash, block.nonce)
+                assert tampering.blockchain.add_block(copy, proof)
+                parent = block
+
+            async def send_tampered(peer, payload):
+                for _, item_hash in decode_inventory(payload):
+                    block = tampering.blockchain.get_block_by_hash(item_hash.hex())
+                    forged = Block(block.index, block.transactions, block.timestamp + 1, block.previous_hash)
+                    forged.hash = block.hash
+                    await peer.send(MSG_BLOCK, forged.to_bytes())
+
+            tampering._on_getdata = send_tampered
+            sync = ChainSync(node, batch=1, timeout=0.5, workers=1)
+            report = await sync.run()
+            assert report.blocks == 4 and node.blockchain.last_block.hash == parent.hash
+            assert [peer.address[1] for peer in sync._peers] == [honest.port]
+
+            # With only the tampering peer there is no valid body to get
+            store = MemoryBlockStore()
+            store.append(node.blockchain.chain[0])
+            fresh = await Node(Blockchain(mining_workers=1, store=store)).start()
+            try:
+                peer = await fresh.connect(tampering.host, tampering.port)
+                with pytest.raises(SyncError, match="no other peer is left"):
+                    await ChainSync(fresh, timeout=0.5, workers=1).run([peer])
+                assert len(fresh.blockchain.chain) == 1
+            finally:
+                await fresh.stop()
+
+    asyncio.run(run())
+
+
+def test_header_verification_stops_at_a_broken_link(monkeypatch):
+    monkeypatch.setattr(Blockchain, "difficulty", 1)
+    chain = Blockchain(mining_workers=1)
+    for nonce in range(3):
+        chain.mempool.add({"sender": "a", "recipient": "b", "amount": 1, "fee": 0, "nonce": nonce})
+        chain.mine()
+    headers = [chain.chain[height].header() for height in range(1, 4)]
+    tip = hash_to_bytes(chain.chain[0].hash)
+    assert len(verify_headers(headers, tip, chain.consensus)) == 3
+    assert len(verify_headers([headers[0], headers[2]], tip, chain.consensus)) == 1
+
+
+def test_quantum_job_queue_schedules_coalesces_and_caches():
+    async def run():
+        async with QuantumJobQueue(workers=1) as queue:
+            bell = QuantumCircuit(2).h(0).cx(0, 1)
+            background = queue.submit_circuit(QuantumCircuit(3).x(2), shots=100)
+            first = queue.submit_circuit(bell, shots=500)
+            urgent = queue.submit_crypto("sign_message", "private_key", b"payload", "dilithium", priority=5)
+            # An identical submission joins the queued job and raises its priority
+            assert queue.submit_circuit(QuantumCircuit(2).h(0).cx(0, 1), shots=500, priority=9) == first
+            assert queue.status(first) == QUEUED
+            with pytest.raises(JobError):
+                queue.result(first)
+
+            counts = await queue.wait(first, timeout=10)
+            assert set(counts) == {"00", "11"} and sum(counts.values()) == 500
+            assert await queue.wait(urgent, timeout=10) == "signature"
+            assert await queue.wait(background, timeout=10) == {"100": 100}
+            jobs = [queue.get(job_id) for job_id in (first, urgent, background)]
+            assert [job.started for job in jobs] == sorted(job.started for job in jobs)
+
+            # Finished circuits are answered from the cache
+            cached = queue.submit_circuit(bell, shots=500)
+            assert cached != first and queue.status(cached) == DONE and queue.result(cached) == counts
+            assert queue.submit_circuit(bell, shots=501) != first
+            stats = queue.stats()
+            assert stats["coalesced"] == 1 and stats["cache_hits"] == 1 and stats["cache_size"] == 2
+
+            with pytest.raises(JobError):
+                queue.submit_crypto("export_private_key")
+            failed = queue.submit_crypto("sign_message", "key", b"payload", "kyber")
+            await asyncio.wait_for(queue.get(failed).done, 10)
+            with pytest.raises(JobError, match="Signing not supported"):
+                queue.result(failed)
+
+    asyncio.run(run())
+
+
+def test_stopping_the_job_queue_fails_outstanding_jobs():
+    async def run():
+        queue = await QuantumJobQueue(workers=1, max_finished=2).start()
+        bell = QuantumCircuit(2).h(0).cx(0, 1)
+        first = queue.submit_circuit(bell, shots=10)
+        counts = await queue.wait(first, timeout=10)
+        # Cache hits finish at once; only the newest max_finished jobs are kept
+        hits = [queue.submit_circuit(bell, shots=10) for _ in range(2)]
+        assert queue.result(hits[-1]) == counts
+        with pytest.raises(JobError, match="Unknown job"):
+            queue.get(first)
+
+        pending = queue.submit_circuit(QuantumCircuit(1).x(0), shots=10)
+        await queue.stop()
+        assert queue.status(pending) == FAILED and queue.get(pending).done.done()
+        with pytest.raises(JobError, match="stopped"):
+            await queue.wait(pending, timeout=1)
+        assert queue.stats()["queued"] == queue.stats()["running"] == 0
+        assert queue.submit_circuit(QuantumCircuit(1).x(0), shots=10) != pending
+
+    asyncio.run(run())
@@ -0,0 +1,67 @@
+# UUID: 6f0be73d-ad8c-4028-a4cc-41cd4a896cc1
+
+import numpy as np
+
+from UniversalBankAndTrust.analytics import ChainAnalytics
+from blockchain.chain import Block, Blockchain
+from blockchain.storage import FileBlockStore
+
+
+def _payment(sender, recipient, amount, nonce):
+    return {"sender": sender, "recipient": recipient, "amount": amount, "fee": 0, "nonce": nonce}
+
+
+def _append_block(blockchain, transactions, timestamp):
+    block = Block(blockchain.last_block.index + 1, transactions, timestamp, blockchain.last_block.hash)
+    assert blockchain.add_block(block, blockchain.proof_of_work(block))
+
+
+def test_analytics_follow_the_chain_and_aggregate(tmp_path):
+    blockchain = Blockchain(mining_workers=1, store=FileBlockStore(tmp_path))
+    analytics = ChainAnalytics(blockchain)
+    day = 86400
+    _append_block(blockchain, [_payment("alice", "bob", 10, 0), _payment("bob", "carol", 4, 0),
+                               {"sender": "alice", "nonce": 1, "is_contract": True}], 3 * day + 5)
+    _append_block(blockchain, [_payment("alice", "carol", 7, 2)], 3 * day + 50)
+
+    days, volumes, counts = analytics.daily_volumes()
+    assert list(days) == [np.datetime64("1970-01-04")]
+    assert volumes.tolist() == [21] and counts.tolist() == [3]
+
+    # New blocks are picked up incrementally
+    _append_block(blockchain, [_payment("carol", "alice", 2, 0), _payment("dave", "alice", 30, 0)], 4 * day)
+    days, volumes, counts = analytics.daily_volumes()
+    assert volumes.tolist() == [21, 32] and counts.tolist() == [3, 2]
+    assert analytics.synced_height == 4
+
+    addresses, inflow, outflow, net = analytics.account_flows()
+    flows = {address: (inflow[i], outflow[i], net[i]) for i, address in enumerate(addresses)}
+    assert flows["alice"] == (32, 17, 15)
+    assert flows["carol"] == (11, 2, 9)
+    assert analytics.account_flows(from_block=3)[1][addresses.index("alice")] == 32
+
+    assert analytics.top_counterparties("alice") == [("dave", 30.0, 1), ("bob", 10.0, 1), ("carol", 9.0, 2)]
+    assert analytics.top_counterparties("alice", limit=1, to_block=2) == [("bob", 10.0, 1)]
+    assert analytics.top_counterparties("nobody") == []
+    blockchain.close()
+
+
+def test_analytics_drop_blocks_of_an_abandoned_branch():
+    blockchain = Blockchain(mining_workers=1)
+    analytics = ChainAnalytics(blockchain)
+    genesis = blockchain.last_block
+    _append_block(blockchain, [_payment("alice", "bob", 10, 0)], 1.0)
+    assert analytics.account_flows()[1].sum() == 10
+    assert analytics.synced_hash == blockchain.last_block.hash
+
+    parent = genesis
+    for timestamp, amount in ((2.0, 3), (3.0, 4)):
+        block = Block(parent.index + 1, [_payment("alice", "carol", amount, parent.index)], timestamp, parent.hash)
+        block.hash = blockchain.proof_of_work(block)
+        blockchain.add_block(block, block.hash)
+        parent = block
+    assert blockchain.last_block.hash == parent.hash
+
+    addresses, inflow, _, _ = analytics.account_flows()
+    assert inflow[addresses.index("bob")] == 0 and inflow[addresses.index("carol")] == 7
+    assert analytics.synced_height == 3 and analytics.synced_hash == parent.hash
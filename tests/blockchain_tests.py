@@ -1,2 +1,539 @@
 # UUID: c4c024b9-04ae-44bf-bb3a-1ff3959d5f93
 
+import io
+import os
+from hashlib import sha256
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
+from blockchain.block import Block as BlockBuilder
+from blockchain.chain import (Block, Blockchain, HEADER_NONCE, HEADER_PREFIX, Transaction, sign_transaction,
+                              verify_transaction_proof)
+from blockchain.encoding import MAX_DEPTH, EncodingError, decode_block, decode_transaction, encode_transaction
+from blockchain.mempool import Mempool
+from blockchain.merkle import MerkleProof, MerkleTree, verify_proof
+from blockchain.pow_engine import ParallelProofOfWork
+from blockchain.quantum_security import (
+    PublicKeyCache, QuantumSecurity, SecureSession, SecurityError, SessionCache,
+    decrypt_data, encrypt_data, session_cache
+)
+from blockchain.state import StateEngine, StateError
+from blockchain.storage import INDEX_RECORD, FileBlockStore
+from blockchain.validation import ValidationError, verify_signed_transaction
+from blockchain.verification import verify_batch
+
+
+def test_parallel_proof_of_work_is_accepted_by_is_valid_proof():
+    blockchain = Blockchain(mining_workers=2)
+    block = Block(1, [{"sender": "a", "recipient": "b", "amount": 5}], 1.0, blockchain.last_block.hash)
+    proof = blockchain.proof_of_work(block)
+    assert blockchain.is_valid_proof(block, proof)
+    assert blockchain.add_block(block, proof)
+
+
+def test_parallel_search_reports_exhausted_range():
+    block = Block(1, [], 1.0, "0")
+    with ParallelProofOfWork(workers=2, chunk_size=50) as engine:
+        nonce, computed_hash, attempts = engine.search(block.mining_job(), 65, max_nonce=300)
+    assert nonce is None and computed_hash is None
+    assert attempts == 300
+
+
+def test_serial_mining_still_supported():
+    serial = Blockchain(mining_workers=1)
+    serial.mempool.add({"sender": "a", "recipient": "b", "amount": 1})
+    assert serial.mine() == 1
+    assert len(serial.mempool) == 0
+    assert serial.last_block.hash.startswith("0" * Blockchain.difficulty)
+
+
+def test_block_header_has_fixed_layout():
+    small = Block(1, [], 1.0, "0")
+    large = Block(1, [{"sender": "a", "recipient": "b", "amount": i} for i in range(500)], 1.0, "0")
+    assert len(small.header_prefix()) == len(large.header_prefix()) == HEADER_PREFIX.size
+    assert HEADER_PREFIX.size + HEADER_NONCE.size == 80
+
+
+def test_midstate_hash_matches_compute_hash():
+    block = Block(1, [{"sender": "a", "recipient": "b", "amount": 1}], 1.0, "0")
+    job = block.mining_job()
+    for nonce in (0, 1, 12345):
+        block.nonce = nonce
+        assert job.hash_nonce(nonce) == block.compute_hash()
+
+
+def test_tampered_transactions_fail_proof():
+    blockchain = Blockchain(mining_workers=1)
+    block = Block(1, [{"sender": "a", "recipient": "b", "amount": 5}], 1.0, blockchain.last_block.hash)
+    proof = blockchain.proof_of_work(block)
+    block.transactions[0]["amount"] = 500
+    assert not blockchain.is_valid_proof(block, proof)
+
+
+def _reference_merkle_root(leaves):
+    # Built level by level from the spec: prefixed leaf and node hashes, an
+    # unpaired node promoted unchanged, an all-zero root for no leaves
+    level = [sha256(b"\x00" + leaf).digest() for leaf in leaves]
+    if not level:
+        return bytes(32)
+    while len(level) > 1:
+        paired = [sha256(b"\x01" + level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        level = paired + level[len(paired) * 2:]
+    return level[0]
+
+
+def test_incremental_merkle_tree_matches_full_rebuild():
+    tree = MerkleTree()
+    assert tree.root == _reference_merkle_root([])
+    leaves = [f"tx-{i}".encode() for i in range(37)]
+    for count, leaf in enumerate(leaves, start=1):
+        tree.append(leaf)
+        assert tree.root == _reference_merkle_root(leaves[:count])
+
+
+def test_merkle_proofs_verify_for_every_leaf():
+    leaves = [f"tx-{i}".encode() for i in range(13)]
+    tree = MerkleTree(leaves)
+    for index, leaf in enumerate(leaves):
+        proof = MerkleProof.from_dict(tree.proof(index).to_dict())
+        assert len(proof.siblings) <= 4
+        assert verify_proof(leaf, proof, tree.root)
+        assert not verify_proof(b"forged", proof, tree.root)
+
+
+def test_light_client_confirms_payment_from_header_root():
+    blockchain = Blockchain(mining_workers=1)
+    block = Block(1, [], 1.0, blockchain.last_block.hash)
+    for i in range(10):
+        block.add_transaction({"sender": "a", "recipient": "b", "amount": i})
+    assert blockchain.add_block(block, blockchain.proof_of_work(block))
+    transaction, proof = blockchain.get_transaction_proof(1, 7)
+    assert verify_transaction_proof(transaction, proof, block.merkle_root)
+    assert not verify_transaction_proof({"sender": "a", "recipient": "b", "amount": 70}, proof, block.merkle_root)
+
+    # The standalone block builder reports the same root
+    builder = BlockBuilder(1, [], blockchain.chain[0].hash)
+    for candidate in block.transactions:
+        builder.add_transaction(candidate)
+    assert builder.merkle_root == block.merkle_root
+    assert verify_transaction_proof(transaction, builder.merkle_proof(7), builder.merkle_root)
+
+
+def _mine_blocks(blockchain, count, signed=False):
+    private_key, address = QuantumSecurity.generate_keypair()
+    for i in range(count):
+        transaction = {"sender": "a", "recipient": "b", "amount": i}
+        if signed:
+            transaction = Transaction(address, "b", i, nonce=i)
+            transaction.sign(private_key)
+            transaction = transaction.to_dict()
+        block = Block(len(blockchain.chain), [transaction], float(i + 1), blockchain.last_block.hash)
+        assert blockchain.add_block(block, blockchain.proof_of_work(block))
+
+
+def test_file_block_store_survives_restart(tmp_path):
+    blockchain = Blockchain(mining_workers=1, store=FileBlockStore(tmp_path, sync_every=2))
+    genesis_hash = blockchain.last_block.hash
+    _mine_blocks(blockchain, 5)
+    tip = blockchain.last_block.hash
+    blockchain.close()
+
+    reopened = Blockchain(mining_workers=1, store=FileBlockStore(tmp_path))
+    assert len(reopened.chain) == 6
+    assert reopened.get_block(0).hash == genesis_hash
+    assert reopened.last_block.hash == tip
+    assert reopened.get_block_by_hash(tip).index == 5
+    assert reopened.get_block(3).transactions == [{"sender": "a", "recipient": "b", "amount": 2}]
+    reopened.close()
+
+
+def test_file_block_store_drops_torn_tail(tmp_path):
+    store = FileBlockStore(tmp_path, segment_size=300)
+    blockchain = Blockchain(mining_workers=1, store=store)
+    _mine_blocks(blockchain, 4)
+    blockchain.close()
+    assert len(list(tmp_path.glob("blk*.dat"))) > 1
+
+    # Simulate a crash that left half an index record behind
+    with open(tmp_path / "index.dat", "ab") as f:
+        f.write(b"\x00" * 10)
+    reopened = FileBlockStore(tmp_path)
+    assert len(reopened) == 5
+    assert [block.index for block in reopened] == [0, 1, 2, 3, 4]
+    reopened.close()
+    assert (tmp_path / "index.dat").stat().st_size == 5 * INDEX_RECORD.size
+
+    # An intact index is left untouched on open
+    modified = (tmp_path / "index.dat").stat().st_mtime_ns
+    FileBlockStore(tmp_path).close()
+    assert (tmp_path / "index.dat").stat().st_mtime_ns == modified
+
+
+def _signed_transactions(count, senders=3):
+    keys = [QuantumSecurity.generate_keypair() for _ in range(senders)]
+    transactions = []
+    for i in range(count):
+        private_key, address = keys[i % senders]
+        transaction = Transaction(address, "recipient", i, nonce=i // senders)
+        transaction.sign(private_key)
+        transactions.append(transaction)
+    return transactions
+
+
+def test_signed_transaction_is_admitted():
+    blockchain = Blockchain(mining_workers=1)
+    transaction = _signed_transactions(1)[0]
+    assert blockchain.add_new_transaction(transaction)
+    assert blockchain.unconfirmed_transactions == [transaction.to_dict()]
+    assert not blockchain.add_new_transaction(transaction)
+
+
+def test_verify_batch_reports_per_transaction_results():
+    transactions = _signed_transactions(600)
+    transactions[5].amount = 10**6
+    transactions[400].signature = "00" * 64
+    transactions[450].sender = "not a key"
+    transactions[500].signature = 123
+    expected = [i not in (5, 400, 450, 500) for i in range(600)]
+    assert verify_batch(transactions, max_workers=4, chunk_size=64) == expected
+    assert verify_batch(transactions, max_workers=2, use_processes=True, chunk_size=64) == expected
+
+
+def test_bulk_admission_skips_invalid_transactions():
+    blockchain = Blockchain(mining_workers=2)
+    transactions = _signed_transactions(10)
+    transactions[3].amount = -1
+    results = blockchain.add_new_transactions(transactions)
+    assert results.count(False) == 1 and not results[3]
+    assert len(blockchain.unconfirmed_transactions) == 9
+
+
+def test_public_key_cache_hits_and_evicts():
+    cache = PublicKeyCache(maxsize=2)
+    parsed = []
+
+    def parser(key_bytes):
+        parsed.append(key_bytes)
+        return object()
+
+    first = cache.get_or_parse(b"a", parser)
+    assert cache.get_or_parse(b"a", parser) is first
+    cache.get_or_parse(b"b", parser)
+    cache.get_or_parse(b"c", parser)
+    assert parsed == [b"a", b"b", b"c"]
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 1, "misses": 3, "evictions": 1}
+    cache.resize(1)
+    assert len(cache) == 1 and cache.evictions == 2
+
+
+def test_repeat_sender_key_is_parsed_once():
+    QuantumSecurity.key_cache.clear()
+    misses = QuantumSecurity.key_cache.misses
+    transactions = _signed_transactions(20, senders=2)
+    assert all(transaction.verify_transaction_signature() for transaction in transactions)
+    assert QuantumSecurity.key_cache.misses - misses == 2
+
+
+def test_encrypt_data_reuses_session_per_peer_pair():
+    session_cache.clear()
+    alice, bob = X25519PrivateKey.generate(), X25519PrivateKey.generate()
+    for message in (b"first", b"second"):
+        encrypted, nonce = encrypt_data(bob.public_key(), message, alice)
+        assert decrypt_data(bob, encrypted, nonce, alice.public_key()) == message
+    assert len(session_cache) == 2  # one session on each side
+
+
+def test_session_cache_expires_sessions():
+    cache = SessionCache(ttl=0.0)
+    alice, bob = X25519PrivateKey.generate(), X25519PrivateKey.generate()
+    assert cache.get(alice, bob.public_key()) is not cache.get(alice, bob.public_key())
+
+
+def test_streaming_encryption_round_trip_and_truncation():
+    alice, bob = X25519PrivateKey.generate(), X25519PrivateKey.generate()
+    sender, receiver = SecureSession(alice, bob.public_key()), SecureSession(bob, alice.public_key())
+    payload = os.urandom(10_000)
+    encrypted = io.BytesIO()
+    assert sender.encrypt_stream(io.BytesIO(payload), encrypted, chunk_size=1024) == 10
+    decrypted = io.BytesIO()
+    receiver.decrypt_stream(io.BytesIO(encrypted.getvalue()), decrypted)
+    assert decrypted.getvalue() == payload
+
+    # Drop the final chunk: the new last chunk was not sealed as final
+    truncated = encrypted.getvalue()[:-(10_000 - 9 * 1024 + 16)]
+    with pytest.raises(SecurityError):
+        receiver.decrypt_stream(io.BytesIO(truncated), io.BytesIO())
+
+
+def _pool_transaction(sender, nonce, fee, amount=1):
+    return {"sender": sender, "recipient": "r", "amount": amount, "fee": fee, "nonce": nonce}
+
+
+def test_mempool_rejects_duplicates_and_replaces_by_fee():
+    mempool = Mempool()
+    assert mempool.add(_pool_transaction("a", 0, 10))
+    assert not mempool.add(_pool_transaction("a", 0, 10))
+    assert not mempool.add(_pool_transaction("a", 0, 5, amount=2))
+    assert mempool.add(_pool_transaction("a", 0, 50, amount=3))
+    assert [tx["amount"] for tx in mempool] == [3]
+
+
+def test_mempool_selects_by_fee_rate_in_nonce_order():
+    mempool = Mempool()
+    mempool.add(_pool_transaction("a", 1, 900))
+    mempool.add(_pool_transaction("a", 0, 1))
+    mempool.add(_pool_transaction("b", 0, 500))
+    mempool.add(_pool_transaction("c", 3, 400))
+    mempool.add(_pool_transaction("c", 5, 999))  # gap after nonce 3
+    selected = [(tx["sender"], tx["nonce"]) for tx in mempool.select_for_block(10**6)]
+    assert selected == [("b", 0), ("c", 3), ("a", 0), ("a", 1)]
+    assert len(mempool) == 5
+    size = len(encode_transaction(_pool_transaction("b", 0, 500)))
+    assert mempool.select_for_block(size) == [_pool_transaction("b", 0, 500)]
+
+
+def test_mempool_evicts_lowest_priority_when_full():
+    size = len(encode_transaction(_pool_transaction("a", 0, 10)))
+    mempool = Mempool(max_bytes=3 * size)
+    mempool.add(_pool_transaction("a", 0, 10))
+    mempool.add(_pool_transaction("a", 1, 90))
+    mempool.add(_pool_transaction("b", 0, 50))
+    assert mempool.add(_pool_transaction("c", 0, 70))
+    # a/0 had the lowest fee rate; a/1 depends on it and goes too
+    assert sorted((tx["sender"], tx["nonce"]) for tx in mempool) == [("b", 0), ("c", 0)]
+    assert mempool.total_bytes <= mempool.max_bytes
+    assert mempool.add(_pool_transaction("d", 0, 80))
+    assert not mempool.add(_pool_transaction("e", 0, 1))
+    assert len(mempool) == 3
+
+
+def test_chain_validator_accepts_valid_chain_and_resumes(tmp_path):
+    blockchain = Blockchain(mining_workers=1, store=FileBlockStore(tmp_path / "blocks"))
+    for transaction in _signed_transactions(4):
+        blockchain.add_new_transaction(transaction)
+    blockchain.mine()
+    _mine_blocks(blockchain, 5, signed=True)
+    checkpoint = str(tmp_path / "checkpoint.json")
+    reports = []
+
+    report = blockchain.validate_chain(workers=2, batch_size=2, checkpoint_path=checkpoint,
+                                       checkpoint_every=3, progress=lambda *args: reports.append(args),
+                                       report_every=2)
+    assert (report.start_height, report.blocks) == (0, 7)
+    assert report.tip_hash == blockchain.last_block.hash
+    assert [height for height, _ in reports] == [1, 3, 5]
+
+    _mine_blocks(blockchain, 2, signed=True)
+    resumed = blockchain.validate_chain(workers=2, checkpoint_path=checkpoint)
+    assert (resumed.start_height, resumed.blocks) == (7, 2)
+    blockchain.close()
+
+
+def test_chain_validator_reports_first_invalid_block():
+    blockchain = Blockchain(mining_workers=1)
+    _mine_blocks(blockchain, 3, signed=True)
+    blockchain.get_block(2).transactions[0]["amount"] = 10**9
+    with pytest.raises(ValidationError) as error:
+        blockchain.validate_chain(workers=1)
+    assert error.value.height == 2
+
+    forged = _signed_transactions(1)[0].to_dict()
+    forged["amount"] = 5
+    blockchain = Blockchain(mining_workers=1)
+    block = Block(1, [forged], 1.0, blockchain.last_block.hash)
+    blockchain.add_block(block, blockchain.proof_of_work(block))
+    with pytest.raises(ValidationError, match="signature"):
+        blockchain.validate_chain(workers=1)
+
+    # Unsigned payments are rejected as well
+    blockchain = Blockchain(mining_workers=1)
+    _mine_blocks(blockchain, 1)
+    with pytest.raises(ValidationError, match="signature"):
+        blockchain.validate_chain(workers=1)
+
+
+def test_signatures_cover_every_transaction_field():
+    private_key, address = QuantumSecurity.generate_keypair()
+    payment = Transaction(address, "bob", 5, fee=1, nonce=0)
+    payment.sign(private_key)
+    assert sign_transaction(payment.to_dict(), private_key)["signature"] == payment.signature
+
+    # Fields added to a signed payment are not covered by its signature
+    tampered = dict(payment.to_dict(), is_contract=True, contract_address="token", action="mint", params={})
+    assert verify_signed_transaction(payment.to_dict()) and not verify_signed_transaction(tampered)
+
+    # Contract calls are signed over all their fields and pass validation
+    call = sign_transaction({"sender": address, "nonce": 1, "is_contract": True, "contract_address": "token",
+                             "action": "mint", "params": {"account": "alice", "amount": 3}}, private_key)
+    blockchain = Blockchain(mining_workers=1)
+    block = Block(1, [payment.to_dict(), call], 1.0, blockchain.last_block.hash)
+    assert blockchain.add_block(block, blockchain.proof_of_work(block))
+    assert blockchain.validate_chain(workers=1).blocks == 2
+    call["params"]["amount"] = 300
+    assert not verify_signed_transaction(call)
+
+
+def _payment(sender, recipient, amount, nonce, fee=0):
+    return {"sender": sender, "recipient": recipient, "amount": amount, "fee": fee, "nonce": nonce}
+
+
+def test_state_engine_applies_and_reverts_blocks():
+    state = StateEngine(genesis_balances={"alice": 100})
+    state.apply_block(Block(1, [_payment("alice", "bob", 30, 0, fee=1)], 1.0, "0"), fee_recipient="miner")
+    assert (state.balance("alice"), state.balance("bob"), state.balance("miner")) == (69, 30, 1)
+    assert state.nonce("alice") == 1
+
+    with pytest.raises(StateError):
+        state.apply_block(Block(2, [_payment("bob", "carol", 10, 0), _payment("bob", "carol", 50, 1)], 2.0, "0"))
+    assert (state.balance("bob"), state.balance("carol"), state.height) == (30, 0, 1)
+
+    state.revert_block()
+    assert (state.balance("alice"), state.balance("bob"), state.nonce("alice"), state.height) == (100, 0, 0, -1)
+    assert "bob" not in dict(state.snapshot().items())
+
+
+def test_state_snapshot_is_copy_on_write():
+    state = StateEngine(genesis_balances={"alice": 100})
+    snapshot = state.snapshot()
+    state.apply_transaction(_payment("alice", "bob", 40, 0))
+    assert snapshot.get("alice") == (100, 0) and snapshot.get("bob") == (0, 0)
+    assert dict(snapshot.items()) == {"alice": (100, 0)}
+    assert state.balance("alice") == 60
+    snapshot.release()
+
+
+def test_blockchain_state_restarts_from_snapshot(tmp_path):
+    def open_chain():
+        state = StateEngine(genesis_balances={"alice": 100}, snapshot_path=str(tmp_path / "state.json"),
+                            snapshot_every=2)
+        return Blockchain(mining_workers=1, store=FileBlockStore(tmp_path / "blocks"), state=state)
+
+    blockchain = open_chain()
+    for nonce in range(3):
+        blockchain.mempool.add(_payment("alice", "bob", 10, nonce))
+    blockchain.mempool.add(_payment("alice", "bob", 500, 3))  # cannot be covered
+    assert blockchain.mine() == 1
+    assert blockchain.get_balance("bob") == 30
+    blockchain.mempool.add(_payment("bob", "carol", 5, 0))
+    blockchain.mine()
+    blockchain.mempool.add(_payment("bob", "carol", 5, 1))
+    blockchain.mine()
+    blockchain.close()
+
+    reopened = open_chain()
+    assert reopened.state.height == 3
+    assert (reopened.get_balance("alice"), reopened.get_balance("bob"), reopened.get_balance("carol")) == (70, 20, 10)
+    reopened.close()
+
+    # The store lost its tip and a different block 2 replaced it: the height-2
+    # snapshot no longer matches, so the older genesis snapshot is replayed
+    store = FileBlockStore(tmp_path / "blocks")
+    store.truncate(2)
+    replacement = Block(2, [_payment("bob", "carol", 7, 0)], 9.0, store[1].hash)
+    replacement.hash = Blockchain(mining_workers=1, store=store).proof_of_work(replacement)
+    store.append(replacement)
+    store.close()
+    reopened = open_chain()
+    assert (reopened.state.height, reopened.state.block_hash) == (2, replacement.hash)
+    assert (reopened.get_balance("alice"), reopened.get_balance("bob"), reopened.get_balance("carol")) == (70, 23, 7)
+    reopened.close()
+
+
+def test_canonical_encoding_round_trips_transactions_and_blocks():
+    private_key, address = QuantumSecurity.generate_keypair()
+    transaction = Transaction(address, "recipient", 7, fee=2, nonce=3)
+    transaction.sign(private_key)
+    data = transaction.to_bytes()
+    decoded = Transaction.from_bytes(memoryview(data))
+    assert decoded.to_dict() == transaction.to_dict()
+    assert decoded.verify_transaction_signature()
+    assert len(data) < len(str(transaction.to_dict()))
+
+    call = {"sender": "caller", "nonce": 0, "is_contract": True, "contract_address": "token",
+            "action": "mint", "params": {"amount": 2 ** 70, "ratio": 0.5, "tags": ["a", None]}}
+    assert decode_transaction(encode_transaction(call)) == (call, len(encode_transaction(call)))
+    # Key order does not change the canonical bytes
+    assert encode_transaction(dict(reversed(list(call.items())))) == encode_transaction(call)
+
+    block = Block(1, [transaction.to_dict(), call], 1700000000.0, "ab" * 32)
+    restored = Block.from_bytes(block.to_bytes())
+    assert restored.to_dict() == block.to_dict()
+    assert restored.merkle_root == block.merkle_root
+    assert decode_block(Block(0, [], 1.0, "0").to_bytes())[0]["previous_hash"] == "0"
+    with pytest.raises(EncodingError):
+        decode_block(block.to_bytes()[:-3])
+
+
+def test_malformed_nested_values_are_encoding_errors():
+    header = bytes([1, 0x80])  # version, mask with only extra fields
+    one = (1).to_bytes(4, "big")
+    for payload in (b"d" + one + b"l" + bytes(4) + b"N",  # list as a dictionary key
+                    b"l" + one + b"N",  # extra fields that are not a dictionary
+                    (b"l" + one) * 100000 + b"N"):  # nesting past the recursion limit
+        with pytest.raises(EncodingError):
+            decode_transaction(header + payload)
+
+    # MAX_DEPTH levels of lists inside the extra fields' dictionary
+    nested = []
+    for _ in range(MAX_DEPTH - 1):
+        nested = [nested]
+    call = {"sender": "caller", "nonce": 0, "params": nested}
+    with pytest.raises(EncodingError):
+        encode_transaction(call)
+    call["params"] = nested[0]
+    assert decode_transaction(encode_transaction(call))[0] == call
+
+
+def _child(blockchain, parent, transactions, timestamp):
+    block = Block(parent.index + 1, transactions, timestamp, parent.hash)
+    block.hash = blockchain.proof_of_work(block)
+    return block
+
+
+def test_heavier_branch_triggers_reorg_with_state_rollback(tmp_path):
+    state = StateEngine(genesis_balances={"alice": 100})
+    blockchain = Blockchain(mining_workers=1, store=FileBlockStore(tmp_path), state=state)
+    genesis = blockchain.last_block
+    a1 = _child(blockchain, genesis, [_payment("alice", "bob", 10, 0)], 1.0)
+    assert blockchain.add_block(a1, a1.hash)
+
+    b1 = _child(blockchain, genesis, [_payment("alice", "carol", 20, 0)], 2.0)
+    assert blockchain.add_block(b1, b1.hash)
+    assert blockchain.last_block.hash == a1.hash  # equal work keeps the current chain
+    b2 = _child(blockchain, b1, [_payment("carol", "dave", 5, 0)], 3.0)
+    assert blockchain.add_block(b2, b2.hash)
+    assert [block.hash for block in blockchain.chain] == [genesis.hash, b1.hash, b2.hash]
+    assert (state.balance("alice"), state.balance("bob"), state.balance("carol"), state.balance("dave")) == (80, 0, 15, 5)
+    assert blockchain.get_block_by_hash(a1.hash) is a1
+    assert len(blockchain.mempool) == 1  # alice -> bob is unconfirmed again
+
+    # Growing the original branch switches back, disconnecting only b1 and b2
+    a2 = _child(blockchain, a1, [], 4.0)
+    a3 = _child(blockchain, a2, [], 5.0)
+    assert blockchain.add_block(a2, a2.hash) and blockchain.add_block(a3, a3.hash)
+    assert blockchain.last_block.hash == a3.hash and state.height == 3
+    assert (state.balance("alice"), state.balance("bob"), state.balance("carol")) == (90, 10, 0)
+    blockchain.close()
+
+    reopened = Blockchain(mining_workers=1, store=FileBlockStore(tmp_path))
+    assert [block.hash for block in reopened.chain] == [genesis.hash, a1.hash, a2.hash, a3.hash]
+    assert reopened.block_tree.get(a1.hash).chain_work == 2 * reopened.consensus.block_weight(None)
+    assert reopened.block_tree.tip.chain_work == 4 * reopened.consensus.block_weight(None)
+    reopened.close()
+
+
+def test_invalid_branch_restores_the_active_chain():
+    state = StateEngine(genesis_balances={"alice": 100})
+    blockchain = Blockchain(mining_workers=1, state=state)
+    genesis = blockchain.last_block
+    a1 = _child(blockchain, genesis, [_payment("alice", "bob", 10, 0)], 1.0)
+    assert blockchain.add_block(a1, a1.hash)
+    b1 = _child(blockchain, genesis, [], 2.0)
+    b2 = _child(blockchain, b1, [_payment("alice", "carol", 500, 0)], 3.0)
+    assert blockchain.add_block(b1, b1.hash)
+    assert not blockchain.add_block(b2, b2.hash)
+    assert blockchain.last_block.hash == a1.hash and state.balance("bob") == 10
+    assert blockchain.block_tree.get(b2.hash).invalid
+    b3 = _child(blockchain, b2, [], 4.0)
+    assert not blockchain.add_block(b3, b3.hash)
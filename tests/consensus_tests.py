@@ -1,2 +1,215 @@
 # UUID: 50fb38de-faa6-4043-bca7-59504f4b85fc
 
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+from blockchain.block_tree import BlockIndexEntry
+from blockchain.chain import Block, Blockchain, Transaction
+from blockchain.consensus import (ConsensusError, ProofOfStakeConsensus, ProofOfWorkConsensus, StakeIndex,
+                                  benchmark_consensus)
+from blockchain.quantum_security import QuantumSecurity
+from blockchain.state import StateEngine
+from blockchain.validation import ValidationError
+
+
+def _linear_select(stakes, point):
+    cumulative = 0
+    for address, stake in stakes:
+        cumulative += stake
+        if cumulative > point:
+            return address
+    return None
+
+
+def test_stake_index_matches_linear_scan():
+    index = StakeIndex()
+    stakes = {}
+    for i in range(200):
+        address = f"validator-{i % 37}"
+        amount = (i * 7919) % 50 + 1
+        index.add(address, amount)
+        stakes[address] = stakes.get(address, 0) + amount
+    index.add("validator-3", -index.get("validator-3"))
+    stakes["validator-3"] = 0
+    assert index.total == sum(stakes.values())
+    ordered = list(stakes.items())
+    for point in range(0, index.total, 7):
+        assert index.find(point) == _linear_select(ordered, point)
+    assert index.find(index.total) is None
+
+
+def test_forger_selection_is_deterministic_and_stake_weighted():
+    consensus = ProofOfStakeConsensus(blockchain=None)
+    consensus.add_stake("small", 10)
+    consensus.add_stake("large", 90)
+    assert consensus.select_forger("seed") == consensus.select_forger("seed")
+    picks = Counter(consensus.select_forger(f"block-{i}") for i in range(2000))
+    assert 1600 < picks["large"] < 1990
+
+    record = {"forger": "large", "forger_signature": "00", "seed": "abc", "seed_signature": "00"}
+    block = SimpleNamespace(transactions=[record])
+    assert consensus.validate_block(block, consensus.select_forger("abc"))
+    assert consensus.stakeholders == {"small": 10, "large": 90}
+
+
+def test_stake_weight_follows_the_selected_forger():
+    consensus = ProofOfStakeConsensus(blockchain=None)
+    consensus.add_stake("alice", 30)
+    consensus.add_stake("bob", 70)
+    entry = BlockIndexEntry("child", "parent", 1, None)
+    assert consensus.block_weight(entry) == consensus.stakes.get(consensus.select_forger("parent"))
+
+
+def test_blockchain_mines_and_validates_with_proof_of_stake():
+    consensus = ProofOfStakeConsensus()
+    keys = {}
+    for _ in range(3):
+        private_key, address = QuantumSecurity.generate_keypair()
+        consensus.add_stake(address, 50)
+        keys[address] = private_key
+    blockchain = Blockchain(mining_workers=1, consensus=consensus)
+    sender_key, sender = QuantumSecurity.generate_keypair()
+    payment = Transaction(sender, "bob", 5)
+    payment.sign(sender_key)
+    blockchain.mempool.add(payment.to_dict())
+
+    # Only a node holding the selected forger's key can seal the block
+    with pytest.raises(ConsensusError):
+        blockchain.mine()
+    for address, private_key in keys.items():
+        consensus.add_forging_key(address, private_key)
+    assert blockchain.mine() == 1
+    block = blockchain.last_block
+    assert block.transactions[0]["forger"] == consensus.select_forger(block.previous_hash)
+    assert blockchain.validate_chain().blocks == 2
+
+    # A block signed by another stakeholder, or with its hash recomputed after tampering, is rejected
+    seed = consensus.next_seed(block)
+    other = next(address for address in keys if address != consensus.select_forger())
+    forged = Block(2, [], 1.0, block.hash)
+    forged.transactions.insert(0, {"forger": other, "forger_signature": QuantumSecurity.sign(
+        keys[other], consensus.forging_payload(forged, forged.transactions)), "seed": seed,
+        "seed_signature": QuantumSecurity.sign(keys[other], consensus.seed_payload(seed))})
+    assert not blockchain.add_block(forged, forged.compute_hash())
+    sealed = Block(2, [], 1.0, block.hash)
+    sealed_hash = consensus.seal_block(sealed)
+    sealed.timestamp = 2.0
+    assert not blockchain.add_block(sealed, sealed.compute_hash())
+    sealed.timestamp = 1.0
+    assert blockchain.add_block(sealed, sealed_hash)
+    blockchain.close()
+
+
+def test_chain_validation_checks_the_proof_of_stake_seal():
+    consensus = ProofOfStakeConsensus()
+    private_key, address = QuantumSecurity.generate_keypair()
+    consensus.add_stake(address, 10)
+    consensus.add_forging_key(address, private_key)
+    blockchain = Blockchain(mining_workers=1, consensus=consensus)
+    block = Block(1, [], 1.0, blockchain.last_block.hash)
+    assert blockchain.add_block(block, consensus.seal_block(block))
+    assert blockchain.validate_chain(workers=1).blocks == 2
+
+    # A block stored without a valid forging record fails the audit
+    bogus = Block(2, [{"forger": "nobody", "forger_signature": "00"}], 2.0, block.hash)
+    blockchain.chain.append(bogus)
+    with pytest.raises(ValidationError, match="seal") as error:
+        blockchain.validate_chain(workers=1)
+    assert error.value.height == 2
+
+
+def test_forging_records_are_only_exempt_under_proof_of_stake():
+    # Under proof of work a "forging record" is an unsigned payment like any other
+    state = StateEngine(genesis_balances={"victim": 100})
+    blockchain = Blockchain(mining_workers=1, state=state)
+    theft = {"forger": "x", "sender": "victim", "recipient": "thief", "amount": 100, "nonce": 0}
+    block = Block(1, [theft], 1.0, blockchain.last_block.hash)
+    assert blockchain.add_block(block, blockchain.proof_of_work(block))
+    assert state.balance("victim") == 100 and state.balance("thief") == 0
+    with pytest.raises(ValidationError, match="signature on transaction 0"):
+        blockchain.validate_chain(workers=1)
+
+    # Under proof of stake only a record with nothing but the forging fields is exempt
+    consensus = ProofOfStakeConsensus()
+    record = {"forger": "x", "forger_signature": "00", "seed": "ab", "seed_signature": "00"}
+    assert consensus.is_forging_record(0, record)
+    assert not consensus.is_forging_record(0, theft)
+    assert not consensus.is_forging_record(1, record)
+    assert not ProofOfWorkConsensus().is_forging_record(0, record)
+
+
+def test_forger_seed_does_not_depend_on_block_contents():
+    consensus = ProofOfStakeConsensus()
+    keys = {}
+    for _ in range(8):
+        private_key, address = QuantumSecurity.generate_keypair()
+        consensus.add_stake(address, 10)
+        consensus.add_forging_key(address, private_key)
+        keys[address] = private_key
+    blockchain = Blockchain(mining_workers=1, consensus=consensus)
+    genesis = blockchain.last_block
+
+    # However the forger varies its block, the seed it passes on stays the same
+    candidates = []
+    for timestamp in range(1, 6):
+        block = Block(1, [], float(timestamp), genesis.hash)
+        consensus.seal_block(block)
+        candidates.append(block)
+    assert len({block.compute_hash() for block in candidates}) == 5
+    assert len({consensus.next_seed(block) for block in candidates}) == 1
+    assert blockchain.add_block(candidates[0], candidates[0].compute_hash())
+
+    # A block that states a seed other than the one its parent passes on is rejected
+    block = Block(2, [], 2.0, candidates[0].hash)
+    seed = "ab" * 32
+    forger = consensus.select_forger(seed)
+    block.transactions.insert(0, {"forger": forger, "forger_signature": QuantumSecurity.sign(
+        keys[forger], consensus.forging_payload(block, [])), "seed": seed,
+        "seed_signature": QuantumSecurity.sign(keys[forger], consensus.seed_payload(seed))})
+    assert consensus.verify_block(block, block.compute_hash())
+    assert not blockchain.add_block(block, block.compute_hash())
+    blockchain.chain.append(block)
+    with pytest.raises(ValidationError, match="seed") as error:
+        blockchain.validate_chain(workers=1)
+    assert error.value.height == 2
+
+
+def test_proof_of_stake_signature_covers_the_transactions():
+    consensus = ProofOfStakeConsensus()
+    private_key, address = QuantumSecurity.generate_keypair()
+    consensus.add_stake(address, 10)
+    consensus.add_forging_key(address, private_key)
+    blockchain = Blockchain(mining_workers=1, consensus=consensus)
+    payment = {"sender": "alice", "recipient": "bob", "amount": 5, "fee": 0, "nonce": 0}
+    block = Block(1, [payment], 1.0, blockchain.last_block.hash)
+    consensus.seal_block(block)
+
+    # Swapping the payments and rehashing keeps the forging record valid only for the original block
+    block.transactions[1] = dict(payment, recipient="mallory")
+    assert not blockchain.add_block(block, block.compute_hash())
+    block.transactions[1] = payment
+    block.nonce = 1
+    assert not blockchain.add_block(block, block.compute_hash())
+    block.nonce = 0
+    assert blockchain.add_block(block, block.compute_hash())
+
+
+def test_consensus_benchmark_reports_each_engine(monkeypatch):
+    monkeypatch.setattr(Blockchain, "difficulty", 2)
+    results = benchmark_consensus(blocks=3, transactions_per_block=5, stakeholders=4)
+    assert set(results) == {"proof-of-work", "proof-of-stake"}
+    for result in results.values():
+        assert result.blocks == 3 and result.transactions >= 15
+        assert result.blocks_per_second > 0 and result.cpu_seconds >= 0
+        assert len(result.validation_latencies) == 3
+    assert ProofOfWorkConsensus(Blockchain(mining_workers=1)).block_weight(None) == 16 ** 2
+
+
+def test_detached_proof_of_work_uses_its_own_difficulty():
+    assert ProofOfWorkConsensus().difficulty == ProofOfWorkConsensus.default_difficulty
+    engine = ProofOfWorkConsensus(difficulty=1)
+    block = Block(1, [], 1.0, "0")
+    assert engine.verify_block(block, engine.seal_block(block))
+    assert engine.difficulty == 1 and engine.mining_workers == 1
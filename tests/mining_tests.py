@@ -1,2 +1,74 @@
 # UUID: de53b6eb-13e9-40e6-9cfd-d3e5be1fd782
 
+from time import monotonic, sleep
+
+from blockchain.chain import Block, Blockchain, Transaction
+from blockchain.quantum_security import QuantumSecurity
+from mining.mining_manager import MiningManager
+from mining.quantum_miner import QuantumMiner
+
+
+def _payment(amount, fee=0):
+    private_key, address = QuantumSecurity.generate_keypair()
+    transaction = Transaction(address, "merchant", amount, fee=fee)
+    transaction.sign(private_key)
+    return transaction.to_dict()
+
+
+def _wait_for(condition, timeout=20.0):
+    deadline = monotonic() + timeout
+    while not condition():
+        assert monotonic() < deadline, "timed out"
+        sleep(0.01)
+
+
+def test_background_miner_finds_blocks_and_reports_metrics(monkeypatch):
+    monkeypatch.setattr(Blockchain, "difficulty", 3)
+    blockchain = Blockchain(mining_workers=1)
+    found = []
+    miner = QuantumMiner(blockchain)
+    miner.submit_block = found.append
+    blockchain.mempool.add(_payment(5))
+    manager = miner.start_mining(chunk_size=2000, check_interval=200)
+    try:
+        _wait_for(lambda: manager.blocks_found == 1)
+        assert found[0] is blockchain.last_block and blockchain.last_block.index == 1
+        assert len(blockchain.mempool) == 0
+        stats = manager.stats()
+        assert stats["hashes"] > 0 and stats["blocks_found"] == 1
+
+        # Nothing left to mine: the scheduler idles without a template
+        _wait_for(lambda: manager.template is None)
+        with manager.lock:
+            blockchain.mempool.add(_payment(1))
+        manager.notify()
+        _wait_for(lambda: manager.blocks_found == 2)
+    finally:
+        miner.stop_mining()
+    assert blockchain.validate_chain().blocks == 3
+
+
+def test_stale_templates_are_abandoned_for_a_new_tip_or_better_fees(monkeypatch):
+    monkeypatch.setattr(Blockchain, "difficulty", 1)
+    blockchain = Blockchain(mining_workers=1)
+    blockchain.mempool.add(_payment(5, fee=1))
+    # An unreachable target keeps the workers grinding on each template
+    with MiningManager(blockchain, chunk_size=2000, check_interval=200, difficulty=64, refresh_interval=60) as manager:
+        _wait_for(lambda: manager.template is not None and manager.hashrate > 0)
+        first = manager.template
+        assert manager.template_age >= 0
+
+        # A better-paying transaction replaces the template once the scheduler is notified
+        with manager.lock:
+            blockchain.mempool.add(_payment(5, fee=10))
+        manager.notify()
+        _wait_for(lambda: manager.template is not first)
+        assert manager.template.fees == 11 and manager.stale_templates == 1
+
+        # A block from elsewhere moves the tip and the template follows it
+        with manager.lock:
+            block = Block(1, [_payment(1)], 1.0, blockchain.last_block.hash)
+            assert blockchain.add_block(block, blockchain.proof_of_work(block))
+        _wait_for(lambda: manager.template is not None and manager.template.previous_hash == block.hash)
+        assert manager.stale_templates == 2 and manager.blocks_found == 0
+    assert manager.template is None
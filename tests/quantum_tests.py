@@ -1,2 +1,139 @@
 # UUID: 6aafc038-96f1-4978-a6fb-3e555a723add
 
+import gc
+import weakref
+
+import numpy as np
+
+from quantum.error_correction.error_mitigation import (ReadoutMitigator, fold_gates, parity_signs,
+                                                       zero_noise_extrapolation)
+from quantum.error_correction.qec import (CSSCode, LookupDecoder, StabilizerTableau, logical_error_rate,
+                                          logical_failures, repetition_code, surface_code)
+from quantum.quantum_interface import QuantumInterface
+from utils.quantum_simulation_tools import QuantumCircuit, SimulatorBackend, StateVectorSimulator, random_layers
+
+
+def _dense_unitary(matrix, qubit, num_qubits):
+    unitary = np.eye(1)
+    for position in reversed(range(num_qubits)):
+        unitary = np.kron(unitary, matrix if position == qubit else np.eye(2))
+    return unitary
+
+
+def test_state_vector_matches_dense_reference():
+    circuit = random_layers(4, 2, seed=7)
+    reference = np.zeros(16, dtype=complex)
+    reference[0] = 1
+    for kind, (qubit, *rest), matrix in circuit.operations:
+        if kind == "single":
+            reference = _dense_unitary(matrix, qubit, 4) @ reference
+        else:
+            target = rest[0]
+            for index in range(16):
+                if (index >> qubit) & 1 and not (index >> target) & 1:
+                    flipped = index | (1 << target)
+                    reference[index], reference[flipped] = reference[flipped], reference[index]
+    # Small blocks exercise the blocked kernels; fusion must not change the result
+    for block_size in (2, 1 << 16):
+        for fuse in (True, False):
+            simulator = StateVectorSimulator(4, block_size=block_size).run(circuit, fuse=fuse)
+            assert np.allclose(simulator.state, reference)
+    assert len(circuit.fused()) == 4 * 2 + 3 * 2
+
+
+def test_sampling_and_interface_counts():
+    circuit = QuantumCircuit(3).h(0).cx(0, 1).swap(1, 2).x(0).x(0)
+    simulator = StateVectorSimulator(3, dtype=np.complex64, block_size=2).run(circuit)
+    outcomes = simulator.sample(4000, seed=1)
+    assert set(np.unique(outcomes)) == {0b000, 0b101}
+    assert 1800 < np.count_nonzero(outcomes) < 2200
+    assert set(simulator.sample(100, qubits=[2, 0], seed=1)) <= {0b00, 0b11}
+
+    counts = QuantumInterface.run_circuit(circuit, shots=1000, seed=2)
+    assert set(counts) == {"000", "101"} and sum(counts.values()) == 1000
+
+
+def test_stabilizer_tableau_tracks_clifford_states():
+    tableau = StabilizerTableau(2, seed=1)
+    tableau.run([("h", 0), ("cx", 0, 1)])
+    assert tableau.stabilizers() == ["+XX", "+ZZ"]
+    tableau.run([("s", 0), ("y", 1)])
+    assert tableau.stabilizers() == ["-YX", "-ZZ"]
+
+    # A GHZ state across several words: the first outcome is random, the rest follow it
+    tableau = StabilizerTableau(300, seed=3)
+    tableau.h(0)
+    for qubit in range(299):
+        tableau.cx(qubit, qubit + 1)
+    outcomes = tableau.run([("measure", qubit) for qubit in range(0, 300, 7)])
+    assert len(set(outcomes)) == 1
+    tableau.reset(0)
+    assert tableau.measure(0) == 0
+
+
+def test_syndrome_extraction_and_lookup_decoding():
+    code = surface_code(3)
+    assert (len(code.x_checks), len(code.z_checks)) == (4, 4)
+    tableau = StabilizerTableau(code.num_data + code.num_checks, seed=5)
+    circuit = code.syndrome_circuit()
+    reference = tableau.run(circuit)
+    x_error, z_error = 0b000010100, 0b100000000
+    for qubit in range(code.num_data):
+        if (x_error >> qubit) & 1:
+            tableau.x_gate(qubit)
+        if (z_error >> qubit) & 1:
+            tableau.z_gate(qubit)
+    flips = [first ^ second for first, second in zip(reference, tableau.run(circuit))]
+    expected = (list(CSSCode.syndromes([z_error], code.x_checks)[0] >> np.arange(4) & 1)
+                + list(CSSCode.syndromes([x_error], code.z_checks)[0] >> np.arange(4) & 1))
+    assert flips == expected
+
+    # Every single-qubit error is corrected, and decoders are built once per code
+    singles = np.array([1 << qubit for qubit in range(code.num_data)], dtype=np.uint64)
+    assert not logical_failures(code, singles, singles).any()
+    assert LookupDecoder.for_code(code, "z") is LookupDecoder.for_code(surface_code(3), "z")
+    assert LookupDecoder.for_code(code, "z").coverage == 1.0
+
+    # Distance-3 repetition code under bit flips fails at about 3p^2
+    rate = logical_error_rate(repetition_code(3), 0.05, 200_000, noise="bit_flip", seed=1)
+    assert 0.0055 < rate < 0.0085
+
+
+def test_readout_mitigation_corrects_batches_with_one_calibration():
+    backend = SimulatorBackend(readout_error=(0.05, 0.1), seed=1)
+    mitigator = ReadoutMitigator.for_backend(backend, 3)
+    assert ReadoutMitigator.for_backend(backend, 3) is mitigator
+    ghz = QuantumCircuit(3).h(0).cx(0, 1).cx(1, 2)
+    histograms = backend.histograms([ghz, QuantumCircuit(3).x(1)], 20000)
+    assert histograms[1, 0b010] < 17000
+
+    mitigated = mitigator.apply(histograms)
+    assert np.allclose(mitigated[0, [0b000, 0b111]], 0.5, atol=0.02)
+    assert mitigated[1, 0b010] > 0.98
+    calibration_runs = backend.circuits_run
+    unclipped = mitigator.apply(histograms, clip=False)
+    assert np.allclose(unclipped, np.linalg.solve(mitigator.matrix, (histograms / 20000).T).T)
+    assert backend.circuits_run == calibration_runs
+
+    # Other calibration shots get their own mitigator; the cache does not keep the backend alive
+    assert ReadoutMitigator.for_backend(backend, 3, shots=1000) is not mitigator
+    backend = weakref.ref(backend)
+    gc.collect()
+    assert backend() is None
+
+
+def test_zero_noise_extrapolation_recovers_ideal_expectations():
+    circuit = QuantumCircuit(2).h(0).cx(0, 1)
+    for _ in range(3):
+        circuit.cx(0, 1).cx(0, 1)
+    folded = fold_gates(circuit, 3)
+    assert len(folded) == 3 * len(circuit)
+    assert np.allclose(StateVectorSimulator(2).run(folded).state, StateVectorSimulator(2).run(circuit).state)
+    assert parity_signs(2, [(0, 1)]).tolist() == [[1, -1, -1, 1]]
+
+    backend = SimulatorBackend(gate_error=0.02, trajectories=200, seed=2)
+    noisy = backend.histograms([circuit], 20000)[0] / 20000 @ parity_signs(2, [(0, 1)])[0]
+    estimates = zero_noise_extrapolation(backend, [circuit, QuantumCircuit(2).x(0)], [(0, 1), (0,)], shots=20000)
+    assert estimates.shape == (2, 2)
+    assert abs(estimates[0, 0] - 1) < abs(noisy - 1) and abs(estimates[0, 0] - 1) < 0.1
+    assert np.allclose(estimates[1], [-1, -1], atol=0.1)
@@ -1,2 +1,275 @@
 # UUID: 12c1975f-fd1b-405e-97a4-027ed434b82f
 
+import pytest
+
+from blockchain.chain import Block, Blockchain
+from blockchain.contract_engine import ContractError, GasMeter, MeteredState, OutOfGas
+from blockchain.events import EventLog
+from blockchain.parallel_executor import ParallelContractExecutor
+from blockchain.smart_contracts import SmartContract, TransactionManager
+
+
+class Token(SmartContract):
+    def mint(self, account, amount):
+        self.state[account] = self.state.get(account, 0) + amount
+
+    def transfer(self, sender, recipient, amount):
+        balance = self.state.get(sender, 0)
+        if balance < amount:
+            raise ValueError("insufficient balance")
+        self.state[sender] = balance - amount
+        self.state[recipient] = self.state.get(recipient, 0) + amount
+
+    def spin(self):
+        while True:
+            pass
+
+    def greedy(self, account):
+        try:
+            self.spin()
+        except Exception:
+            pass
+        self.state[account] = 1_000_000
+
+    def stubborn(self):
+        try:
+            self.spin()
+        except BaseException:
+            pass
+        return "finished"
+
+
+class CountingToken(Token):
+    saves = 0
+
+    def save_contract_state(self):
+        CountingToken.saves += 1
+
+
+def _contract_call(address, nonce, action, **params):
+    return {"sender": "caller", "nonce": nonce, "is_contract": True,
+            "contract_address": address, "action": action, "params": params}
+
+
+def test_contract_state_is_written_back_once_per_block():
+    blockchain = Blockchain(mining_workers=1)
+    token = CountingToken("token", blockchain)
+    CountingToken.saves = 0
+    blockchain.mempool.add(_contract_call("token", 0, "mint", account="alice", amount=1000))
+    for i in range(50):
+        blockchain.mempool.add(_contract_call("token", i + 1, "transfer", sender="alice", recipient=f"user-{i}", amount=1))
+    assert blockchain.mine() == 1
+    assert CountingToken.saves == 1
+    assert token.state["alice"] == 950 and token.state["user-7"] == 1
+
+
+def test_failed_and_runaway_calls_are_reverted():
+    blockchain = Blockchain(mining_workers=1)
+    token = Token("token", blockchain)
+    token.execute("mint", {"account": "alice", "amount": 5}, None)
+
+    receipt = blockchain.execute_smart_contract("token", "transfer", {"sender": "alice", "recipient": "bob", "amount": 9})
+    assert not receipt.succeeded and "insufficient" in receipt.error
+    with pytest.raises(OutOfGas):
+        token.execute("spin", {}, None, gas_limit=10_000)
+    # Catching Exception neither stops the call nor lets it go on unmetered
+    with pytest.raises(OutOfGas):
+        token.execute("greedy", {"account": "mallory"}, None, gas_limit=10_000)
+    with pytest.raises(OutOfGas):
+        token.execute("stubborn", {}, None, gas_limit=10_000)
+    receipt = blockchain.execute_smart_contract("token", "greedy", {"account": "mallory"}, gas_limit=10_000)
+    assert not receipt.succeeded and "Gas limit" in receipt.error
+    with pytest.raises(ContractError):
+        token.execute("save_contract_state", {}, None)
+    assert token.state == {"alice": 5}
+
+    receipt = token.execute("transfer", {"sender": "alice", "recipient": "bob", "amount": 2}, None)
+    assert receipt.gas_used > 0
+    assert token.state == {"alice": 3, "bob": 2}
+
+
+def test_metered_state_lists_keys_in_sorted_order():
+    state = MeteredState({"pear": 1, "fig": 2, "kiwi": 3}, GasMeter())
+    state["apple"] = 4
+    del state["kiwi"]
+    assert state.keys() == ["apple", "fig", "pear"]
+    assert [key for key, _ in state.items()] == ["apple", "fig", "pear"]
+
+
+def test_reorg_reverts_contract_state_and_events(tmp_path):
+    blockchain = Blockchain(mining_workers=1, event_log=EventLog(str(tmp_path / "events.jsonl"), flush_every=1))
+    token = Token("token", blockchain)
+    genesis = blockchain.last_block
+    blockchain.mempool.add(_contract_call("token", 0, "mint", account="alice", amount=10))
+    assert blockchain.mine() == 1
+    blockchain.mempool.add(_contract_call("token", 1, "transfer", sender="alice", recipient="bob", amount=4))
+    assert blockchain.mine() == 2
+    assert token.state == {"alice": 6, "bob": 4} and len(blockchain.event_log) == 2
+
+    # A heavier branch from genesis without the calls replaces both blocks
+    parent = genesis
+    for timestamp in (1.0, 2.0, 3.0):
+        block = Block(parent.index + 1, [], timestamp, parent.hash)
+        block.hash = blockchain.proof_of_work(block)
+        blockchain.add_block(block, block.hash)
+        parent = block
+    assert blockchain.last_block.hash == parent.hash
+    assert token.state == {} and len(blockchain.event_log) == 0
+    assert (tmp_path / "events.jsonl").stat().st_size == 0
+
+    # The calls went back to the mempool and run again in the next block
+    assert blockchain.mine() == 4
+    assert token.state == {"alice": 6, "bob": 4}
+    assert [event["block"] for event in blockchain.event_log.query(contract="token")] == [4, 4]
+    blockchain.close()
+
+
+def test_contract_calls_run_whenever_a_block_joins_the_active_chain():
+    blockchain = Blockchain(mining_workers=1)
+    token = Token("token", blockchain)
+    genesis = blockchain.last_block
+    blockchain.mempool.add(_contract_call("token", 0, "mint", account="alice", amount=7))
+    assert blockchain.mine() == 1
+
+    # A block that was not mined here runs its calls when it extends the tip
+    block = Block(2, [_contract_call("token", 1, "mint", account="bob", amount=1)], 2.0, blockchain.last_block.hash)
+    assert blockchain.add_block(block, blockchain.proof_of_work(block))
+    assert token.state == {"alice": 7, "bob": 1}
+
+    # A side branch runs its calls only once it becomes the active chain
+    parent = genesis
+    for timestamp, calls in ((1.5, [_contract_call("token", 0, "mint", account="carol", amount=2)]), (2.5, []),
+                             (3.5, [_contract_call("token", 1, "mint", account="carol", amount=3)])):
+        assert token.state == {"alice": 7, "bob": 1}
+        block = Block(parent.index + 1, calls, timestamp, parent.hash)
+        assert blockchain.add_block(block, blockchain.proof_of_work(block))
+        parent = block
+    assert blockchain.last_block.hash == parent.hash
+    assert token.state == {"carol": 5}
+    assert [event["block"] for event in blockchain.event_log.query(contract="token")] == [1, 3]
+
+
+def test_block_mined_on_a_stale_tip_keeps_its_transactions():
+    blockchain = Blockchain(mining_workers=1)
+    token = Token("token", blockchain)
+    genesis = blockchain.last_block
+    blockchain.mempool.add(_contract_call("token", 0, "mint", account="alice", amount=7))
+    assert blockchain.mine() == 1
+
+    # The tip moved on while a block on genesis was mined: it only becomes a side branch
+    call = _contract_call("token", 1, "mint", account="bob", amount=1)
+    blockchain.mempool.add(call)
+    block = Block(1, [call], 1.5, genesis.hash)
+    assert blockchain.add_mined_block(block, blockchain.proof_of_work(block)) is False
+    assert block.hash in blockchain.block_tree and blockchain.last_block.index == 1
+    assert token.state == {"alice": 7} and len(blockchain.mempool) == 1
+
+
+def test_transaction_manager_persists_to_data_store():
+    blockchain = Blockchain(mining_workers=1)
+    manager = TransactionManager("manager", blockchain)
+    manager.state["owner"] = "alice"
+    blockchain.contract_engine.commit_block()
+    assert blockchain.data_store == {}
+    manager.save_contract_state()
+    assert list(blockchain.data_store.values()) == ['{"owner": "alice"}']
+
+
+def _block_calls(count, hot_every):
+    calls = [{"contract_address": "token", "action": "mint", "params": {"account": "alice", "amount": 100}}]
+    for i in range(count):
+        recipient = "hot" if i % hot_every == 0 else f"user-{i}"
+        calls.append({"contract_address": "token", "action": "transfer",
+                      "params": {"sender": "alice" if i % 3 == 0 else recipient, "recipient": recipient, "amount": 1}})
+    return calls
+
+
+def _serial_state(calls):
+    blockchain = Blockchain(mining_workers=1)
+    token = Token("token", blockchain)
+    receipts = [blockchain.execute_smart_contract(call["contract_address"], call["action"], call["params"])
+                for call in calls]
+    return token.state, [receipt.succeeded for receipt in receipts]
+
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_parallel_execution_matches_serial_execution(use_processes):
+    calls = _block_calls(120, hot_every=4)
+    expected_state, expected_success = _serial_state(calls)
+
+    blockchain = Blockchain(mining_workers=1)
+    token = Token("token", blockchain)
+    executor = ParallelContractExecutor(blockchain.contract_engine, max_workers=3,
+                                        use_processes=use_processes, chunk_size=16)
+    receipts = executor.execute_block(calls)
+    assert token.state == expected_state
+    assert [receipt.succeeded for receipt in receipts] == expected_success
+    assert 0 < executor.reexecuted < len(calls)
+
+
+class Registry(SmartContract):
+    def register(self, name):
+        self.state[name] = 1
+
+    def count(self):
+        self.state["count"] = len([key for key in self.state.keys() if key != "count"])
+
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_key_enumeration_sees_keys_added_earlier_in_the_block(use_processes):
+    calls = [{"contract_address": "registry", "action": "register", "params": {"name": "x"}},
+             {"contract_address": "registry", "action": "count", "params": {}}]
+    blockchain = Blockchain(mining_workers=1)
+    registry = Registry("registry", blockchain)
+    executor = ParallelContractExecutor(blockchain.contract_engine, max_workers=2, use_processes=use_processes)
+    executor.execute_block(calls)
+    assert registry.state == {"x": 1, "count": 1}
+    assert executor.reexecuted == 1
+
+
+def test_disjoint_calls_are_not_reexecuted():
+    blockchain = Blockchain(mining_workers=1)
+    token = Token("token", blockchain)
+    calls = [{"contract_address": "token", "action": "mint", "params": {"account": f"user-{i}", "amount": i}}
+             for i in range(50)]
+    executor = ParallelContractExecutor(blockchain.contract_engine, max_workers=4)
+    executor.execute_block(calls)
+    assert executor.reexecuted == 0
+    assert token.state["user-49"] == 49
+
+
+def test_event_log_queries_by_contract_action_and_block_range(tmp_path):
+    path = str(tmp_path / "events.log")
+    blockchain = Blockchain(mining_workers=1, event_log=EventLog(path, flush_every=2))
+    Token("token", blockchain)
+    Token("other", blockchain)
+    nonce = 0
+    for height in range(1, 5):
+        for address in ("token", "other"):
+            blockchain.mempool.add(_contract_call(address, nonce, "mint", account="alice", amount=10))
+            blockchain.mempool.add(_contract_call(address, nonce + 1, "transfer", sender="alice", recipient="bob", amount=height))
+            nonce += 2
+        assert blockchain.mine() == height
+
+    transfers = blockchain.event_log.query(contract="token", action="transfer", from_block=2, to_block=3)
+    assert [event["params"]["amount"] for event in transfers] == [2, 3]
+    assert all(event["contract"] == "token" and event["block"] in (2, 3) for event in transfers)
+    assert len(blockchain.event_log.query(action="mint")) == 8
+    assert len(blockchain.event_log.query(from_block=4)) == 4
+    blockchain.close()
+
+    reopened = EventLog(path)
+    assert len(reopened) == 16
+    assert reopened.query(contract="token", action="transfer", from_block=2, to_block=3) == transfers
+    reopened.close()
+
+
+def test_events_of_a_rejected_block_are_discarded():
+    blockchain = Blockchain(mining_workers=1)
+    Token("token", blockchain)
+    blockchain.execute_smart_contract("token", "mint", {"account": "alice", "amount": 1})
+    blockchain.contract_engine.commit_block()
+    blockchain.execute_smart_contract("token", "mint", {"account": "bob", "amount": 1})
+    blockchain.contract_engine.rollback_block()
+    events = blockchain.event_log.query(contract="token")
+    assert [event["params"]["account"] for event in events] == ["alice"]
@@ -1,2 +1,490 @@
 # UUID: e578f412-62e3-4480-b283-089efa333942
+# utils/quantum_simulation_tools.py
 
+"""
+State-vector simulation of quantum circuits with NumPy, for running the
+project's quantum workloads offline.
+
+The state of n qubits is a single preallocated array of 2**n amplitudes, with
+qubit q as bit q of the basis index. Gates are applied in place on reshaped
+views of that array, one bounded block at a time through a small scratch
+buffer, so no gate allocates a state-sized temporary. 25 qubits in complex64
+take 256 MiB. Runs of single-qubit gates on a qubit are fused into one 2x2
+matrix before a circuit runs, and measurement shots are sampled as a batch in
+one pass over the state.
+"""
+
+import cmath
+import hashlib
+import math
+from time import perf_counter
+import numpy as np
+
+IDENTITY = np.eye(2, dtype=np.complex128)
+PAULI_X = np.array([[0, 1], [1, 0]], dtype=np.complex128)
+PAULI_Y = np.array([[0, -1j], [1j, 0]], dtype=np.complex128)
+PAULI_Z = np.array([[1, 0], [0, -1]], dtype=np.complex128)
+HADAMARD = np.array([[1, 1], [1, -1]], dtype=np.complex128) / math.sqrt(2)
+S_GATE = np.array([[1, 0], [0, 1j]], dtype=np.complex128)
+T_GATE = np.array([[1, 0], [0, cmath.exp(1j * math.pi / 4)]], dtype=np.complex128)
+
+def rx(theta):
+    c, s = math.cos(theta / 2), math.sin(theta / 2)
+    return np.array([[c, -1j * s], [-1j * s, c]], dtype=np.complex128)
+
+def ry(theta):
+    c, s = math.cos(theta / 2), math.sin(theta / 2)
+    return np.array([[c, -s], [s, c]], dtype=np.complex128)
+
+def rz(theta):
+    return np.array([[cmath.exp(-0.5j * theta), 0], [0, cmath.exp(0.5j * theta)]], dtype=np.complex128)
+
+def phase(theta):
+    return np.array([[1, 0], [0, cmath.exp(1j * theta)]], dtype=np.complex128)
+
+class SimulationError(Exception):
+    """Raised for circuits or registers the simulator cannot run."""
+    pass
+
+class QuantumCircuit:
+    """
+    Gate list on a fixed number of qubits. Each operation is (kind, qubits,
+    matrix) with kind "single", "controlled" (matrix applied to the target
+    when the control is 1; qubits are (control, target)) or "swap". Gate
+    methods return the circuit so calls can be chained.
+    """
+
+    def __init__(self, num_qubits):
+        if num_qubits < 1:
+            raise SimulationError("A circuit needs at least one qubit.")
+        self.num_qubits = num_qubits
+        self.operations = []
+
+    def __len__(self):
+        return len(self.operations)
+
+    def _check_qubits(self, *qubits):
+        for qubit in qubits:
+            if not 0 <= qubit < self.num_qubits:
+                raise SimulationError(f"Qubit {qubit} is outside the {self.num_qubits}-qubit register.")
+        if len(set(qubits)) != len(qubits):
+            raise SimulationError("A gate cannot act on the same qubit twice.")
+
+    @staticmethod
+    def _matrix(matrix):
+        matrix = np.asarray(matrix, dtype=np.complex128)
+        if matrix.shape != (2, 2):
+            raise SimulationError("Gates must be given as 2x2 matrices.")
+        return matrix
+
+    def gate(self, matrix, qubit):
+        self._check_qubits(qubit)
+        self.operations.append(("single", (qubit,), self._matrix(matrix)))
+        return self
+
+    def controlled(self, matrix, control, target):
+        self._check_qubits(control, target)
+        self.operations.append(("controlled", (control, target), self._matrix(matrix)))
+        return self
+
+    def h(self, qubit):
+        return self.gate(HADAMARD, qubit)
+
+    def x(self, qubit):
+        return self.gate(PAULI_X, qubit)
+
+    def y(self, qubit):
+        return self.gate(PAULI_Y, qubit)
+
+    def z(self, qubit):
+        return self.gate(PAULI_Z, qubit)
+
+    def s(self, qubit):
+        return self.gate(S_GATE, qubit)
+
+    def t(self, qubit):
+        return self.gate(T_GATE, qubit)
+
+    def rx(self, theta, qubit):
+        return self.gate(rx(theta), qubit)
+
+    def ry(self, theta, qubit):
+        return self.gate(ry(theta), qubit)
+
+    def rz(self, theta, qubit):
+        return self.gate(rz(theta), qubit)
+
+    def p(self, theta, qubit):
+        return self.gate(phase(theta), qubit)
+
+    def cx(self, control, target):
+        return self.controlled(PAULI_X, control, target)
+
+    def cz(self, control, target):
+        return self.controlled(PAULI_Z, control, target)
+
+    def cp(self, theta, control, target):
+        return self.controlled(phase(theta), control, target)
+
+    def swap(self, first, second):
+        self._check_qubits(first, second)
+        self.operations.append(("swap", (first, second), None))
+        return self
+
+    def digest(self):
+        """
+        Returns a SHA-256 hex digest of the register size and the exact gate
+        list, so identical circuits can be recognised.
+        """
+        digest = hashlib.sha256(self.num_qubits.to_bytes(4, "big"))
+        for kind, qubits, matrix in self.operations:
+            digest.update(kind.encode() + b"".join(qubit.to_bytes(4, "big") for qubit in qubits))
+            if matrix is not None:
+                digest.update(np.ascontiguousarray(matrix, dtype=np.complex128).tobytes())
+        return digest.hexdigest()
+
+    def fused(self):
+        """
+        Returns the operations with every run of single-qubit gates on a
+        qubit multiplied into one gate. A run only ends at the next
+        multi-qubit gate on that qubit, since gates on other qubits commute
+        with it. Runs that multiply to the identity are dropped.
+        """
+        pending = {}
+        operations = []
+
+        def flush(qubit):
+            matrix = pending.pop(qubit)
+            if not np.allclose(matrix, IDENTITY):
+                operations.append(("single", (qubit,), matrix))
+
+        for kind, qubits, matrix in self.operations:
+            if kind == "single":
+                qubit = qubits[0]
+                pending[qubit] = matrix @ pending[qubit] if qubit in pending else matrix
+                continue
+            for qubit in qubits:
+                if qubit in pending:
+                    flush(qubit)
+            operations.append((kind, qubits, matrix))
+        for qubit in list(pending):
+            flush(qubit)
+        return operations
+
+class StateVectorSimulator:
+    """
+    Simulates up to num_qubits qubits in one preallocated state vector.
+
+    Gates work through blocks of at most block_size amplitudes; the scratch
+    buffer holds two such blocks. dtype complex64 halves the memory of the
+    default complex128 at single precision.
+    """
+
+    def __init__(self, num_qubits, dtype=np.complex128, block_size=1 << 16):
+        if num_qubits < 1:
+            raise SimulationError("A register needs at least one qubit.")
+        self.num_qubits = num_qubits
+        self.state = np.zeros(1 << num_qubits, dtype=dtype)
+        self.block_size = min(block_size, len(self.state))
+        self._scratch = np.empty((2, self.block_size), dtype=dtype)
+        self._weights = np.empty(self.block_size, dtype=self.state.real.dtype)
+        self.gates_applied = 0
+        self.reset()
+
+    def reset(self, basis_state=0):
+        """
+        Puts the register in the given computational basis state.
+        """
+        self.state.fill(0)
+        self.state[basis_state] = 1
+
+    def _split(self, *qubits):
+        """
+        Views the state with a length-2 axis for each given qubit, highest
+        qubit first, and one axis for each run of other qubits around them.
+        The axis of the i-th highest qubit is 2 * i + 1.
+        """
+        shape = []
+        previous = self.num_qubits
+        for qubit in sorted(qubits, reverse=True):
+            shape += [1 << (previous - qubit - 1), 2]
+            previous = qubit
+        shape.append(1 << previous)
+        return self.state.reshape(shape)
+
+    def _select(self, view, bits):
+        """
+        Indexes view (from _split) at the given {qubit: bit} values.
+        """
+        order = sorted(bits, reverse=True)
+        index = [slice(None)] * view.ndim
+        for position, qubit in enumerate(order):
+            index[2 * position + 1] = bits[qubit]
+        return view[tuple(index)]
+
+    def _blocks(self, shape):
+        """
+        Yields indexes splitting an array of the given shape into blocks of
+        at most block_size elements, each a basic-indexing view.
+        """
+        split = len(shape)
+        size = 1
+        while split > 0 and size * shape[split - 1] <= self.block_size:
+            split -= 1
+            size *= shape[split]
+        if split == 0:
+            yield ()
+            return
+        rows = self.block_size // size
+        for prefix in np.ndindex(*shape[:split - 1]):
+            for start in range(0, shape[split - 1], rows):
+                yield prefix + (slice(start, start + rows),)
+
+    def _scratch_like(self, row, block):
+        return self._scratch[row, :block.size].reshape(block.shape)
+
+    def _apply_to_pair(self, zero, one, matrix):
+        """
+        Applies a 2x2 matrix in place to the amplitude pairs (zero, one).
+        """
+        # Python scalars keep single-precision states in single precision
+        (m00, m01), (m10, m11) = [[complex(value) for value in row] for row in matrix]
+        if m01 == 0 and m10 == 0:
+            if m00 != 1:
+                np.multiply(zero, m00, out=zero)
+            if m11 != 1:
+                np.multiply(one, m11, out=one)
+            return
+        if m00 == 0 and m11 == 0 and m01 == 1 and m10 == 1:
+            self._swap_pair(zero, one)
+            return
+        for index in self._blocks(zero.shape):
+            b0, b1 = zero[index], one[index]
+            t0, t1 = self._scratch_like(0, b0), self._scratch_like(1, b0)
+            np.multiply(b0, m10, out=t0)
+            np.multiply(b1, m11, out=t1)
+            t0 += t1
+            np.multiply(b0, m00, out=b0)
+            np.multiply(b1, m01, out=t1)
+            b0 += t1
+            b1[...] = t0
+
+    def _swap_pair(self, first, second):
+        for index in self._blocks(first.shape):
+            b0, b1 = first[index], second[index]
+            t0 = self._scratch_like(0, b0)
+            t0[...] = b0
+            b0[...] = b1
+            b1[...] = t0
+
+    def apply_gate(self, matrix, qubit):
+        view = self._split(qubit)
+        self._apply_to_pair(view[:, 0, :], view[:, 1, :], matrix)
+
+    def apply_controlled(self, matrix, control, target):
+        view = self._split(control, target)
+        self._apply_to_pair(self._select(view, {control: 1, target: 0}),
+                            self._select(view, {control: 1, target: 1}), matrix)
+
+    def apply_swap(self, first, second):
+        view = self._split(first, second)
+        self._swap_pair(self._select(view, {first: 0, second: 1}),
+                        self._select(view, {first: 1, second: 0}))
+
+    def run(self, circuit, fuse=True, reset=True):
+        """
+        Applies a circuit, from |0...0> unless reset is False. Returns the
+        simulator so results can be read off it.
+        """
+        if circuit.num_qubits > self.num_qubits:
+            raise SimulationError(f"The circuit needs {circuit.num_qubits} qubits, "
+                                  f"the register has {self.num_qubits}.")
+        if reset:
+            self.reset()
+        operations = circuit.fused() if fuse else circuit.operations
+        for kind, qubits, matrix in operations:
+            if kind == "single":
+                self.apply_gate(matrix, qubits[0])
+            elif kind == "controlled":
+                self.apply_controlled(matrix, *qubits)
+            else:
+                self.apply_swap(*qubits)
+        self.gates_applied += len(operations)
+        return self
+
+    def probabilities(self):
+        """
+        Returns the probability of every basis state (a new array).
+        """
+        return np.abs(self.state) ** 2
+
+    def _block_weights(self, start):
+        amplitudes = self.state[start:start + self.block_size]
+        weights = self._weights[:len(amplitudes)]
+        np.abs(amplitudes, out=weights)
+        np.square(weights, out=weights)
+        return weights
+
+    def sample(self, shots, qubits=None, seed=None):
+        """
+        Measures the register shots times without collapsing it and returns
+        the outcomes as integers. With qubits given, outcome bit i is the
+        value of qubits[i]; otherwise the outcomes are basis state indexes.
+
+        All shots are drawn together: one pass totals the probability of each
+        block of the state, and only blocks that received draws are scanned
+        again to place them.
+        """
+        rng = np.random.default_rng(seed)
+        starts = range(0, len(self.state), self.block_size)
+        bounds = np.cumsum([self._block_weights(start).sum() for start in starts])
+        draws = np.sort(rng.random(shots)) * bounds[-1]
+        owners = np.minimum(np.searchsorted(bounds, draws, side="right"), len(bounds) - 1)
+        outcomes = np.empty(shots, dtype=np.int64)
+        blocks, first = np.unique(owners, return_index=True)
+        # Draws are sorted, so the draws of each block are a contiguous run
+        for block, low, high in zip(blocks, first, list(first[1:]) + [shots]):
+            weights = self._block_weights(starts[block])
+            np.cumsum(weights, out=weights)
+            offset = bounds[block - 1] if block else 0.0
+            positions = np.searchsorted(weights, draws[low:high] - offset, side="right")
+            outcomes[low:high] = starts[block] + np.minimum(positions, len(weights) - 1)
+        rng.shuffle(outcomes)
+        if qubits is not None:
+            selected = np.zeros(shots, dtype=np.int64)
+            for bit, qubit in enumerate(qubits):
+                selected |= ((outcomes >> qubit) & 1) << bit
+            outcomes = selected
+        return outcomes
+
+    def counts(self, shots, qubits=None, seed=None):
+        """
+        Returns {bitstring: count} for shots measurements. Bitstrings list the
+        highest qubit first, so qubit 0 (or qubits[0]) is the last character.
+        """
+        width = self.num_qubits if qubits is None else len(qubits)
+        values, frequencies = np.unique(self.sample(shots, qubits, seed), return_counts=True)
+        return {format(int(value), f"0{width}b"): int(count) for value, count in zip(values, frequencies)}
+
+PAULIS = (PAULI_X, PAULI_Y, PAULI_Z)
+
+class SimulatorBackend:
+    """
+    Local backend running circuits on StateVectorSimulator, optionally with
+    noise. With gate_error, every gate is followed on each qubit it acts on
+    by a uniformly random Pauli with that probability; such circuits run
+    unfused as trajectories independent noise realisations sharing the
+    shots. readout_error is the probability of flipping a measured bit, or a
+    (p(1|0), p(0|1)) pair. One register per width is allocated and reused by
+    every run.
+    """
+
+    def __init__(self, gate_error=0.0, readout_error=0.0, trajectories=32, dtype=np.complex128, seed=None):
+        self.gate_error = gate_error
+        if isinstance(readout_error, (int, float)):
+            readout_error = (readout_error, readout_error)
+        self.readout_error = tuple(readout_error)
+        self.trajectories = trajectories
+        self.dtype = dtype
+        self.rng = np.random.default_rng(seed)
+        self.circuits_run = 0
+        self._simulators = {}  # width -> StateVectorSimulator
+
+    def _simulator(self, num_qubits):
+        if num_qubits not in self._simulators:
+            self._simulators[num_qubits] = StateVectorSimulator(num_qubits, dtype=self.dtype)
+        return self._simulators[num_qubits]
+
+    def _run_noisy(self, simulator, circuit):
+        simulator.reset()
+        draws = iter(self.rng.random(sum(len(qubits) for _, qubits, _ in circuit.operations)))
+        for kind, qubits, matrix in circuit.operations:
+            if kind == "single":
+                simulator.apply_gate(matrix, qubits[0])
+            elif kind == "controlled":
+                simulator.apply_controlled(matrix, *qubits)
+            else:
+                simulator.apply_swap(*qubits)
+            for qubit in qubits:
+                if next(draws) < self.gate_error:
+                    simulator.apply_gate(PAULIS[self.rng.integers(3)], qubit)
+        simulator.gates_applied += len(circuit.operations)
+
+    def sample(self, circuit, shots=1024):
+        """
+        Runs a circuit and returns the measured basis states of all its qubits.
+        """
+        simulator = self._simulator(circuit.num_qubits)
+        if self.gate_error:
+            batches = np.array_split(np.arange(shots), min(self.trajectories, shots))
+            outcomes = np.empty(shots, dtype=np.int64)
+            for batch in batches:
+                self._run_noisy(simulator, circuit)
+                outcomes[batch] = simulator.sample(len(batch), seed=self.rng)
+        else:
+            outcomes = simulator.run(circuit).sample(shots, seed=self.rng)
+        if any(self.readout_error):
+            flip_up, flip_down = self.readout_error
+            draws = self.rng.random((circuit.num_qubits, shots))
+            for qubit in range(circuit.num_qubits):
+                bits = (outcomes >> qubit) & 1
+                flips = np.where(bits == 1, draws[qubit] < flip_down, draws[qubit] < flip_up)
+                outcomes ^= flips.astype(np.int64) << qubit
+        self.circuits_run += 1
+        return outcomes
+
+    def histograms(self, circuits, shots=1024):
+        """
+        Runs a batch of circuits of the same width and returns a
+        (circuits, 2**qubits) array of outcome counts.
+        """
+        circuits = list(circuits)
+        width = {circuit.num_qubits for circuit in circuits}
+        if len(width) != 1:
+            raise SimulationError("A histogram batch needs circuits of one width.")
+        size = 1 << width.pop()
+        return np.stack([np.bincount(self.sample(circuit, shots), minlength=size) for circuit in circuits])
+
+    def run(self, circuit, shots=1024):
+        """
+        Returns {bitstring: count} for a circuit, highest qubit first.
+        """
+        values, frequencies = np.unique(self.sample(circuit, shots), return_counts=True)
+        return {format(int(value), f"0{circuit.num_qubits}b"): int(count)
+                for value, count in zip(values, frequencies)}
+
+def random_layers(num_qubits, layers, seed=0):
+    """
+    Builds a benchmark circuit: per layer, Z-Y-Z rotations on every qubit
+    followed by a chain of CNOTs.
+    """
+    rng = np.random.default_rng(seed)
+    circuit = QuantumCircuit(num_qubits)
+    for _ in range(layers):
+        for qubit in range(num_qubits):
+            alpha, beta, gamma = rng.uniform(0, 2 * math.pi, 3)
+            circuit.rz(alpha, qubit).ry(beta, qubit).rz(gamma, qubit)
+        for qubit in range(num_qubits - 1):
+            circuit.cx(qubit, qubit + 1)
+    return circuit
+
+def benchmark_gates(qubit_counts=(10, 15, 20, 25), layers=2, dtype=np.complex64, fuse=True):
+    """
+    Runs random_layers circuits at each register size and returns a list of
+    (qubits, circuit gates, applied gates, gates per second), counting the
+    circuit's gates before fusion.
+    """
+    results = []
+    for num_qubits in qubit_counts:
+        circuit = random_layers(num_qubits, layers)
+        simulator = StateVectorSimulator(num_qubits, dtype=dtype)
+        started = perf_counter()
+        simulator.run(circuit, fuse=fuse)
+        elapsed = perf_counter() - started
+        results.append((num_qubits, len(circuit), simulator.gates_applied, len(circuit) / elapsed))
+        del simulator
+    return results
+
+if __name__ == "__main__":
+    for num_qubits, gates, applied, rate in benchmark_gates():
+        print(f"{num_qubits:>3} qubits: {gates} gates ({applied} after fusion), {rate:,.0f} gates/sec")